@@ -1,16 +1,18 @@
 """Flask API服务器 - 提供RESTful API接口"""
 
 try:
-    from flask import Flask, request, jsonify, send_file, send_from_directory
+    from flask import Flask, Response, request, jsonify, send_file, send_from_directory, stream_with_context
 except ImportError:
     import subprocess
     import sys
     subprocess.check_call([sys.executable, "-m", "pip", "install", "flask"])
-    from flask import Flask, request, jsonify, send_file, send_from_directory
+    from flask import Flask, Response, request, jsonify, send_file, send_from_directory, stream_with_context
 from flask_cors import CORS
 import os
 import threading
+from contextlib import nullcontext
 from pathlib import Path
+from urllib.parse import urlparse
 
 from utils import (
     setup_logger,
@@ -20,6 +22,14 @@ from utils import (
     TaskManager,
     TaskStatus
 )
+from utils.bandwidth import load_bandwidth_config
+from utils.concurrency import load_concurrency_config
+from utils.history_search import load_history_search
+from utils.history_writer import load_history_writer
+from utils.http_session import mount_shared_adapter
+from utils.media_dedup import dedupe_media_urls, load_download_index
+from utils.progress_events import ProgressBroadcaster
+from utils.versioning import load_history_versions
 
 
 class APIServer:
@@ -43,10 +53,23 @@ class APIServer:
         
         # 初始化组件
         self.logger = setup_logger()
+        self.limiter = load_bandwidth_config()
+        self.download_index = load_download_index(logger=self.logger)
         self.db = DatabaseManager(logger=self.logger)
-        self.task_manager = TaskManager(max_workers=5, logger=self.logger)
+        # 写操作交给单个写入线程合并提交，self.db只用于查询
+        self.db_writer = load_history_writer(self.db, logger=self.logger)
+        self.history_versions = load_history_versions(logger=self.logger)
+        self.history_search = load_history_search(logger=self.logger)
+        # 工作线程按并发上限创建，实际同时下载的任务数由并发控制器按吞吐量调整
+        self.concurrency = load_concurrency_config(logger=self.logger)
+        self.task_manager = TaskManager(max_workers=self.concurrency.max_limit, logger=self.logger)
         self.resource_detector = ResourceDetector(logger=self.logger)
         self.resource_downloader = ResourceDownloader(logger=self.logger)
+        # 下载器的会话挂载限速适配器；无法挂载时按进度回调计量和限速
+        self.downloader_limited = mount_shared_adapter(getattr(self.resource_downloader, 'session', None))
+        self.progress = ProgressBroadcaster()
+        # 已交给工作线程、但还在等待并发名额的任务
+        self._waiting_tasks = set()
         
         # 设置任务回调
         self.task_manager.on_task_complete = self._on_task_complete
@@ -106,7 +129,8 @@ class APIServer:
                 task_id = self.task_manager.add_task(url, resource_type, output_path)
                 
                 # 记录到数据库
-                self.db.add_download_record(task_id, url, resource_type, output_path)
+                self.db_writer.add_download_record(task_id, url, resource_type, output_path)
+                self._publish_task(task_id)
                 
                 return jsonify({
                     'success': True,
@@ -128,16 +152,26 @@ class APIServer:
                 return jsonify({'error': '缺少URLs参数'}), 400
             
             try:
-                task_ids = self.task_manager.add_batch_tasks(urls, resource_type)
+                # 同一媒体只创建一个任务，以前已下载过的媒体直接跳过
+                urls = dedupe_media_urls(urls)
+                skipped = []
+                if self.download_index:
+                    urls, skipped = self.download_index.filter_new(urls)
+                
+                task_ids = self.task_manager.add_batch_tasks(urls, resource_type) if urls else []
                 
                 # 记录到数据库
-                for task_id, url in zip(task_ids, urls):
-                    self.db.add_download_record(task_id, url, resource_type)
+                self.db_writer.add_download_records(
+                    [(task_id, url, resource_type) for task_id, url in zip(task_ids, urls)]
+                )
+                for task_id in task_ids:
+                    self._publish_task(task_id)
                 
                 return jsonify({
                     'success': True,
                     'task_ids': task_ids,
-                    'count': len(task_ids)
+                    'count': len(task_ids),
+                    'skipped': skipped
                 })
             
             except Exception as e:
@@ -146,17 +180,55 @@ class APIServer:
         
         @self.app.route('/api/tasks', methods=['GET'])
         def get_tasks():
-            """获取所有任务"""
+            """获取任务列表（带since或limit参数时只返回该版本之后变化的任务）"""
             try:
-                tasks = self.task_manager.get_all_tasks()
+                versions = self.progress.versions
+                if 'since' not in request.args and 'limit' not in request.args:
+                    tasks = self.task_manager.get_all_tasks()
+                    return jsonify({
+                        'success': True,
+                        'tasks': [self._task_dict(task) for task in tasks],
+                        'version': versions.version
+                    })
+                
+                try:
+                    since = self._int_arg('since', 0)
+                    limit = self._int_arg('limit', 100, minimum=1)
+                except ValueError as e:
+                    return jsonify({'error': str(e)}), 400
+                
+                changes = versions.changed_since(since, limit + 1)
+                tasks = []
+                for version, task_id in changes[:limit]:
+                    task = self.task_manager.get_task(task_id)
+                    if task:
+                        tasks.append(dict(self._task_dict(task), version=version))
+                    else:
+                        # 已不存在的任务以墓碑的形式返回
+                        tasks.append({'id': task_id, 'version': version, 'removed': True})
+                
                 return jsonify({
                     'success': True,
-                    'tasks': [task.to_dict() for task in tasks]
+                    'tasks': tasks,
+                    'version': versions.version,
+                    'next_since': changes[:limit][-1][0] if changes else since,
+                    'has_more': len(changes) > limit
                 })
             
             except Exception as e:
                 return jsonify({'error': str(e)}), 500
         
+        @self.app.route('/api/tasks/events', methods=['GET'])
+        def task_events():
+            """推送任务进度（Server-Sent Events），task_id参数可指定逗号分隔的任务ID"""
+            task_ids = [t for t in request.args.get('task_id', '').split(',') if t]
+            return self._event_stream(task_ids or None)
+        
+        @self.app.route('/api/tasks/<task_id>/events', methods=['GET'])
+        def single_task_events(task_id):
+            """推送单个任务的进度（Server-Sent Events）"""
+            return self._event_stream([task_id])
+        
         @self.app.route('/api/tasks/<task_id>', methods=['GET'])
         def get_task(task_id):
             """获取单个任务"""
@@ -165,7 +237,7 @@ class APIServer:
                 if task:
                     return jsonify({
                         'success': True,
-                        'task': task.to_dict()
+                        'task': self._task_dict(task)
                     })
                 else:
                     return jsonify({'error': '任务不存在'}), 404
@@ -178,6 +250,7 @@ class APIServer:
             """暂停任务"""
             try:
                 self.task_manager.pause_task(task_id)
+                self._publish_task(task_id)
                 return jsonify({'success': True})
             except Exception as e:
                 return jsonify({'error': str(e)}), 500
@@ -187,6 +260,7 @@ class APIServer:
             """恢复任务"""
             try:
                 self.task_manager.resume_task(task_id)
+                self._publish_task(task_id)
                 return jsonify({'success': True})
             except Exception as e:
                 return jsonify({'error': str(e)}), 500
@@ -196,7 +270,8 @@ class APIServer:
             """取消任务"""
             try:
                 self.task_manager.cancel_task(task_id)
-                self.db.update_download_status(task_id, 'cancelled')
+                self.db_writer.update_download_status(task_id, 'cancelled')
+                self._publish_task(task_id)
                 return jsonify({'success': True})
             except Exception as e:
                 return jsonify({'error': str(e)}), 500
@@ -206,6 +281,7 @@ class APIServer:
             """重试任务"""
             try:
                 self.task_manager.retry_task(task_id)
+                self._publish_task(task_id)
                 return jsonify({'success': True})
             except Exception as e:
                 return jsonify({'error': str(e)}), 500
@@ -215,6 +291,7 @@ class APIServer:
             """获取任务统计"""
             try:
                 stats = self.task_manager.get_statistics()
+                stats['concurrency'] = self.concurrency.snapshot()
                 return jsonify({
                     'success': True,
                     'statistics': stats
@@ -222,16 +299,49 @@ class APIServer:
             except Exception as e:
                 return jsonify({'error': str(e)}), 500
         
+        @self.app.route('/api/limits', methods=['GET'])
+        def get_limits():
+            """获取带宽与主机连接限制的实时统计"""
+            return jsonify({
+                'success': True,
+                'limits': self.limiter.snapshot()
+            })
+        
         # ===== 下载历史 =====
         @self.app.route('/api/history', methods=['GET'])
         def get_history():
             """获取下载历史"""
             try:
-                limit = int(request.args.get('limit', 100))
-                offset = int(request.args.get('offset', 0))
+                try:
+                    limit = self._int_arg('limit', 100, minimum=1)
+                    offset = self._int_arg('offset', 0)
+                    since = self._int_arg('since', 0)
+                    cursor = self._int_arg('cursor', None)
+                except ValueError as e:
+                    return jsonify({'error': str(e)}), 400
                 status = request.args.get('status')
                 resource_type = request.args.get('resource_type')
                 
+                # 增量查询与游标分页走版本索引，不随历史增长变慢；
+                # 增量查询中已删除或不再符合过滤条件的记录带有removed标记
+                if self.history_versions and 'since' in request.args:
+                    records = self.history_versions.changed_since(since, limit, status, resource_type)
+                    return jsonify({
+                        'success': True,
+                        'records': records,
+                        'count': len(records),
+                        'version': self.history_versions.current_version(),
+                        'next_since': records[-1]['version'] if records else since
+                    })
+                if self.history_versions and 'cursor' in request.args:
+                    records, next_cursor = self.history_versions.page(cursor, limit, status, resource_type)
+                    return jsonify({
+                        'success': True,
+                        'records': records,
+                        'count': len(records),
+                        'next_cursor': next_cursor
+                    })
+                
                 records = self.db.get_download_history(limit, offset, status, resource_type)
                 
                 return jsonify({
@@ -250,7 +360,10 @@ class APIServer:
                 keyword = request.args.get('keyword', '')
                 limit = int(request.args.get('limit', 50))
                 
-                records = self.db.search_downloads(keyword, limit)
+                # 优先使用全文索引；中日韩文字不分词，索引查不到时退回子串搜索
+                records = self.history_search.search(keyword, limit) if self.history_search else None
+                if not records and (records is None or not keyword.isascii()):
+                    records = self.db.search_downloads(keyword, limit)
                 
                 return jsonify({
                     'success': True,
@@ -302,39 +415,122 @@ class APIServer:
                 }
             })
     
+    def _event_stream(self, task_ids=None):
+        """创建进度推送响应"""
+        subscription = self.progress.subscribe(task_ids)
+        return Response(
+            stream_with_context(self.progress.stream(subscription)),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+    
+    def _publish_task(self, task_id):
+        """推送任务的完整状态（没有订阅者时只更新版本号，不做序列化）"""
+        if not self.progress.subscriber_count():
+            self.progress.versions.touch(task_id)
+            return
+        task = self.task_manager.get_task(task_id)
+        if task:
+            self.progress.publish(task_id, self._task_dict(task))
+    
+    @staticmethod
+    def _int_arg(name, default, minimum=0):
+        """
+        读取整数查询参数
+        
+        Raises:
+            ValueError: 参数不是整数或小于minimum（调用方返回400）
+        """
+        value = request.args.get(name, '')
+        if value == '':
+            return default
+        try:
+            number = int(value)
+        except ValueError:
+            raise ValueError(f"参数{name}必须是整数: {value}")
+        if number < minimum:
+            raise ValueError(f"参数{name}不能小于{minimum}: {value}")
+        return number
+    
+    def _task_dict(self, task):
+        """任务的字典表示，还在等待并发名额的任务状态显示为waiting"""
+        data = task.to_dict()
+        if task.id in self._waiting_tasks:
+            data['status'] = 'waiting'
+        return data
+    
+    def _transfer_reporter(self, url, outcome, callback):
+        """
+        包装进度回调，按已下载字节数的增量随时计入并发控制器的吞吐量
+        
+        下载器未经过限速适配器时，同时计入带宽统计并限速。回调参数为
+        (downloaded, total) 时才能计量。
+        """
+        host = urlparse(url).hostname
+        last = [0]
+        
+        def report(*args, **kwargs):
+            if len(args) >= 2 and isinstance(args[0], int):
+                delta, last[0] = args[0] - last[0], args[0]
+                if delta > 0:
+                    self.concurrency.transferred(outcome, delta)
+                    if not self.downloader_limited:
+                        self.limiter.throttle(delta, host)
+            callback(*args, **kwargs)
+        return report
+    
     def _download_task(self, task_id, url, output_path, progress_callback):
-        """执行下载任务"""
+        """执行下载任务（占用并发控制器的一个名额，等待名额期间状态为waiting）"""
+        self._waiting_tasks.add(task_id)
+        self.progress.publish(task_id, {'status': 'waiting'})
+        try:
+            with self.concurrency.slot() as outcome:
+                self._waiting_tasks.discard(task_id)
+                return self._run_download(task_id, url, output_path, progress_callback, outcome)
+        finally:
+            self._waiting_tasks.discard(task_id)
+    
+    def _run_download(self, task_id, url, output_path, progress_callback, outcome):
+        """在已占用并发名额的情况下执行下载"""
         try:
             # 更新数据库状态
-            self.db.update_download_status(task_id, 'running')
+            self.db_writer.update_download_status(task_id, 'running')
+            self.progress.publish(task_id, {'status': 'running'})
             
-            # 执行下载
-            result = self.resource_downloader.download_resource(
-                url, 
-                output_path,
-                progress_callback
+            # 执行下载，进度同时推送给订阅者
+            callback = self._transfer_reporter(
+                url, outcome, self.progress.progress_reporter(task_id, progress_callback)
             )
+            slot = nullcontext() if self.downloader_limited else self.limiter.slot(url)
+            with slot:
+                result = self.resource_downloader.download_resource(url, output_path, callback)
             
             if result:
                 # 获取文件大小
                 file_size = os.path.getsize(result) if os.path.exists(result) else 0
-                self.db.update_download_status(task_id, 'completed', file_size=file_size)
+                self.db_writer.update_download_status(task_id, 'completed', file_size=file_size)
+                if self.download_index:
+                    self.download_index.add(url, result)
+                outcome['success'] = True
+                outcome['bytes'] = file_size
                 return True
             else:
-                self.db.update_download_status(task_id, 'failed', error_message='下载失败')
+                self.db_writer.update_download_status(task_id, 'failed', error_message='下载失败')
                 return False
         
         except Exception as e:
-            self.db.update_download_status(task_id, 'failed', error_message=str(e))
+            self.db_writer.update_download_status(task_id, 'failed', error_message=str(e))
             return False
     
     def _on_task_complete(self, task):
         """任务完成回调"""
         self.logger.info(f"任务完成: {task.id}")
+        self.progress.publish(task.id, self._task_dict(task))
     
     def _on_task_failed(self, task):
         """任务失败回调"""
         self.logger.error(f"任务失败: {task.id} - {task.error_message}")
+        self.progress.publish(task.id, self._task_dict(task))
     
     def run(self):
         """启动服务器"""
@@ -344,6 +540,7 @@ class APIServer:
     def stop(self):
         """停止服务器"""
         self.task_manager.stop()
+        self.db_writer.close()
         self.logger.info("API服务器已停止")
 
 
@@ -355,9 +552,19 @@ def main():
     parser.add_argument('--host', default='0.0.0.0', help='主机地址')
     parser.add_argument('--port', type=int, default=5000, help='端口号')
     parser.add_argument('--debug', action='store_true', help='调试模式')
+    parser.add_argument('--rebuild-search-index', action='store_true', help='重建下载历史全文索引后退出')
     
     args = parser.parse_args()
     
+    if args.rebuild_search_index:
+        index = load_history_search()
+        if index is None:
+            print("全文索引不可用（SQLite不支持FTS5或数据库中没有下载历史）")
+            return
+        print(f"全文索引已重建: {index.rebuild()} 条记录")
+        index.close()
+        return
+    
     server = APIServer(host=args.host, port=args.port, debug=args.debug)
     
     try:
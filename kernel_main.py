@@ -1,22 +1,42 @@
 """视频爬虫工具 - 主程序（智能自动模式）"""
 
 import argparse
+import configparser
 import sys
 import os
 import requests
+from functools import partial
 from utils import (
     setup_logger,
     VideoParser,
     VideoDownloader,
-    NetworkCapture,
     MediaMerger,
     StreamDownloader,
     SmartDetector,
     EncryptedVideoHandler
 )
+from utils.segmented import SegmentedDownloader
+from utils.http_session import create_session, configure_session_factory, mount_shared_adapter
+from utils.bandwidth import BandwidthMonitor, format_bandwidth, load_bandwidth_config
+from utils.browser_pool import BrowserPool, PooledCapture, load_capture_idle_time
+from utils.request_classifier import RequestClassifier
+from utils.async_downloader import AsyncVideoDownloader
+from utils.hls import HLSPipelineDownloader
+from utils.dash import DashDownloader
+from utils.separate_streams import SeparateStreamDownloader
+from utils.stream_crypto import DECRYPT_METHODS, create_decryptor
+from utils.processed_index import process_directory_incremental
+from utils.early_download import EarlyDownloader
+from utils.capture_cache import CachedCapture, load_capture_cache_config
+from utils.url_probe import PageCache, URLProbe
+from utils.stream_parser import StreamingVideoParser
+from utils.quality import load_quality_preference, parse_quality
+from utils.variant_probe import VariantProber
+from utils.extractors import extract as extract_site, find_extractor
+from utils.media_dedup import canonical_media_key, dedupe_media_urls, load_download_index
 
 
-def get_html_content(url, proxy=None, logger=None):
+def get_html_content(url, proxy=None, logger=None, session=None, cache=None):
     """
     获取网页HTML内容
     
@@ -24,27 +44,15 @@ def get_html_content(url, proxy=None, logger=None):
         url: 目标URL
         proxy: 代理服务器地址
         logger: 日志记录器
+        session: 共享的requests会话，为None时从共享连接池创建
+        cache: 已获取内容缓存，同一页面在一次运行中只请求一次
     
     Returns:
         str: HTML内容，失败返回None
     """
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        
-        proxies = {'http': proxy, 'https': proxy} if proxy else None
-        
-        if logger:
-            logger.info(f"正在获取网页内容: {url}")
-        
-        response = requests.get(url, headers=headers, timeout=30, proxies=proxies)
-        response.raise_for_status()
-        
-        if logger:
-            logger.info(f"成功获取网页内容，大小: {len(response.text)} 字节")
-        
-        return response.text
+        cache = cache if cache is not None else PageCache()
+        return cache.fetch(url, session=session, proxy=proxy, logger=logger)
     
     except requests.exceptions.RequestException as e:
         if logger:
@@ -60,6 +68,111 @@ def get_html_content(url, proxy=None, logger=None):
         return None
 
 
+def download_hls_stream(m3u8_url, output_name, args, logger, session=None):
+    """
+    下载HLS流：优先使用并行预取流水线，失败时回退到StreamDownloader
+    
+    Args:
+        m3u8_url: M3U8播放列表URL
+        output_name: 输出文件名
+        args: 命令行参数
+        logger: 日志记录器
+        session: 共享的requests会话
+    
+    Returns:
+        str: 输出文件路径，失败返回None
+    """
+    if args.hls_prefetch > 0:
+        pipeline = HLSPipelineDownloader(
+            output_dir=args.output,
+            prefetch=args.hls_prefetch,
+            retries=args.retries,
+            session=session,
+            proxy=args.proxy,
+            logger=logger,
+            quality=args.quality
+        )
+        output_file = pipeline.download(m3u8_url, output_name)
+        if output_file:
+            return output_file
+        logger.warning("并行预取下载失败，回退到常规HLS下载")
+    
+    stream_downloader = StreamDownloader(output_dir=args.output, logger=logger)
+    mount_shared_adapter(getattr(stream_downloader, 'session', None))
+    return stream_downloader.download_hls(m3u8_url, output_name)
+
+
+def download_dash_stream(mpd_url, output_name, args, logger, session=None, merge=True):
+    """
+    下载DASH流（视频轨和音频轨并行下载后合并）
+    
+    Args:
+        mpd_url: MPD清单URL
+        output_name: 输出文件名
+        args: 命令行参数
+        logger: 日志记录器
+        session: 共享的requests会话
+        merge: 是否合并视频轨和音频轨
+    
+    Returns:
+        str: 输出文件路径，失败返回None
+    """
+    dash_downloader = DashDownloader(
+        output_dir=args.output,
+        prefetch=max(1, args.hls_prefetch),
+        retries=args.retries,
+        session=session,
+        proxy=args.proxy,
+        logger=logger,
+        quality=args.quality
+    )
+    return dash_downloader.download(mpd_url, output_name, merge=merge)
+
+
+def build_decryptor_factory(args):
+    """
+    根据命令行参数构建流式解密器工厂
+    
+    Args:
+        args: 命令行参数
+    
+    Returns:
+        callable: 每次调用返回一个新的解密器，未启用解密时返回None
+    
+    Raises:
+        ValueError: 密钥、IV或解密方式无效
+        ImportError: 缺少AES解密依赖
+    """
+    if not args.decrypt:
+        return None
+    if not args.decrypt_key:
+        raise ValueError("启用--decrypt时必须提供--decrypt-key")
+    
+    key = bytes.fromhex(args.decrypt_key)
+    iv = bytes.fromhex(args.decrypt_iv) if args.decrypt_iv else None
+    factory = partial(create_decryptor, args.decrypt, key, iv, args.decrypt_length or None)
+    
+    # 提前创建一次以校验参数
+    factory()
+    return factory
+
+
+def decrypt_unsupported(decryptor_factory, kind):
+    """
+    启用--decrypt时拒绝不经过解密器的下载方式
+    
+    解密只作用于直接下载的文件；HLS、DASH和分离音视频流的下载不会解密，
+    继续下载只会得到未解密的文件。
+    
+    Returns:
+        bool: 是否应跳过该下载
+    """
+    if decryptor_factory is None:
+        return False
+    print(f"❌ --decrypt 不支持{kind}，已跳过（解密只作用于直接下载的文件）")
+    return True
+
+
 def check_dependencies():
     """检查必要的依赖是否已安装"""
     missing_deps = []
@@ -101,11 +214,36 @@ def check_optional_dependencies():
     except ImportError:
         optional_deps['selenium'] = False
     
+    try:
+        import aiohttp
+        optional_deps['aiohttp'] = True
+    except ImportError:
+        optional_deps['aiohttp'] = False
+    
     return optional_deps
 
 
+def load_download_config(config_file='config.ini'):
+    """
+    读取配置文件中的[download]设置
+    
+    Args:
+        config_file: 配置文件路径
+    
+    Returns:
+        dict: 下载设置，文件或小节不存在时返回空字典
+    """
+    config = configparser.ConfigParser()
+    config.read(config_file, encoding='utf-8')
+    if config.has_section('download'):
+        return dict(config['download'])
+    return {}
+
+
 def parse_arguments():
     """解析命令行参数"""
+    download_config = load_download_config()
+    
     parser = argparse.ArgumentParser(
         description='视频爬虫工具 - 智能自动检测模式',
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -151,6 +289,19 @@ def parse_arguments():
         default=3,
         help='并发下载线程数 (默认: 3)'
     )
+    download_group.add_argument(
+        '--engine',
+        choices=['thread', 'async'],
+        default=download_config.get('engine', 'thread'),
+        help='下载引擎：thread为多线程，async为asyncio高并发 (默认: config.ini中的engine，否则thread)'
+    )
+    download_group.add_argument(
+        '--concurrency',
+        type=int,
+        # 字符串默认值同样经过type转换，配置值无效时给出参数错误而不是异常
+        default=download_config.get('concurrency') or '100',
+        help='async引擎同时进行的最大传输数 (默认: 100)'
+    )
     download_group.add_argument(
         '-r', '--retries',
         type=int,
@@ -166,6 +317,29 @@ def parse_arguments():
         action='store_true',
         help='启用断点续传'
     )
+    download_group.add_argument(
+        '-c', '--connections',
+        type=int,
+        default=1,
+        help='大文件分段下载的单文件连接数，1表示不分段 (默认: 1)'
+    )
+    download_group.add_argument(
+        '--segment-size',
+        type=int,
+        default=8,
+        help='分段下载的分块大小（MB） (默认: 8)'
+    )
+    download_group.add_argument(
+        '--segment-threshold',
+        type=int,
+        default=32,
+        help='文件大于该大小（MB）时启用分段下载 (默认: 32)'
+    )
+    download_group.add_argument(
+        '--limit-rate',
+        type=int,
+        help='全局下载带宽上限（KB/s），0表示不限制 (默认: config.ini中[limits]的max_bandwidth)'
+    )
     download_group.add_argument(
         '--no-verify',
         action='store_true',
@@ -184,22 +358,80 @@ def parse_arguments():
         action='store_true',
         help='强制使用HLS下载模式'
     )
+    advanced_group.add_argument(
+        '--hls-prefetch',
+        type=int,
+        default=download_config.get('hls_prefetch') or '8',
+        help='HLS分片并行预取窗口大小，0表示使用常规HLS下载 (默认: 8)'
+    )
+    advanced_group.add_argument(
+        '--quality',
+        help='画质偏好: best、worst 或目标高度如 1080p (默认: 读取config.ini，平台设置优先)'
+    )
     advanced_group.add_argument(
         '--no-merge',
         action='store_true',
         help='禁用自动音视频合并'
     )
+    advanced_group.add_argument(
+        '--no-stream-merge',
+        action='store_true',
+        help='禁用边下载边合并，先完整下载音视频再合并'
+    )
+    advanced_group.add_argument(
+        '--no-capture-cache',
+        action='store_true',
+        help='不使用抓包结果缓存，总是重新启动浏览器抓包'
+    )
+    advanced_group.add_argument(
+        '--no-dedup',
+        action='store_true',
+        help='不跳过以前运行中已下载过的媒体'
+    )
+    advanced_group.add_argument(
+        '--no-early-download',
+        action='store_true',
+        help='禁用抓包期间提前下载，等抓包和分析结束后再统一下载'
+    )
+    advanced_group.add_argument(
+        '--max-pairs',
+        type=int,
+        default=1,
+        help='页面包含多个条目时，并行下载并合并的音视频对数 (默认: 1)'
+    )
     advanced_group.add_argument(
         '--wait-time',
         type=int,
         default=10,
-        help='抓包模式页面加载等待时间（秒） (默认: 10)'
+        help='抓包模式最长等待时间（秒），网络空闲或发现视频后提前结束 (默认: 10)'
     )
     advanced_group.add_argument(
         '--keywords',
         help='搜索关键词（用逗号分隔多个关键词，例如: video,stream,play）'
     )
     
+    # 解密选项
+    decrypt_group = parser.add_argument_group('下载时解密')
+    decrypt_group.add_argument(
+        '--decrypt',
+        choices=DECRYPT_METHODS,
+        help='下载过程中逐块解密，文件落盘即为明文'
+    )
+    decrypt_group.add_argument(
+        '--decrypt-key',
+        help='解密密钥（十六进制）；webmask方式为掩码'
+    )
+    decrypt_group.add_argument(
+        '--decrypt-iv',
+        help='AES初始向量（十六进制，默认全0）'
+    )
+    decrypt_group.add_argument(
+        '--decrypt-length',
+        type=int,
+        default=0,
+        help='webmask覆盖的文件开头字节数，0表示整个文件 (默认: 0)'
+    )
+    
     # 其他选项
     other_group = parser.add_argument_group('其他选项')
     other_group.add_argument(
@@ -224,6 +456,15 @@ def main():
     # 解析命令行参数
     args = parse_arguments()
     
+    # 多线程引擎不经过解密器，会写出仍然加密的文件；下载时解密改用async引擎
+    if args.decrypt and args.engine != 'async':
+        if not optional_deps['aiohttp']:
+            print("❌ --decrypt 需要async下载引擎，但未安装aiohttp")
+            print("   提示: pip install aiohttp")
+            sys.exit(1)
+        print("ℹ️  --decrypt 只有async引擎支持，已改用 --engine async")
+        args.engine = 'async'
+    
     # 设置日志
     import logging
     log_level = getattr(logging, args.log_level)
@@ -236,7 +477,12 @@ def main():
     print(f"目标URL: {args.url}")
     print(f"保存目录: {args.output}")
     print(f"最大下载数: {args.max_downloads}")
-    print(f"并发线程数: {args.workers}")
+    if args.engine == 'async':
+        print(f"下载引擎: async (并发传输数: {args.concurrency})")
+    else:
+        print(f"并发线程数: {args.workers}")
+    if args.connections > 1:
+        print(f"分段连接数: {args.connections}")
     if args.proxy:
         print(f"代理服务器: {args.proxy}")
     print("=" * 70)
@@ -244,29 +490,81 @@ def main():
     
     logger.info("程序启动 - 智能自动检测模式")
     
+    try:
+        decryptor_factory = build_decryptor_factory(args)
+    except (ValueError, ImportError) as e:
+        print(f"❌ 解密参数无效: {e}")
+        sys.exit(1)
+    
+    # 画质偏好：命令行优先，其次是config.ini中的平台设置和[download] quality
+    try:
+        args.quality = parse_quality(args.quality) if args.quality else load_quality_preference(args.url)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    
+    # 整个运行过程共享同一个连接池会话，单主机连接池需容纳所有并发连接
+    configure_session_factory(pool_maxsize=max(10, args.workers * args.connections, args.hls_prefetch))
+    limiter = load_bandwidth_config(
+        max_rate=args.limit_rate * 1024 if args.limit_rate is not None else None
+    )
+    session = create_session(proxy=args.proxy)
+    download_index = None if args.no_dedup else load_download_index(logger=logger)
+    
+    # 限速时在下载过程中定期显示实时速度和各主机的连接占用
+    monitor = None
+    if limiter.is_limited():
+        def show_bandwidth(snapshot):
+            if snapshot['current_speed'] or any(host['active'] for host in snapshot['hosts'].values()):
+                print(f"📶 {format_bandwidth(snapshot)}")
+        monitor = BandwidthMonitor(limiter, show_bandwidth, interval=5.0).start()
+    
     try:
         # 创建智能检测器
         detector = SmartDetector(logger=logger)
         
-        # 初步检测URL类型
-        print("🔍 正在分析URL...")
-        url_type = detector.detect_url_type(args.url)
+        # 本次运行获取过的网页内容，检测、策略推荐和HTML解析共用
+        page_cache = PageCache()
+        probe = URLProbe(session=session, cache=page_cache, logger=logger)
+        
+        # 已知站点直接调用播放地址接口，不需要启动浏览器抓包
+        extraction = None
+        extractor_class = None if args.force_capture or args.force_hls else find_extractor(args.url)
+        if extractor_class:
+            print(f"⚡ 使用 {extractor_class.name} 站点解析器获取媒体地址...")
+            extraction = extract_site(args.url, quality=args.quality, proxy=args.proxy, logger=logger)
+            if extraction is None:
+                print("⚠️  站点解析失败，使用常规检测流程")
         
         # 获取推荐策略
         strategy = None
         html_content = None
         
-        # 如果是网页，先获取HTML内容进行更详细的分析
-        if url_type == 'webpage' and not args.force_hls and not args.force_capture:
-            print("📄 获取网页内容进行分析...")
-            html_content = get_html_content(args.url, args.proxy, logger)
-            if html_content:
-                strategy = detector.recommend_strategy(args.url, html_content)
-            else:
-                print("⚠️  无法获取网页内容，将尝试抓包模式")
-                strategy = {'method': 'capture_and_analyze', 'use_capture': True, 'use_merge': True}
+        if extraction:
+            url_type = extractor_class.name
+            strategy = {'method': 'site_extract', 'use_capture': False, 'use_merge': True}
         else:
-            strategy = detector.recommend_strategy(args.url)
+            # 初步检测URL类型：HEAD/Range请求只读响应头和开头几KB
+            print("🔍 正在分析URL...")
+            url_type = probe.detect_url_type(args.url)
+            if url_type == 'unknown':
+                url_type = detector.detect_url_type(args.url)
+            
+            # 如果是网页，先获取HTML内容进行更详细的分析（探测时已取回的网页不再请求）
+            if url_type == 'webpage' and not args.force_hls and not args.force_capture:
+                print("📄 获取网页内容进行分析...")
+                html_content = get_html_content(args.url, args.proxy, logger, session=session, cache=page_cache)
+                if html_content:
+                    strategy = detector.recommend_strategy(args.url, html_content)
+                else:
+                    print("⚠️  无法获取网页内容，将尝试抓包模式")
+                    strategy = {'method': 'capture_and_analyze', 'use_capture': True, 'use_merge': True}
+            else:
+                # 媒体文件和HLS/DASH清单按探测到的类型直接下载
+                if not args.force_capture:
+                    strategy = probe.recommend_strategy(args.url)
+                if strategy is None:
+                    strategy = detector.recommend_strategy(args.url)
         
         # 应用手动覆盖
         if args.force_capture:
@@ -295,13 +593,30 @@ def main():
         video_links = []
         captured_cookies = None
         captured_referer = None
+        early_downloader = None
         
         # 策略1: HLS流下载
         if strategy['method'] == 'hls_download':
             print("📺 HLS流下载模式")
             print("-" * 70)
-            stream_downloader = StreamDownloader(output_dir=args.output, logger=logger)
-            output_file = stream_downloader.download_hls(args.url, "video.mp4")
+            if decrypt_unsupported(decryptor_factory, "HLS流下载"):
+                sys.exit(1)
+            output_file = download_hls_stream(args.url, "video.mp4", args, logger, session=session)
+            
+            if output_file:
+                print(f"\n✅ 下载完成: {output_file}")
+            else:
+                print("\n❌ 下载失败")
+            return
+        
+        # DASH流下载
+        elif strategy['method'] == 'dash_download':
+            print("📺 DASH流下载模式")
+            print("-" * 70)
+            if decrypt_unsupported(decryptor_factory, "DASH流下载"):
+                sys.exit(1)
+            merge = not args.no_merge and MediaMerger(logger=logger).is_available()
+            output_file = download_dash_stream(args.url, "dash_video.mp4", args, logger, session=session, merge=merge)
             
             if output_file:
                 print(f"\n✅ 下载完成: {output_file}")
@@ -309,6 +624,54 @@ def main():
                 print("\n❌ 下载失败")
             return
         
+        # 站点解析：接口返回的地址直接下载
+        elif strategy['method'] == 'site_extract':
+            print(f"⚡ 站点解析模式: {extraction.title or args.url}")
+            print("-" * 70)
+            captured_cookies = extraction.cookies
+            captured_referer = extraction.referer
+            session = create_session(proxy=args.proxy, cookies=captured_cookies, referer=captured_referer)
+            merge = not args.no_merge and MediaMerger(logger=logger).is_available()
+            
+            output_files = []
+            pairs = extraction.pairs
+            if pairs and decrypt_unsupported(decryptor_factory, "分离音视频流下载"):
+                pairs = []
+            segments = extraction.segments
+            if segments and decrypt_unsupported(decryptor_factory, "分段视频拼接"):
+                segments = []
+            separate_downloader = SeparateStreamDownloader(
+                output_dir=args.output,
+                max_pairs=max(1, len(pairs)),
+                streaming=not args.no_stream_merge,
+                retries=args.retries,
+                session=session,
+                logger=logger
+            )
+            if pairs and merge:
+                output_files.extend(separate_downloader.download_pairs(pairs, "merged_video.mp4"))
+            else:
+                # 无法合并时分别下载视频轨和音频轨
+                for video_url, audio_url in pairs:
+                    video_links.extend([video_url, audio_url])
+            
+            # 同一个视频的多个分段下载后按顺序拼接，无法拼接时分别下载
+            if segments and merge:
+                output_files.append(separate_downloader.download_segments(segments, "segmented_video.mp4"))
+            elif segments:
+                print(f"⚠️  无法拼接 {len(segments)} 个分段，将分别保存")
+                video_links.extend(segments)
+            
+            if extraction.hls and not decrypt_unsupported(decryptor_factory, "HLS流下载"):
+                output_files.append(download_hls_stream(extraction.hls[0], "hls_video.mp4", args, logger, session=session))
+            if extraction.dash and not decrypt_unsupported(decryptor_factory, "DASH流下载"):
+                output_files.append(download_dash_stream(extraction.dash[0], "dash_video.mp4", args, logger, session=session, merge=merge))
+            
+            for output_file in output_files:
+                print(f"✅ 下载完成: {output_file}" if output_file else "❌ 下载失败")
+            
+            video_links.extend(extraction.direct)
+        
         # 策略2: 直接下载视频文件
         elif strategy['method'] == 'direct_download':
             print("📥 直接下载模式")
@@ -325,16 +688,58 @@ def main():
                 print("🌐 网络抓包模式")
                 print("-" * 70)
                 print(f"   正在启动浏览器并分析网络请求...")
-                print(f"   等待时间: {args.wait_time}秒")
+                print(f"   最长等待: {args.wait_time}秒")
                 print()
                 
-                capture = NetworkCapture(headless=True, logger=logger)
-                requests_list = capture.start_capture(args.url, wait_time=args.wait_time)
+                # 同一页面的抓包结果在有效期内直接复用，跳过浏览器
+                capture_cache = None if args.no_capture_cache else load_capture_cache_config(logger=logger)
+                cached_entry = capture_cache.get(args.url) if capture_cache else None
+                if cached_entry and not capture_cache.validate(cached_entry, proxy=args.proxy):
+                    print("   ⚠️  缓存的抓包结果已失效，重新抓包")
+                    capture_cache.invalidate(args.url)
+                    cached_entry = None
+                
+                if cached_entry:
+                    print("   ♻️  使用缓存的抓包结果，跳过浏览器")
+                    capture = CachedCapture(cached_entry, logger=logger)
+                else:
+                    # 池化抓包：网络空闲或发现视频后提前结束，并可边抓边下载；
+                    # 命令行每次运行只抓一次包，浏览器用完即关闭，不保留在池中（与pool_size无关）
+                    browser_pool = BrowserPool(size=1, headless=True, max_uses=1, proxy=args.proxy, logger=logger)
+                    capture = PooledCapture(browser_pool, logger=logger, idle_time=load_capture_idle_time())
+                    if not args.no_early_download:
+                        # 页面加载过程中发现的视频文件立即开始下载
+                        early_downloader = EarlyDownloader(
+                            output_dir=args.output,
+                            workers=args.workers,
+                            max_downloads=args.max_downloads,
+                            connections=args.connections,
+                            retries=args.retries,
+                            proxy=args.proxy,
+                            resume=args.resume,
+                            keywords=[k.strip() for k in args.keywords.split(',')] if args.keywords else None,
+                            logger=logger,
+                            decryptor_factory=decryptor_factory,
+                            index=download_index
+                        )
+                
+                if early_downloader:
+                    requests_list = capture.start_capture(args.url, wait_time=args.wait_time,
+                                                          on_candidate=early_downloader.submit)
+                    if early_downloader.urls:
+                        print(f"   ⚡ 抓包期间已开始下载 {len(early_downloader.urls)} 个视频")
+                else:
+                    requests_list = capture.start_capture(args.url, wait_time=args.wait_time)
+                if getattr(capture, 'wait_reason', None) not in (None, 'cache'):
+                    print(f"   ⏱️  实际等待: {capture.wait_elapsed:.1f}秒")
                 
                 # 获取Cookie和Referer
                 captured_cookies = capture.get_cookies()
                 captured_referer = capture.get_referer()
                 
+                # 后续请求携带抓包得到的Cookie和Referer
+                session = create_session(proxy=args.proxy, cookies=captured_cookies, referer=captured_referer)
+                
                 if captured_cookies:
                     print(f"   ✅ 获取到 {len(captured_cookies)} 个Cookie")
                 if captured_referer:
@@ -349,7 +754,9 @@ def main():
                     
                     # 获取所有视频候选URL（使用增强的搜索）
                     print(f"\n📊 智能分析视频URL...")
-                    candidates = capture.get_all_video_candidates(keywords=keywords)
+                    # 一次遍历完成候选、过滤、流媒体分组和分离音视频检测
+                    classification = RequestClassifier(keywords).classify(requests_list)
+                    candidates = classification.candidates
                     
                     # 显示分析结果
                     print(f"   高置信度: {len(candidates['high_confidence'])} 个")
@@ -358,7 +765,7 @@ def main():
                         print(f"   关键词匹配: {len(candidates['keyword_matches'])} 个")
                     
                     # 过滤视频请求
-                    video_requests = capture.filter_video_requests(requests_list, keywords=keywords)
+                    video_requests = classification.media
                     
                     if video_requests:
                         # 优先使用候选URL
@@ -372,14 +779,26 @@ def main():
                         priority_links.extend(candidates['medium_confidence'])
                         
                         # 去重
-                        priority_links = list(dict.fromkeys(priority_links))
+                        # 签名参数、字节范围或镜像主机不同的同一媒体只保留一个
+                        priority_links = dedupe_media_urls(priority_links)
                         
                         if priority_links:
                             print(f"   找到 {len(priority_links)} 个优质视频URL")
                             video_links.extend(priority_links[:args.max_downloads])
                         
                         # 提取流媒体URL
-                        streams = capture.extract_stream_urls(video_requests)
+                        streams = classification.streams
+                        
+                        # 缓存本次抓包的结果（从缓存恢复的结果不再写回）
+                        if capture_cache and not isinstance(capture, CachedCapture):
+                            capture_cache.put(args.url, {
+                                'cookies': captured_cookies,
+                                'referer': captured_referer,
+                                'requests': requests_list,
+                                'candidates': candidates,
+                                'streams': streams,
+                                'keywords': keywords
+                            })
                         
                         print(f"\n📊 流媒体分析:")
                         print(f"   HLS流: {len(streams['hls'])} 个")
@@ -387,11 +806,28 @@ def main():
                         print(f"   直接视频: {len(streams['direct'])} 个")
                         print(f"   视频片段: {len(streams['segments'])} 个")
                         
+                        # MPD清单交给DASH下载器，不作为普通文件下载
+                        if streams['dash']:
+                            video_links = [link for link in video_links if link not in streams['dash']]
+                        
+                        # 有多个候选时并发探测码率和分辨率，按画质偏好排序
+                        prober = VariantProber(session=session, logger=logger)
+                        for kind in ('dash', 'hls'):
+                            if len(streams[kind]) > 1 and not video_links:
+                                streams[kind] = prober.rank(streams[kind], args.quality)
+                        
+                        # 处理DASH流
+                        if streams['dash'] and not video_links and not decrypt_unsupported(decryptor_factory, "DASH流下载"):
+                            print(f"\n🎬 发现DASH流，开始下载...")
+                            merge = not args.no_merge and MediaMerger(logger=logger).is_available()
+                            output_file = download_dash_stream(streams['dash'][0], "dash_video.mp4", args, logger, session=session, merge=merge)
+                            if output_file:
+                                print(f"✅ DASH流下载完成: {output_file}")
+                        
                         # 处理HLS流
-                        if streams['hls'] and not video_links:
+                        if streams['hls'] and not video_links and not decrypt_unsupported(decryptor_factory, "HLS流下载"):
                             print(f"\n🎬 发现HLS流，开始下载...")
-                            stream_downloader = StreamDownloader(output_dir=args.output, logger=logger)
-                            output_file = stream_downloader.download_hls(streams['hls'][0], "hls_video.mp4")
+                            output_file = download_hls_stream(streams['hls'][0], "hls_video.mp4", args, logger, session=session)
                             if output_file:
                                 print(f"✅ HLS流下载完成: {output_file}")
                         
@@ -401,9 +837,9 @@ def main():
                         
                         # 检测分离的音视频流
                         if strategy.get('use_merge', False):
-                            separate_result = detector.detect_separate_streams(video_requests)
+                            separate_result = classification.separate
                             
-                            if separate_result['has_separate']:
+                            if separate_result['has_separate'] and not decrypt_unsupported(decryptor_factory, "分离音视频流下载"):
                                 print(f"\n🎵 检测到分离的音视频流")
                                 print(f"   视频流: {len(separate_result['video_urls'])} 个")
                                 print(f"   音频流: {len(separate_result['audio_urls'])} 个")
@@ -412,20 +848,42 @@ def main():
                                 merger = MediaMerger(logger=logger)
                                 if merger.is_available():
                                     print(f"\n🔧 开始下载并合并音视频...")
-                                    stream_downloader = StreamDownloader(output_dir=args.output, logger=logger)
                                     
-                                    # 选择最佳质量的视频和音频
-                                    video_url = separate_result['video_urls'][0]
-                                    audio_url = separate_result['audio_urls'][0]
+                                    # 只处理一对时从所有候选中选出最符合画质偏好的视频轨和音质最高的音频轨，
+                                    # 多对时按顺序配对（各条目的轨道按出现顺序对应）
+                                    video_urls = separate_result['video_urls']
+                                    audio_urls = separate_result['audio_urls']
+                                    if min(args.max_pairs, args.max_downloads) <= 1:
+                                        video_urls = prober.rank(video_urls, args.quality)
+                                        audio_urls = prober.rank(audio_urls, 'best')
+                                    pairs = list(zip(video_urls, audio_urls))
+                                    pairs = pairs[:max(1, min(args.max_pairs, args.max_downloads))]
                                     
-                                    output_file = stream_downloader.download_separate_streams(
-                                        video_url, audio_url, "merged_video.mp4", merger
+                                    # 每对的视频轨和音频轨同时下载，优先边下载边合并
+                                    separate_downloader = SeparateStreamDownloader(
+                                        output_dir=args.output,
+                                        max_pairs=len(pairs),
+                                        streaming=not args.no_stream_merge,
+                                        retries=args.retries,
+                                        session=session,
+                                        logger=logger
                                     )
+                                    output_files = separate_downloader.download_pairs(pairs, "merged_video.mp4")
                                     
-                                    if output_file:
-                                        print(f"✅ 音视频合并完成: {output_file}")
-                                    else:
-                                        print("❌ 音视频合并失败")
+                                    for index, ((video_url, audio_url), output_file) in enumerate(zip(pairs, output_files)):
+                                        if not output_file:
+                                            # 回退到原有的下载后合并流程
+                                            output_name = "merged_video.mp4" if index == 0 else f"merged_video_{index + 1}.mp4"
+                                            stream_downloader = StreamDownloader(output_dir=args.output, logger=logger)
+                                            mount_shared_adapter(getattr(stream_downloader, 'session', None))
+                                            output_file = stream_downloader.download_separate_streams(
+                                                video_url, audio_url, output_name, merger
+                                            )
+                                        
+                                        if output_file:
+                                            print(f"✅ 音视频合并完成: {output_file}")
+                                        else:
+                                            print("❌ 音视频合并失败")
                                 else:
                                     print("⚠️  未找到FFmpeg，无法合并音视频")
                                     print("   提示: 安装FFmpeg以启用音视频合并功能")
@@ -441,49 +899,137 @@ def main():
             print("📝 HTML解析模式")
             print("-" * 70)
             
-            if not html_content:
-                html_content = get_html_content(args.url, args.proxy, logger)
+            # 先流式解析，找到足够的链接后立即停止读取
+            limit = args.max_downloads + (len(early_downloader.urls) if early_downloader else 0)
+            try:
+                video_links = StreamingVideoParser(logger=logger).parse(
+                    args.url, session=session, limit=limit, cache=page_cache
+                )
+            except requests.exceptions.RequestException as e:
+                logger.warning(f"流式解析失败: {e}")
+                video_links = []
             
-            if html_content:
-                parser = VideoParser(logger=logger)
-                video_links = parser.parse(html_content, args.url)
-            else:
-                print("❌ 无法获取网页内容")
-                logger.error("无法获取网页内容，程序退出")
-                sys.exit(1)
+            # 流式解析没有结果时使用完整解析（读完的页面已在缓存中）
+            if not video_links:
+                if not html_content:
+                    html_content = get_html_content(args.url, args.proxy, logger, session=session, cache=page_cache)
+                
+                if html_content:
+                    parser = VideoParser(logger=logger)
+                    video_links = parser.parse(html_content, args.url)
+                else:
+                    print("❌ 无法获取网页内容")
+                    logger.error("无法获取网页内容，程序退出")
+                    sys.exit(1)
+        
+        # 抓包期间已开始下载的视频不再重复下载
+        early_links = early_downloader.urls if early_downloader else []
+        if early_links:
+            early_keys = {canonical_media_key(link) for link in early_links}
+            video_links = [link for link in video_links if canonical_media_key(link) not in early_keys]
+        
+        # 同一媒体只下载一次，以前运行中已下载过的媒体直接跳过
+        video_links = dedupe_media_urls(video_links)
+        if download_index and video_links:
+            video_links, known_links = download_index.filter_new(video_links)
+            if known_links:
+                print(f"\n⏭️  跳过 {len(known_links)} 个以前已下载过的视频（--no-dedup 可重新下载）")
         
         # 下载视频链接
-        if video_links:
-            print(f"\n📹 共找到 {len(video_links)} 个视频文件")
+        if video_links or early_links:
+            print(f"\n📹 共找到 {len(video_links) + len(early_links)} 个视频文件")
             
             # 显示视频链接列表
             print("\n视频链接列表:")
             for i, link in enumerate(video_links[:args.max_downloads], 1):
                 print(f"  {i}. {link}")
             
-            # 限制下载数量
-            if len(video_links) > args.max_downloads:
+            # 限制下载数量（包括抓包期间已开始的下载）
+            max_links = max(0, args.max_downloads - len(early_links))
+            if len(video_links) > max_links:
                 print(f"\n将下载前 {args.max_downloads} 个视频文件")
-                video_links = video_links[:args.max_downloads]
+                video_links = video_links[:max_links]
             
-            # 创建下载器（使用捕获的Cookie和Referer）
-            downloader = VideoDownloader(
-                output_dir=args.output,
-                workers=args.workers,
-                retries=args.retries,
-                proxy=args.proxy,
-                resume=args.resume,
-                verify=not args.no_verify,
-                logger=logger,
-                cookies=captured_cookies,
-                referer=captured_referer
-            )
+            results = {'success': 0, 'failed': 0, 'skipped': 0}
+            remaining_links = video_links
             
-            # 开始下载
-            print(f"\n⬇️  开始下载视频文件...")
-            print()
+            # 大文件使用多连接分段下载
+            if args.connections > 1 and video_links:
+                segmented = SegmentedDownloader(
+                    output_dir=args.output,
+                    connections=args.connections,
+                    chunk_size=args.segment_size * 1024 * 1024,
+                    min_size=args.segment_threshold * 1024 * 1024,
+                    retries=args.retries,
+                    proxy=args.proxy,
+                    resume=args.resume,
+                    logger=logger,
+                    session=session,
+                    decryptor_factory=decryptor_factory,
+                    index=download_index
+                )
+                large_links, remaining_links, sizes = segmented.partition(video_links, workers=args.workers)
+                
+                if large_links:
+                    print(f"\n⬇️  分段下载 {len(large_links)} 个大文件（每个文件 {args.connections} 个连接）...")
+                    print()
+                    segmented_results = segmented.download_videos(large_links, sizes)
+                    for key in results:
+                        results[key] += segmented_results[key]
             
-            results = downloader.download_videos(video_links)
+            if remaining_links:
+                if args.engine == 'async' and not optional_deps['aiohttp']:
+                    print("⚠️  async引擎需要aiohttp，但未安装，改用多线程引擎")
+                    print("   提示: pip install aiohttp")
+                    args.engine = 'thread'
+                
+                # 创建下载器（使用捕获的Cookie和Referer）
+                if args.engine == 'async':
+                    downloader = AsyncVideoDownloader(
+                        output_dir=args.output,
+                        concurrency=args.concurrency,
+                        retries=args.retries,
+                        proxy=args.proxy,
+                        resume=args.resume,
+                        verify=not args.no_verify,
+                        logger=logger,
+                        cookies=captured_cookies,
+                        referer=captured_referer,
+                        decryptor_factory=decryptor_factory,
+                        index=download_index
+                    )
+                else:
+                    downloader = VideoDownloader(
+                        output_dir=args.output,
+                        workers=args.workers,
+                        retries=args.retries,
+                        proxy=args.proxy,
+                        resume=args.resume,
+                        verify=not args.no_verify,
+                        logger=logger,
+                        cookies=captured_cookies,
+                        referer=captured_referer
+                    )
+                    # 多线程下载器自带会话，挂载共享连接池和限速适配器
+                    mount_shared_adapter(getattr(downloader, 'session', None))
+                
+                # 开始下载
+                print(f"\n⬇️  开始下载视频文件...")
+                print()
+                
+                downloader_results = downloader.download_videos(remaining_links)
+                for key in results:
+                    results[key] += downloader_results[key]
+                
+                # 多线程引擎只报告数量，全部完成时才能确定每个URL都已下载
+                if (download_index and args.engine != 'async' and not downloader_results['failed']
+                        and downloader_results['success'] + downloader_results['skipped'] == len(remaining_links)):
+                    download_index.add_many(remaining_links)
+            
+            if early_links:
+                early_results = early_downloader.wait()
+                for key in results:
+                    results[key] += early_results[key]
             
             # 显示下载结果
             print("\n" + "=" * 70)
@@ -492,16 +1038,27 @@ def main():
             print(f"成功: {results['success']} 个")
             print(f"失败: {results['failed']} 个")
             print(f"跳过: {results['skipped']} 个")
-            print(f"总计: {len(video_links)} 个")
+            print(f"总计: {len(video_links) + len(early_links)} 个")
             print("=" * 70)
             
+            bandwidth = limiter.snapshot()
+            if limiter.is_limited():
+                print(f"平均速度: {bandwidth['speed'] / 1024:.0f} KB/s"
+                      + (f" / 上限 {bandwidth['max_rate'] / 1024:.0f} KB/s" if bandwidth['max_rate'] else ""))
+                for host, counters in bandwidth['hosts'].items():
+                    limit = counters['limit'] or '不限'
+                    print(f"   {host}: {counters['bytes'] / 1024 / 1024:.1f} MB, 连接上限 {limit}")
+            
             logger.info(f"下载完成 - 成功: {results['success']}, 失败: {results['failed']}, 跳过: {results['skipped']}")
             
+            # 所有文件都已在下载时解密，无需再扫描目录
+            inline_decrypted = decryptor_factory is not None
+            
             # 处理加密视频文件
-            if results['success'] > 0:
+            if results['success'] > 0 and not inline_decrypted:
                 print(f"\n🔓 检查并处理加密视频...")
                 crypto_handler = EncryptedVideoHandler(logger=logger)
-                processed = crypto_handler.batch_process_directory(args.output)
+                processed = process_directory_incremental(crypto_handler, args.output, logger)
                 
                 if processed:
                     print(f"✅ 成功解密 {len(processed)} 个加密视频")
@@ -521,6 +1078,10 @@ def main():
         print(f"\n❌ 程序异常: {e}")
         logger.error(f"程序异常: {e}", exc_info=True)
         sys.exit(1)
+    
+    finally:
+        if monitor:
+            monitor.stop()
 
 
 if __name__ == "__main__":
@@ -16,7 +16,6 @@ try:
         setup_logger,
         VideoParser,
         VideoDownloader,
-        NetworkCapture,
         StreamDownloader,
         MediaMerger,
         SmartDetector,
@@ -26,6 +25,17 @@ try:
         ResourceDetector
     )
     from utils.version import VersionManager
+    from utils.http_session import create_session, mount_shared_adapter
+    from utils.bandwidth import format_bandwidth, load_bandwidth_config
+    from utils.browser_pool import BrowserPool, PooledCapture, load_browser_pool_config, load_capture_idle_time
+    from utils.processed_index import process_directory_incremental
+    from utils.url_probe import PageCache, URLProbe
+    from utils.stream_parser import StreamingVideoParser
+    from utils.quality import load_quality_preference
+    from utils.extractors import extract as extract_site, find_extractor
+    from utils.hls import HLSPipelineDownloader
+    from utils.dash import DashDownloader
+    from utils.separate_streams import SeparateStreamDownloader
 except ImportError as e:
     # 如果导入失败，启动web界面
     print(f"导入模块失败: {e}")
@@ -52,6 +62,14 @@ class VideoDownloaderGUI:
         # 配置管理器
         self.config = ConfigManager()
         
+        # 带宽与主机连接限制
+        self.limiter = load_bandwidth_config()
+        
+        # 无头抓包使用的浏览器池，提前启动一个浏览器
+        self.browser_pool = load_browser_pool_config(headless=True)
+        if self.browser_pool.size:
+            self.browser_pool.warm()
+        
         # 版本管理器
         self.version_manager = VersionManager()
         
@@ -68,6 +86,9 @@ class VideoDownloaderGUI:
         # 启动日志更新
         self.update_log()
         
+        # 启动带宽状态更新
+        self.update_bandwidth()
+        
         # 加载配置
         self.load_config()
     
@@ -181,6 +202,9 @@ class VideoDownloaderGUI:
         self.status_var = tk.StringVar(value="就绪")
         ttk.Label(progress_frame, textvariable=self.status_var, font=("Arial", 9)).grid(row=1, column=0, sticky=tk.W, pady=(5, 0))
         
+        self.bandwidth_var = tk.StringVar(value="")
+        ttk.Label(progress_frame, textvariable=self.bandwidth_var, font=("Arial", 9), foreground="gray").grid(row=2, column=0, sticky=tk.W)
+        
         # ===== 日志区域 =====
         log_frame = ttk.LabelFrame(main_frame, text="运行日志", padding="5")
         log_frame.grid(row=5, column=0, sticky="nsew", pady=(0, 10))
@@ -274,6 +298,17 @@ class VideoDownloaderGUI:
         # 每100ms检查一次
         self.root.after(100, self.update_log)
     
+    def update_bandwidth(self):
+        """更新实时速度和主机连接占用"""
+        snapshot = self.limiter.snapshot()
+        if self.is_downloading or snapshot['current_speed']:
+            self.bandwidth_var.set(f"📶 {format_bandwidth(snapshot)}")
+        else:
+            self.bandwidth_var.set("")
+        
+        # 每秒刷新一次
+        self.root.after(1000, self.update_bandwidth)
+    
     def clear_log(self):
         """清空日志"""
         self.log_text.delete(1.0, tk.END)
@@ -316,6 +351,63 @@ class VideoDownloaderGUI:
         self.download_thread = threading.Thread(target=self.download_worker, args=(url,), daemon=True)
         self.download_thread.start()
     
+    def download_extraction(self, extraction, output_dir, session, quality, logger):
+        """
+        下载站点解析得到的流媒体
+        
+        音视频对合并、分段视频按顺序拼接（没有FFmpeg时改为分别下载），
+        HLS和DASH流使用对应的下载器。
+        
+        Returns:
+            tuple: (已完成的输出文件列表, 需要直接下载的文件URL列表)
+        """
+        merge = MediaMerger(logger=logger).is_available()
+        video_urls = list(extraction.direct)
+        output_files = []
+        separate_downloader = SeparateStreamDownloader(
+            output_dir=output_dir,
+            max_pairs=max(1, len(extraction.pairs)),
+            session=session,
+            logger=logger
+        )
+        
+        if extraction.pairs and merge:
+            self.log_message(f"下载并合并 {len(extraction.pairs)} 对音视频...", "INFO")
+            output_files.extend(separate_downloader.download_pairs(extraction.pairs, "merged_video.mp4"))
+        else:
+            # 无法合并时分别下载视频轨和音频轨
+            video_urls.extend(track for pair in extraction.pairs for track in pair)
+        
+        if extraction.segments and merge:
+            self.log_message(f"下载并拼接 {len(extraction.segments)} 个分段...", "INFO")
+            output_files.append(separate_downloader.download_segments(extraction.segments, "segmented_video.mp4"))
+        elif extraction.segments:
+            self.log_message(f"未找到FFmpeg，{len(extraction.segments)} 个分段将分别保存", "WARNING")
+            video_urls.extend(extraction.segments)
+        
+        if extraction.hls:
+            self.log_message("下载HLS流...", "INFO")
+            pipeline = HLSPipelineDownloader(output_dir=output_dir, session=session, logger=logger, quality=quality)
+            output_file = pipeline.download(extraction.hls[0], "hls_video.mp4")
+            if not output_file:
+                self.log_message("并行预取下载失败，回退到常规HLS下载", "WARNING")
+                stream_downloader = StreamDownloader(output_dir=output_dir, logger=logger)
+                mount_shared_adapter(getattr(stream_downloader, 'session', None))
+                output_file = stream_downloader.download_hls(extraction.hls[0], "hls_video.mp4")
+            output_files.append(output_file)
+        
+        if extraction.dash:
+            self.log_message("下载DASH流...", "INFO")
+            dash_downloader = DashDownloader(output_dir=output_dir, session=session, logger=logger, quality=quality)
+            output_files.append(dash_downloader.download(extraction.dash[0], "dash_video.mp4", merge=merge))
+        
+        for output_file in output_files:
+            if output_file:
+                self.log_message(f"下载完成: {output_file}", "SUCCESS")
+            else:
+                self.log_message("流媒体下载失败", "ERROR")
+        return [f for f in output_files if f], video_urls
+    
     def stop_download(self):
         """停止下载"""
         if self.is_downloading:
@@ -343,27 +435,67 @@ class VideoDownloaderGUI:
             # 设置日志
             logger = setup_logger(log_dir='logs')
             
+            # 已知站点直接调用播放地址接口，不需要启动浏览器抓包
+            extraction = None
+            if not self.force_capture_var.get() and find_extractor(url):
+                self.log_message("使用站点解析器获取媒体地址...", "INFO")
+                extraction = extract_site(url, quality=load_quality_preference(url), proxy=proxy, logger=logger)
+            
             # 智能检测
             self.log_message("正在智能检测URL类型...", "INFO")
             detector = SmartDetector(logger=logger)
-            url_type = detector.detect_url_type(url)
-            self.log_message(f"检测到URL类型: {url_type}", "SUCCESS")
-            
-            strategy = detector.recommend_strategy(url)
+            page_cache = PageCache()
+            if extraction:
+                strategy = {'method': 'site_extract', 'use_capture': False}
+            else:
+                probe = URLProbe(session=create_session(proxy=proxy), cache=page_cache, logger=logger)
+                url_type = probe.detect_url_type(url)
+                if url_type == 'unknown':
+                    url_type = detector.detect_url_type(url)
+                self.log_message(f"检测到URL类型: {url_type}", "SUCCESS")
+                
+                # 探测时取回的网页内容一并用于策略推荐
+                strategy = probe.recommend_strategy(url) or detector.recommend_strategy(url, page_cache.get(url))
             self.log_message(f"推荐策略: {strategy['method']}", "INFO")
             
             video_urls = []
+            stream_files = []
             cookies = None
             referer = None
             
+            # 站点解析得到的流媒体先下载（合并、拼接或HLS/DASH），其余文件直接下载
+            if extraction:
+                cookies = extraction.cookies
+                referer = extraction.referer
+                self.log_message(f"站点解析完成: {extraction.title or url}", "SUCCESS")
+                self.update_status("正在下载解析到的媒体...", 30)
+                session = create_session(proxy=proxy, cookies=cookies, referer=referer)
+                stream_files, video_urls = self.download_extraction(
+                    extraction, output_dir, session, load_quality_preference(url), logger
+                )
+            
+            # 探测确认是视频文件时直接下载，不再抓包或把文件当作网页获取
+            elif strategy['method'] == 'direct_download' and not self.force_capture_var.get():
+                video_urls = [url]
+            
             # 根据策略下载
-            if strategy['use_capture'] or self.force_capture_var.get():
+            elif strategy['use_capture'] or self.force_capture_var.get():
                 self.update_status("正在启动浏览器抓包...", 10)
                 self.log_message("启动浏览器抓包模式", "INFO")
                 
-                capture = NetworkCapture(headless=self.headless_var.get(), logger=logger)
+                if self.headless_var.get() and self.browser_pool.size:
+                    if self.browser_pool.proxy != proxy:
+                        # 代理设置变化后重建浏览器池，已预热的浏览器使用的是旧代理
+                        self.browser_pool = load_browser_pool_config(headless=True, proxy=proxy, logger=logger)
+                    browser_pool = self.browser_pool
+                else:
+                    # 未启用浏览器池或需要显示浏览器窗口时，借用一个用完即关闭的浏览器
+                    browser_pool = BrowserPool(size=1, headless=self.headless_var.get(), max_uses=1, proxy=proxy, logger=logger)
+                capture = PooledCapture(browser_pool, logger=logger, idle_time=load_capture_idle_time())
                 try:
-                    video_urls = capture.start_capture(url, wait_time=10)
+                    capture.start_capture(url, wait_time=self.config.getint('capture', 'wait_time', 10))
+                    video_urls = [req['url'] for req in capture.filter_video_requests()]
+                    self.log_message(f"抓包实际等待 {capture.wait_elapsed:.1f} 秒", "INFO")
                     cookies = capture.get_cookies()
                     referer = capture.get_referer()
                     
@@ -378,23 +510,26 @@ class VideoDownloaderGUI:
                     self.log_message(f"抓包失败: {e}", "ERROR")
             
             # 如果没有找到视频，尝试HTML解析
-            if not video_urls:
+            if not video_urls and not stream_files:
                 self.update_status("正在解析HTML...", 20)
                 self.log_message("尝试HTML解析模式", "INFO")
                 
-                # 注意：VideoParser.parse需要html_content和base_url参数
-                # 这里需要先获取HTML内容
+                # 先流式解析，找到足够的链接后立即停止；没有结果时再完整解析
+                # 探测时已取回的网页不再重复请求
                 try:
-                    import requests
-                    response = requests.get(url, timeout=30)
-                    html_content = response.text
-                    parser = VideoParser(logger=logger)
-                    video_urls = parser.parse(html_content, url)
+                    session = create_session(proxy=proxy, cookies=cookies, referer=referer)
+                    video_urls = StreamingVideoParser(logger=logger).parse(
+                        url, session=session, limit=max_downloads, cache=page_cache
+                    )
+                    if not video_urls:
+                        html_content = page_cache.fetch(url, session=session, logger=logger)
+                        parser = VideoParser(logger=logger)
+                        video_urls = parser.parse(html_content, url)
                     self.log_message(f"HTML解析完成，找到 {len(video_urls)} 个视频", "SUCCESS")
                 except Exception as parse_error:
                     self.log_message(f"HTML解析失败: {parse_error}", "WARNING")
             
-            if not video_urls:
+            if not video_urls and not stream_files:
                 self.log_message("未找到任何视频链接", "ERROR")
                 self.update_status("未找到视频", 0)
                 messagebox.showerror("错误", "未找到任何视频链接")
@@ -417,31 +552,37 @@ class VideoDownloaderGUI:
                 cookies=cookies,
                 referer=referer
             )
+            # 多线程下载器自带会话，挂载共享连接池和限速适配器
+            mount_shared_adapter(getattr(downloader, 'session', None))
             
+            # download_videos只返回各状态的数量，站点解析得到的流媒体文件单独计数
+            results = {'success': 0, 'failed': 0, 'skipped': 0}
             try:
-                downloaded_files = downloader.download_videos(video_urls)
-                self.log_message(f"下载完成，成功 {len(downloaded_files)} 个文件", "SUCCESS")
+                if video_urls:
+                    results = downloader.download_videos(video_urls)
+                    self.log_message(f"下载完成，成功 {results['success']} 个文件，失败 {results['failed']} 个，"
+                                     f"跳过 {results['skipped']} 个", "SUCCESS")
             except Exception as e:
                 self.log_message(f"下载过程出错: {e}", "ERROR")
-                downloaded_files = []
+            downloaded_count = results['success'] + len(stream_files)
             
             # 处理加密视频
-            if self.auto_decrypt_var.get() and downloaded_files:
+            if self.auto_decrypt_var.get() and downloaded_count:
                 self.update_status("正在处理加密视频...", 85)
                 self.log_message("检查并解密加密视频...", "INFO")
                 
                 handler = EncryptedVideoHandler(logger=logger)
-                decrypted = handler.batch_process_directory(output_dir)
+                decrypted = process_directory_incremental(handler, output_dir, logger)
                 if decrypted:
                     self.log_message(f"解密了 {len(decrypted)} 个加密视频", "SUCCESS")
             
             # 完成
-            self.update_status(f"下载完成！共 {len(downloaded_files)} 个文件", 100)
+            self.update_status(f"下载完成！共 {downloaded_count} 个文件", 100)
             self.log_message("="*50, "INFO")
-            self.log_message(f"全部完成！成功下载 {len(downloaded_files)} 个视频", "SUCCESS")
+            self.log_message(f"全部完成！成功下载 {downloaded_count} 个视频", "SUCCESS")
             self.log_message(f"保存位置: {os.path.abspath(output_dir)}", "INFO")
             
-            messagebox.showinfo("完成", f"下载完成！\n成功: {len(downloaded_files)} 个视频\n保存位置: {os.path.abspath(output_dir)}")
+            messagebox.showinfo("完成", f"下载完成！\n成功: {downloaded_count} 个视频\n保存位置: {os.path.abspath(output_dir)}")
             
         except Exception as e:
             self.log_message(f"发生错误: {e}", "ERROR")
@@ -0,0 +1,86 @@
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from utils.bandwidth import BandwidthLimiter
+from utils.segmented import unique_filenames
+
+
+pytest.importorskip('aiohttp')
+
+from utils.async_downloader import AsyncVideoDownloader
+
+
+FILES = {
+    '/1080/index.mp4': b'1080p' * 1000,
+    '/720/index.mp4': b'720p' * 1000,
+    '/clip': b'clip' * 10
+}
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = FILES.get(self.path)
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_unique_filenames_suffixes_same_basenames():
+    urls = ['https://a/1080/index.mp4', 'https://a/720/index.mp4', 'https://a/1080/index.mp4', 'https://a/x/INDEX.mp4', 'https://a/v']
+    assert unique_filenames(urls) == {
+        'https://a/1080/index.mp4': 'index.mp4',
+        'https://a/720/index.mp4': 'index_2.mp4',
+        'https://a/x/INDEX.mp4': 'INDEX_3.mp4',
+        'https://a/v': 'v.mp4'
+    }
+
+
+def test_same_basename_downloads_to_separate_files(tmp_path, server):
+    urls = [server + '/1080/index.mp4', server + '/720/index.mp4', server + '/1080/index.mp4', server + '/clip']
+    downloader = AsyncVideoDownloader(output_dir=str(tmp_path), concurrency=4, retries=1)
+    assert downloader.download_videos(urls) == {'success': 3, 'failed': 0, 'skipped': 1}
+    assert (tmp_path / 'index.mp4').read_bytes() == FILES['/1080/index.mp4']
+    assert (tmp_path / 'index_2.mp4').read_bytes() == FILES['/720/index.mp4']
+    assert (tmp_path / 'clip.mp4').read_bytes() == FILES['/clip']
+
+
+def test_shared_bucket_refill_runs_off_the_event_loop(tmp_path, monkeypatch):
+    limiter = BandwidthLimiter(max_rate=10 * 1024 * 1024, shared_state=str(tmp_path / 'bandwidth.db'))
+    threads = []
+    take_shared = limiter.bucket._take_shared
+    
+    def record(amount):
+        threads.append(threading.current_thread())
+        return take_shared(amount)
+    
+    monkeypatch.setattr(limiter.bucket, '_take_shared', record)
+    
+    async def transfer():
+        for _ in range(8):
+            await limiter.reserve_async(64 * 1024, 'example.com')
+    
+    asyncio.run(transfer())
+    # 第一块需要从状态文件预取令牌，之后使用本地预取的令牌
+    assert threads and all(thread is not threading.main_thread() for thread in threads)
+    assert limiter.snapshot()['hosts']['example.com']['bytes'] == 8 * 64 * 1024
+    limiter.bucket.close()
@@ -0,0 +1,57 @@
+import pytest
+
+from utils import bandwidth
+from utils.bandwidth import TokenBucket
+
+
+class FakeClock:
+    """代替time模块：monotonic()返回手动推进的时间，sleep()直接推进"""
+    
+    def __init__(self):
+        self.now = 1000.0
+    
+    def monotonic(self):
+        return self.now
+    
+    def time(self):
+        return self.now
+    
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(bandwidth, 'time', fake)
+    return fake
+
+
+def test_unlimited_bucket_never_waits(clock):
+    bucket = TokenBucket(rate=0)
+    assert bucket.reserve(10 ** 9) == 0.0
+
+
+def test_burst_then_wait_proportional_to_debt(clock):
+    bucket = TokenBucket(rate=1000)
+    assert bucket.reserve(1000) == 0.0
+    assert bucket.reserve(500) == pytest.approx(0.5)
+    # 透支按到达顺序排队：下一个请求还要等前面的欠款
+    assert bucket.reserve(500) == pytest.approx(1.0)
+
+
+def test_refill_is_capped_at_burst(clock):
+    bucket = TokenBucket(rate=1000, burst=2000)
+    bucket.reserve(2000)
+    clock.now += 60
+    assert bucket.reserve(2000) == 0.0
+    assert bucket.reserve(1000) == pytest.approx(1.0)
+
+
+def test_consume_holds_the_configured_rate(clock):
+    bucket = TokenBucket(rate=1024 * 1024)
+    start = clock.now
+    for _ in range(64):
+        bucket.consume(64 * 1024)
+    # 4MB中第一秒的1MB来自突发容量，其余按速率补充
+    assert clock.now - start == pytest.approx(3.0)
@@ -0,0 +1,206 @@
+import json
+
+import pytest
+
+from utils import browser_pool
+from utils.browser_pool import BrowserPool, NetworkLog, PooledCapture
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+    
+    def monotonic(self):
+        return self.now
+    
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class FakeSwitchTo:
+    def __init__(self, driver):
+        self.driver = driver
+    
+    def window(self, handle):
+        self.driver.current = handle
+
+
+class FakeDriver:
+    """代替Selenium的Chrome：记录CDP命令，按时间依次吐出性能日志（借出时会先清空一次日志）"""
+    
+    def __init__(self, clock=None, log=()):
+        self.clock = clock
+        self.log = list(log)
+        self.windows = ['home']
+        self.current = 'home'
+        self.switch_to = FakeSwitchTo(self)
+        self.commands = []
+        self.quit_called = False
+        self.current_url = None
+    
+    @property
+    def current_window_handle(self):
+        return self.current
+    
+    @property
+    def window_handles(self):
+        return list(self.windows)
+    
+    def execute_cdp_cmd(self, command, params):
+        self.commands.append(command)
+        if command == 'Target.createBrowserContext':
+            return {'browserContextId': f'ctx{len(self.commands)}'}
+        if command == 'Target.createTarget':
+            target = f'tab{len(self.commands)}'
+            self.windows.append(target)
+            return {'targetId': target}
+        return {}
+    
+    def close(self):
+        self.windows.remove(self.current)
+    
+    def get(self, url):
+        self.current_url = url
+    
+    def get_log(self, kind):
+        if self.clock is None:
+            return []
+        ready = [entries for at, entries in self.log if at <= self.clock.now]
+        self.log = [(at, entries) for at, entries in self.log if at > self.clock.now]
+        return [entry for entries in ready for entry in entries]
+    
+    def get_cookies(self):
+        return [{'name': 'sid', 'value': '1'}]
+    
+    def quit(self):
+        self.quit_called = True
+
+
+def event(method, **params):
+    return {'message': json.dumps({'message': {'method': method, 'params': params}})}
+
+
+def request(request_id, url, kind='XHR'):
+    return event('Network.requestWillBeSent', requestId=request_id, type=kind,
+                 request={'url': url, 'method': 'GET', 'headers': {}})
+
+
+def response(request_id, mime_type, length=0):
+    return event('Network.responseReceived', requestId=request_id,
+                 response={'status': 200, 'mimeType': mime_type, 'headers': {'Content-Length': str(length)}})
+
+
+def finished(request_id, length=0):
+    return event('Network.loadingFinished', requestId=request_id, encodedDataLength=length)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(browser_pool, 'time', fake)
+    return fake
+
+
+def make_pool(drivers, **kwargs):
+    pool = BrowserPool(**kwargs)
+    pool._create_driver = lambda: drivers.pop(0)
+    return pool
+
+
+def test_lease_reuses_browser_and_disposes_context():
+    driver = FakeDriver()
+    pool = make_pool([driver], size=1, max_uses=2)
+    
+    with pool.lease() as leased:
+        assert leased is driver
+        assert driver.current != 'home'
+    # 归还时关闭本次打开的窗口、销毁上下文，浏览器放回池中
+    assert driver.windows == ['home']
+    assert 'Target.disposeBrowserContext' in driver.commands
+    assert not driver.quit_called
+    
+    with pool.lease() as leased:
+        assert leased is driver
+    # 达到max_uses后回收
+    assert driver.quit_called
+
+
+def test_failed_capture_recycles_browser():
+    first, second = FakeDriver(), FakeDriver()
+    pool = make_pool([first, second], size=1)
+    
+    with pytest.raises(RuntimeError):
+        with pool.lease():
+            raise RuntimeError('页面崩溃')
+    assert first.quit_called
+    
+    with pool.lease() as leased:
+        assert leased is second
+
+
+def test_zero_size_pool_still_lends_one_shot_browser():
+    driver = FakeDriver()
+    pool = make_pool([driver], size=0, max_uses=1)
+    with pool.lease() as leased:
+        assert leased is driver
+    assert driver.quit_called
+
+
+def test_network_log_tracks_pending_requests(clock):
+    network = NetworkLog()
+    network.feed([request('1', 'https://cdn.example.com/v.m3u8'), request('2', 'data:image/png', 'Image')])
+    assert [req['url'] for req in network.requests] == ['https://cdn.example.com/v.m3u8']
+    clock.sleep(5)
+    assert network.idle_for() == 0.0
+    
+    network.feed([response('1', 'application/vnd.apple.mpegurl', 100), finished('1', 300)])
+    assert network.requests[0]['size'] == 300
+    assert network.requests[0]['status'] == 200
+    clock.sleep(2)
+    assert network.idle_for() == 2
+    
+    # 媒体长连接不参与空闲判断
+    network.feed([request('3', 'https://cdn.example.com/live', 'Media')])
+    assert network.idle_for() == 0.0
+    clock.sleep(1)
+    assert network.idle_for() == 1
+
+
+def test_capture_stops_when_network_is_idle(clock):
+    start = clock.now
+    driver = FakeDriver(clock, [
+        (start + 0.1, [request('1', 'https://example.com/app.js', 'Script')]),
+        (start + 1, [finished('1', 10)])
+    ])
+    capture = PooledCapture(make_pool([driver], size=1), idle_time=0.5)
+    requests_list = capture.start_capture('https://example.com/page', wait_time=10)
+    
+    assert [req['url'] for req in requests_list] == ['https://example.com/app.js']
+    assert capture.wait_reason == 'idle'
+    assert capture.wait_elapsed == pytest.approx(1.5)
+    assert capture.get_referer() == 'https://example.com/page'
+    assert capture.get_cookies() == [{'name': 'sid', 'value': '1'}]
+
+
+def test_capture_stops_shortly_after_video_candidate(clock):
+    start = clock.now
+    driver = FakeDriver(clock, [
+        (start + 0.1, [request('1', 'https://cdn.example.com/index.m3u8'), request('2', 'https://example.com/ping')]),
+        (start + 0.5, [response('1', 'application/vnd.apple.mpegurl')])
+    ])
+    candidates = []
+    capture = PooledCapture(make_pool([driver], size=1), idle_time=0.5)
+    capture.start_capture('https://example.com/page', wait_time=10, on_candidate=candidates.append)
+    
+    assert capture.wait_reason == 'candidate'
+    assert capture.wait_elapsed == pytest.approx(1.25)
+    assert [candidate['url'] for candidate in candidates] == ['https://cdn.example.com/index.m3u8']
+    assert candidates[0]['referer'] == 'https://example.com/page'
+
+
+def test_capture_waits_full_time_without_idle_detection(clock):
+    driver = FakeDriver(clock)
+    capture = PooledCapture(make_pool([driver], size=1), idle_time=0)
+    capture.start_capture('https://example.com/page', wait_time=3)
+    assert capture.wait_reason == 'timeout'
+    assert capture.wait_elapsed == pytest.approx(3)
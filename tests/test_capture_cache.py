@@ -0,0 +1,81 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+from utils import capture_cache
+from utils.capture_cache import CaptureCache, normalize_url
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+    
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(capture_cache, 'time', fake)
+    return fake
+
+
+def entry(cookies):
+    return {'cookies': cookies, 'referer': 'https://example.com/', 'requests': [], 'candidates': {}, 'streams': {}}
+
+
+def test_normalize_url_drops_tracking_and_sorts_query():
+    assert normalize_url('HTTPS://Example.com:443/v?b=2&utm_source=x&a=1#t') == 'https://example.com/v?a=1&b=2'
+    assert normalize_url('http://example.com:8080') == 'http://example.com:8080/'
+
+
+def test_session_cookies_are_not_stored(tmp_path, clock):
+    cache = CaptureCache(str(tmp_path / 'cache.db'), ttl=3600)
+    cache.put('https://example.com/v', entry([
+        {'name': 'sid', 'value': 'secret'},
+        {'name': 'pref', 'value': 'dark', 'expiry': clock.now + 600},
+        {'name': 'old', 'value': 'gone', 'expiry': clock.now - 1}
+    ]))
+    
+    cached = cache.get('https://example.com/v')
+    assert [cookie['name'] for cookie in cached['cookies']] == ['pref']
+    conn = sqlite3.connect(str(tmp_path / 'cache.db'))
+    assert 'secret' not in conn.execute('SELECT data FROM capture_cache').fetchone()[0]
+    conn.close()
+    cache.close()
+
+
+def test_entry_expires_with_earliest_cookie(tmp_path, clock):
+    cache = CaptureCache(str(tmp_path / 'cache.db'), ttl=3600)
+    cache.put('https://example.com/v', entry([{'name': 'token', 'value': '1', 'expiry': clock.now + 60}]))
+    cache.put('https://example.com/w', entry([]))
+    
+    clock.now += 61
+    assert cache.get('https://example.com/v') is None
+    assert cache.get('https://example.com/w') is not None
+    clock.now += 3600
+    assert cache.get('https://example.com/w') is None
+    cache.close()
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='Windows没有POSIX文件权限')
+def test_cache_file_is_private(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    CaptureCache(path).close()
+    assert os.stat(path).st_mode & 0o777 == 0o600
+
+
+def test_old_entries_without_expiry_are_purged(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE capture_cache (url TEXT PRIMARY KEY, data TEXT NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL)')
+    conn.execute("INSERT INTO capture_cache VALUES ('https://example.com/v', '{}', 0, 0)")
+    conn.commit()
+    conn.close()
+    
+    cache = CaptureCache(path)
+    assert cache.conn.execute('SELECT COUNT(*) FROM capture_cache').fetchone()[0] == 0
+    cache.close()
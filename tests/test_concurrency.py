@@ -0,0 +1,96 @@
+import pytest
+
+from utils import concurrency
+from utils.concurrency import AdaptiveConcurrencyController
+
+
+MB = 1024 * 1024
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+    
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(concurrency, 'time', fake)
+    return fake
+
+
+def run_interval(controller, clock, tasks, success=True, nbytes=MB, latency=1.0):
+    """占满名额执行tasks个任务，最后一个任务在间隔结束时完成并触发调整"""
+    for _ in range(tasks):
+        assert controller.acquire(timeout=0)
+    for _ in range(tasks - 1):
+        controller.release(success, nbytes, latency)
+    clock.now += controller.interval
+    controller.release(success, nbytes, latency)
+
+
+def test_initial_limit_is_midpoint_and_clamped():
+    assert AdaptiveConcurrencyController(min_limit=2, max_limit=10).limit == 6
+    assert AdaptiveConcurrencyController(min_limit=2, max_limit=10, initial=50).limit == 10
+    assert AdaptiveConcurrencyController(min_limit=0, max_limit=0).limit == 1
+
+
+def test_acquire_blocks_at_limit(clock):
+    controller = AdaptiveConcurrencyController(min_limit=1, max_limit=4, initial=1)
+    assert controller.acquire(timeout=0)
+    assert not controller.acquire(timeout=0)
+
+
+def test_errors_decrease_multiplicatively(clock):
+    controller = AdaptiveConcurrencyController(min_limit=1, max_limit=16, initial=8)
+    run_interval(controller, clock, 4, success=False)
+    assert controller.limit == 4
+    assert controller.snapshot()['error_rate'] == 1.0
+
+
+def test_saturated_steady_throughput_increases_additively(clock):
+    controller = AdaptiveConcurrencyController(min_limit=1, max_limit=16, initial=2)
+    run_interval(controller, clock, 2)
+    assert controller.limit == 3
+    run_interval(controller, clock, 3)
+    assert controller.limit == 4
+
+
+def test_throughput_drop_after_increase_is_reverted(clock):
+    controller = AdaptiveConcurrencyController(min_limit=1, max_limit=16, initial=2)
+    run_interval(controller, clock, 2, nbytes=10 * MB)
+    assert controller.limit == 3
+    # 加名额后吞吐量明显下降（每MB耗时不变）：撤回这次增加，下个间隔保持不变
+    run_interval(controller, clock, 3, nbytes=MB, latency=0.1)
+    assert controller.limit == 2
+    run_interval(controller, clock, 2, nbytes=MB, latency=0.1)
+    assert controller.limit == 2
+
+
+def test_latency_spike_decreases(clock):
+    controller = AdaptiveConcurrencyController(min_limit=1, max_limit=16, initial=8, latency_tolerance=3.0)
+    run_interval(controller, clock, 1, latency=1.0)
+    limit = controller.limit
+    run_interval(controller, clock, 1, latency=10.0)
+    assert controller.limit == max(1, limit // 2)
+
+
+def test_limit_never_drops_below_minimum(clock):
+    controller = AdaptiveConcurrencyController(min_limit=2, max_limit=8, initial=2)
+    run_interval(controller, clock, 2, success=False)
+    assert controller.limit == 2
+
+
+def test_transferred_bytes_survive_until_a_task_completes(clock):
+    controller = AdaptiveConcurrencyController(min_limit=1, max_limit=4, initial=1)
+    with controller.slot() as result:
+        for _ in range(3):
+            clock.now += controller.interval
+            controller.transferred(result, 5 * MB)
+        result['success'] = True
+        result['bytes'] = 15 * MB
+    # 传输期间没有任务结束，窗口不重置；结束时已报告的字节不重复计入
+    assert controller.snapshot()['throughput'] == pytest.approx(15 * MB / (3 * controller.interval))
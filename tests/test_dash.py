@@ -0,0 +1,125 @@
+import pytest
+
+from utils.dash import parse_duration, parse_mpd
+
+
+def mpd(adaptation, period='<Period>', root='mediaPresentationDuration="PT10S"', extra_periods=''):
+    return (
+        f'<MPD xmlns="urn:mpeg:dash:schema:mpd:2011" {root}>'
+        f'{period}{adaptation}</Period>{extra_periods}</MPD>'
+    )
+
+
+def urls(tracks, kind='video', index=0):
+    return [(url.rsplit('/', 1)[1], byterange) for url, byterange in tracks[kind][index]['segments']]
+
+
+def test_parse_duration():
+    assert parse_duration('PT1H2M3.5S') == 3723.5
+    assert parse_duration('P1DT1S') == 86401
+    assert parse_duration('garbage') == 0.0
+    assert parse_duration(None) == 0.0
+
+
+def test_number_template_with_padding_and_inherited_attributes():
+    text = mpd(
+        '<AdaptationSet mimeType="video/mp4" height="720">'
+        '<SegmentTemplate timescale="1000" duration="4000" startNumber="0" '
+        'media="$RepresentationID$/seg-$Number%05d$-$Bandwidth$.m4s" initialization="$RepresentationID$/init.mp4"/>'
+        '<Representation id="hd" bandwidth="3000000" codecs="avc1.64001f" width="1280"/>'
+        '</AdaptationSet>'
+    )
+    tracks = parse_mpd(text, 'https://example.com/dash/manifest.mpd')
+    video = tracks['video'][0]
+    assert (video['id'], video['width'], video['height'], video['codecs']) == ('hd', 1280, 720, 'avc1.64001f')
+    assert [url for url, _ in video['segments']] == [
+        'https://example.com/dash/hd/init.mp4',
+        'https://example.com/dash/hd/seg-00000-3000000.m4s',
+        'https://example.com/dash/hd/seg-00001-3000000.m4s',
+        'https://example.com/dash/hd/seg-00002-3000000.m4s'
+    ]
+    assert tracks['skipped_periods'] == 0
+
+
+def test_time_template_without_timeline():
+    text = mpd(
+        '<AdaptationSet contentType="audio">'
+        '<SegmentTemplate timescale="48000" duration="192000" presentationTimeOffset="960" startNumber="3" media="a_$Time$.m4s"/>'
+        '<Representation id="a" bandwidth="128000"/></AdaptationSet>'
+    )
+    assert urls(parse_mpd(text, 'https://example.com/m.mpd'), 'audio') == [
+        ('a_960.m4s', None), ('a_192960.m4s', None), ('a_384960.m4s', None)
+    ]
+
+
+def test_identifier_without_value_is_rejected():
+    text = mpd(
+        '<AdaptationSet contentType="video"><SegmentTemplate duration="1" media="s$Number$.m4s" initialization="i$Number$.mp4"/>'
+        '<Representation id="v" bandwidth="1"/></AdaptationSet>'
+    )
+    with pytest.raises(ValueError):
+        parse_mpd(text, 'https://example.com/m.mpd')
+
+
+def timeline(entries):
+    return mpd(
+        '<AdaptationSet contentType="video"><SegmentTemplate timescale="10" media="t$Time$_n$Number$.m4s">'
+        f'<SegmentTimeline>{entries}</SegmentTimeline></SegmentTemplate>'
+        '<Representation id="v" bandwidth="1"/></AdaptationSet>'
+    )
+
+
+def test_timeline_repeat_counts():
+    text = timeline('<S t="100" d="20" r="2"/><S d="10"/>')
+    assert [u for u, _ in urls(parse_mpd(text, 'https://example.com/m.mpd'))] == [
+        't100_n1.m4s', 't120_n2.m4s', 't140_n3.m4s', 't160_n4.m4s'
+    ]
+
+
+def test_negative_repeat_runs_until_next_start():
+    text = timeline('<S t="0" d="20" r="-1"/><S t="70" d="30"/>')
+    assert [u for u, _ in urls(parse_mpd(text, 'https://example.com/m.mpd'))] == [
+        't0_n1.m4s', 't20_n2.m4s', 't40_n3.m4s', 't60_n4.m4s', 't70_n5.m4s'
+    ]
+
+
+def test_negative_repeat_runs_until_period_end():
+    # 10秒的Period，timescale为10：到时间100为止
+    text = timeline('<S t="0" d="30"/><S d="25" r="-1"/>')
+    assert [u for u, _ in urls(parse_mpd(text, 'https://example.com/m.mpd'))] == [
+        't0_n1.m4s', 't30_n2.m4s', 't55_n3.m4s', 't80_n4.m4s'
+    ]
+
+
+def test_segment_list_and_segment_base():
+    text = mpd(
+        '<AdaptationSet contentType="video">'
+        '<Representation id="list" bandwidth="2"><BaseURL>list/</BaseURL><SegmentList>'
+        '<Initialization sourceURL="init.mp4" range="0-99"/>'
+        '<SegmentURL media="a.m4s"/><SegmentURL media="all.mp4" mediaRange="100-199"/>'
+        '</SegmentList></Representation>'
+        '<Representation id="single" bandwidth="1"><BaseURL>single.mp4</BaseURL></Representation>'
+        '</AdaptationSet>'
+    )
+    tracks = parse_mpd(text, 'https://example.com/dash/m.mpd')
+    assert urls(tracks, index=0) == [('init.mp4', (0, 100)), ('a.m4s', None), ('all.mp4', (100, 100))]
+    assert tracks['video'][1]['segments'] == [('https://example.com/dash/single.mp4', None)]
+
+
+def test_only_first_period_is_parsed():
+    second = '<Period start="PT6S"><AdaptationSet contentType="video"><Representation id="ad" bandwidth="1"/></AdaptationSet></Period>'
+    text = mpd(
+        '<AdaptationSet contentType="video"><SegmentTemplate timescale="1" duration="2" media="s$Number$.m4s"/>'
+        '<Representation id="main" bandwidth="1"/></AdaptationSet>',
+        period='<Period start="PT0S">',
+        extra_periods=second
+    )
+    tracks = parse_mpd(text, 'https://example.com/m.mpd')
+    # 第一个Period的时长由下一个Period的@start推算为6秒
+    assert [u for u, _ in urls(tracks)] == ['s1.m4s', 's2.m4s', 's3.m4s']
+    assert tracks['skipped_periods'] == 1
+
+
+def test_dynamic_manifest_is_rejected():
+    with pytest.raises(ValueError):
+        parse_mpd('<MPD type="dynamic"><Period/></MPD>', 'https://example.com/live.mpd')
@@ -0,0 +1,64 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from utils.early_download import EarlyDownloader
+
+
+FILES = {
+    '/a/video.mp4': b'first' * 1000,
+    '/b/video.mp4': b'second' * 1000
+}
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = FILES.get(self.path)
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def candidate(url, kind='direct'):
+    return {'url': url, 'kind': kind, 'request': {'url': url}, 'cookies': [], 'referer': None}
+
+
+def test_same_basename_candidates_get_separate_files(tmp_path, server):
+    downloader = EarlyDownloader(output_dir=str(tmp_path), workers=2, retries=1)
+    downloader.submit(candidate(server + '/a/video.mp4'))
+    downloader.submit(candidate(server + '/b/video.mp4'))
+    
+    assert downloader.wait() == {'success': 2, 'failed': 0, 'skipped': 0}
+    assert (tmp_path / 'video.mp4').read_bytes() == FILES['/a/video.mp4']
+    assert (tmp_path / 'video_2.mp4').read_bytes() == FILES['/b/video.mp4']
+
+
+def test_only_direct_video_files_are_submitted(tmp_path, server):
+    downloader = EarlyDownloader(output_dir=str(tmp_path), max_downloads=1, keywords=['video'], retries=1)
+    downloader.submit(candidate(server + '/a/index.m3u8', kind='hls'))
+    downloader.submit(candidate(server + '/a/clip.mp4'))
+    downloader.submit(candidate(server + '/a/video.mp4'))
+    # 同一媒体只提交一次，超过max_downloads的候选不再提交
+    downloader.submit(candidate(server + '/a/video.mp4?sign=2'))
+    downloader.submit(candidate(server + '/b/video.mp4'))
+    
+    assert downloader.urls == [server + '/a/video.mp4']
+    assert downloader.wait()['success'] == 1
@@ -0,0 +1,122 @@
+import pytest
+import requests
+
+from utils import extractors
+from utils.extractors import BilibiliExtractor, ExtractionError, VimeoExtractor, find_extractor
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+    
+    def raise_for_status(self):
+        if self.data is None:
+            raise requests.exceptions.HTTPError('404')
+    
+    def json(self):
+        return self.data
+
+
+class FakeSession:
+    """按接口地址返回预设的JSON，记录请求参数"""
+    
+    def __init__(self, routes):
+        self.routes = routes
+        self.calls = []
+        self.cookies = requests.cookies.RequestsCookieJar()
+    
+    def get(self, url, params=None, timeout=None):
+        self.calls.append((url, params))
+        return FakeResponse(self.routes.get(url))
+
+
+VIEW = {'code': 0, 'data': {'title': '测试视频', 'cid': 1, 'pages': [{'cid': 1}, {'cid': 2}]}}
+
+
+def bilibili(play):
+    extractor = BilibiliExtractor()
+    extractor.session = FakeSession({
+        BilibiliExtractor.VIEW_API: VIEW,
+        BilibiliExtractor.PLAYURL_API: {'code': 0, 'data': play}
+    })
+    return extractor
+
+
+def test_find_extractor_by_host():
+    assert find_extractor('https://www.bilibili.com/video/BV1xx411c7mD') is BilibiliExtractor
+    assert find_extractor('https://b23.tv/abc') is BilibiliExtractor
+    assert find_extractor('https://player.vimeo.com/video/1') is VimeoExtractor
+    assert find_extractor('https://notvimeo.com/1') is None
+
+
+def test_bilibili_dash_picks_avc_video_and_best_audio():
+    extractor = bilibili({'dash': {
+        'video': [
+            {'baseUrl': 'https://upos/1080-hevc.m4s', 'height': 1080, 'bandwidth': 3000, 'codecs': 'hev1.1'},
+            {'baseUrl': 'https://upos/1080-avc.m4s', 'height': 1080, 'bandwidth': 2000, 'codecs': 'avc1.640032'},
+            {'baseUrl': 'https://upos/720-avc.m4s', 'height': 720, 'bandwidth': 1000, 'codecs': 'avc1.64001F'}
+        ],
+        'audio': [{'baseUrl': 'https://upos/30280.m4s', 'bandwidth': 320}],
+        'flac': {'audio': {'base_url': 'https://upos/flac.m4s', 'bandwidth': 900}}
+    }})
+    result = extractor.extract('https://www.bilibili.com/video/BV1xx411c7mD?p=2')
+    
+    assert result.title == '测试视频'
+    assert result.pairs == [('https://upos/1080-avc.m4s', 'https://upos/flac.m4s')]
+    assert result.referer == BilibiliExtractor.referer
+    # 分P参数选择对应的cid
+    assert extractor.session.calls[1][1]['cid'] == 2
+
+
+def test_bilibili_durl_segments_are_concatenated():
+    extractor = bilibili({'durl': [{'url': 'https://upos/part1.flv'}, {'url': 'https://upos/part2.flv'}, {}]})
+    result = extractor.extract('https://www.bilibili.com/video/av170001')
+    
+    assert result.segments == ['https://upos/part1.flv', 'https://upos/part2.flv']
+    assert result.direct == []
+    assert extractor.session.calls[0][1] == {'aid': '170001'}
+    
+    single = bilibili({'durl': [{'url': 'https://upos/whole.flv'}]}).extract('https://www.bilibili.com/video/av1')
+    assert single.direct == ['https://upos/whole.flv']
+    assert single.segments == []
+
+
+def test_bilibili_errors():
+    with pytest.raises(ExtractionError):
+        bilibili({}).extract('https://www.bilibili.com/video/BV1xx411c7mD')
+    with pytest.raises(ExtractionError):
+        bilibili({}).extract('https://www.bilibili.com/bangumi/play/ss1')
+    
+    extractor = BilibiliExtractor()
+    extractor.session = FakeSession({BilibiliExtractor.VIEW_API: {'code': -404, 'message': '啥都木有'}})
+    with pytest.raises(ExtractionError, match='-404'):
+        extractor.extract('https://www.bilibili.com/video/BV1xx411c7mD')
+
+
+def test_vimeo_prefers_progressive_then_hls():
+    extractor = VimeoExtractor()
+    api = VimeoExtractor.CONFIG_API.format(video_id='76979871')
+    extractor.session = FakeSession({api: {
+        'video': {'title': 'clip'},
+        'request': {'files': {'progressive': [
+            {'url': 'https://vod/360.mp4', 'height': 360},
+            {'url': 'https://vod/1080.mp4', 'height': 1080}
+        ]}}
+    }})
+    assert extractor.extract('https://vimeo.com/76979871', 720).direct == ['https://vod/360.mp4']
+    
+    extractor.session = FakeSession({api: {'request': {'files': {'hls': {
+        'default_cdn': 'akfire',
+        'cdns': {'fastly': {'url': 'https://fastly/master.m3u8'}, 'akfire': {'url': 'https://akfire/master.m3u8'}}
+    }}}}})
+    assert extractor.extract('https://vimeo.com/channels/staffpicks/76979871').hls == ['https://akfire/master.m3u8']
+
+
+def test_extract_returns_none_on_failure(monkeypatch):
+    class Broken(BilibiliExtractor):
+        def extract(self, url, quality='best'):
+            raise ExtractionError('需要登录')
+    
+    monkeypatch.setattr(extractors, 'EXTRACTORS', [Broken])
+    assert extractors.extract('https://www.bilibili.com/video/BV1xx411c7mD') is None
+    assert extractors.extract('https://example.com/') is None
@@ -0,0 +1,87 @@
+import sqlite3
+
+import pytest
+
+from utils.history_search import HistorySearchIndex, build_match_query
+
+
+SCHEMA = '''
+    CREATE TABLE download_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        task_id TEXT, url TEXT, title TEXT, status TEXT
+    );
+    CREATE TABLE tags (id INTEGER PRIMARY KEY, name TEXT);
+    CREATE TABLE download_tags (download_id INTEGER, tag_id INTEGER);
+'''
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / 'downloads.db')
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    conn.execute("INSERT INTO download_history (task_id, url, title) VALUES ('t0', 'https://www.bilibili.com/video/BV1', '旧记录 concert')")
+    conn.commit()
+    yield path, conn
+    conn.close()
+
+
+def test_build_match_query_prefix_and_columns():
+    assert build_match_query('cat video') == '"cat"* AND "video"*'
+    assert build_match_query('site:bilibili live') == 'site : "bilibili"* AND "live"*'
+    assert build_match_query('say "hi"') == '"say"* AND """hi"""*'
+    assert build_match_query('   ') == ''
+
+
+def test_existing_rows_are_backfilled(db):
+    path, _ = db
+    index = HistorySearchIndex(path)
+    results = index.search('conc')
+    assert [r['task_id'] for r in results] == ['t0']
+    assert results[0]['title_highlight'] == '旧记录 <mark>concert</mark>'
+    index.close()
+
+
+def test_triggers_follow_inserts_updates_and_deletes(db):
+    path, conn = db
+    index = HistorySearchIndex(path)
+    
+    # 其他连接（DatabaseManager）的写入同样由触发器同步
+    conn.execute("INSERT INTO download_history (task_id, url, title) VALUES ('t1', 'https://vimeo.com/42', 'Alpine hike')")
+    conn.commit()
+    assert [r['task_id'] for r in index.search('alp')] == ['t1']
+    assert [r['task_id'] for r in index.search('site:vimeo')] == ['t1']
+    
+    conn.execute("UPDATE download_history SET title = 'Desert ride' WHERE task_id = 't1'")
+    conn.commit()
+    assert index.search('alpine') == []
+    assert [r['task_id'] for r in index.search('desert')] == ['t1']
+    
+    conn.execute("DELETE FROM download_history WHERE task_id = 't1'")
+    conn.commit()
+    assert index.search('desert') == []
+    index.close()
+
+
+def test_tag_changes_update_the_index(db):
+    path, conn = db
+    index = HistorySearchIndex(path)
+    conn.execute("INSERT INTO tags (id, name) VALUES (1, 'favorite')")
+    conn.execute("INSERT INTO download_tags (download_id, tag_id) VALUES (1, 1)")
+    conn.commit()
+    assert [r['task_id'] for r in index.search('tags:fav')] == ['t0']
+    
+    conn.execute("DELETE FROM download_tags WHERE download_id = 1")
+    conn.commit()
+    assert index.search('tags:fav') == []
+    index.close()
+
+
+def test_title_matches_rank_above_url_matches(db):
+    path, conn = db
+    conn.execute("INSERT INTO download_history (task_id, url, title) VALUES ('url', 'https://example.com/ocean.mp4', 'clip')")
+    conn.execute("INSERT INTO download_history (task_id, url, title) VALUES ('title', 'https://example.com/a.mp4', 'ocean')")
+    conn.commit()
+    index = HistorySearchIndex(path)
+    assert [r['task_id'] for r in index.search('ocean')] == ['title', 'url']
+    index.close()
@@ -0,0 +1,73 @@
+import sqlite3
+
+import pytest
+
+from utils.history_writer import HistoryWriter
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / 'downloads.db')
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE download_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task_id TEXT UNIQUE, url TEXT, resource_type TEXT, output_path TEXT,
+            status TEXT, file_size INTEGER, error_message TEXT,
+            updated_at TIMESTAMP, completed_at TIMESTAMP
+        )
+    ''')
+    conn.commit()
+    conn.close()
+    return path
+
+
+def rows(path):
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    result = {row['task_id']: dict(row) for row in conn.execute('SELECT * FROM download_history')}
+    conn.close()
+    return result
+
+
+def test_updates_in_one_batch_are_coalesced(path):
+    writer = HistoryWriter(path=path, flush_interval=0.05)
+    writer._write_batch([
+        ('add', ('t1', 'https://example.com/a.mp4', 'video', 'downloads/a.mp4')),
+        ('update', ('t1', {'status': 'running', 'error_message': None, 'file_size': 100})),
+        ('update', ('t1', {'status': 'failed', 'error_message': 'timeout'})),
+        ('update', ('t1', {'status': 'completed', 'error_message': None}))
+    ])
+    row = rows(path)['t1']
+    # 最后一次状态更新生效，之前提供的文件大小保留，上次的错误信息被清除
+    assert (row['status'], row['file_size'], row['error_message']) == ('completed', 100, None)
+    assert row['completed_at'] is not None
+    writer.close()
+
+
+def test_retry_clears_previous_error(path):
+    writer = HistoryWriter(path=path, flush_interval=0.05)
+    writer.add_download_record('t1', 'https://example.com/a.mp4')
+    writer.update_download_status('t1', 'failed', error_message='HTTP 503')
+    assert writer.flush(timeout=5)
+    assert rows(path)['t1']['error_message'] == 'HTTP 503'
+    
+    writer.update_download_status('t1', 'running')
+    writer.close()
+    row = rows(path)['t1']
+    assert (row['status'], row['error_message'], row['completed_at']) == ('running', None, None)
+
+
+def test_failed_batch_is_retried_row_by_row(path):
+    writer = HistoryWriter(path=path, flush_interval=0.05)
+    writer._write_batch([('add', ('t1', 'u1', 'video', ''))])
+    # t1重复插入违反唯一约束，整批回滚后逐条重试，其他操作仍然写入
+    writer._write_batch([
+        ('add', ('t1', 'u1', 'video', '')),
+        ('add', ('t2', 'u2', 'video', '')),
+        ('update', ('t1', {'status': 'completed', 'error_message': None}))
+    ])
+    result = rows(path)
+    assert set(result) == {'t1', 't2'}
+    assert result['t1']['status'] == 'completed'
+    writer.close()
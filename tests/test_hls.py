@@ -0,0 +1,117 @@
+import random
+import threading
+import time
+
+import pytest
+
+from utils.hls import HLSPipelineDownloader, container_extension, parse_playlist, pick_audio_rendition
+
+
+MASTER = '''#EXTM3U
+#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="aud",NAME="English",LANGUAGE="en",DEFAULT=YES,URI="audio/en.m3u8"
+#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="aud",NAME="Deutsch",LANGUAGE="de",URI="audio/de.m3u8"
+#EXT-X-STREAM-INF:BANDWIDTH=800000,RESOLUTION=640x360,AUDIO="aud"
+360p/index.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=5000000,RESOLUTION=1920x1080,CODECS="avc1.640028,mp4a.40.2",AUDIO="aud"
+https://cdn.example.com/1080p/index.m3u8
+'''
+
+MEDIA = '''#EXTM3U
+#EXT-X-MEDIA-SEQUENCE:7
+#EXT-X-MAP:URI="init.mp4",BYTERANGE="720@0"
+#EXT-X-KEY:METHOD=AES-128,URI="key.bin",IV=0x1
+#EXTINF:4.0,
+seg7.m4s
+#EXT-X-KEY:METHOD=NONE
+#EXT-X-BYTERANGE:1000@720
+#EXTINF:4.0,
+all.m4s
+#EXT-X-BYTERANGE:500
+#EXTINF:4.0,
+all.m4s
+'''
+
+
+def test_master_playlist_variants_and_renditions():
+    playlist = parse_playlist(MASTER, 'https://example.com/hls/master.m3u8')
+    assert [(v['url'], v['bandwidth'], v['resolution'], v['audio']) for v in playlist['variants']] == [
+        ('https://example.com/hls/360p/index.m3u8', 800000, '640x360', 'aud'),
+        ('https://cdn.example.com/1080p/index.m3u8', 5000000, '1920x1080', 'aud')
+    ]
+    audio = pick_audio_rendition(playlist['renditions'], 'aud')
+    assert (audio['url'], audio['language']) == ('https://example.com/hls/audio/en.m3u8', 'en')
+    assert pick_audio_rendition(playlist['renditions'], None) is None
+    assert pick_audio_rendition(playlist['renditions'], 'other') is None
+
+
+def test_media_playlist_sequence_keys_and_byteranges():
+    segments = parse_playlist(MEDIA, 'https://example.com/hls/1080p/index.m3u8')['segments']
+    assert [(s['url'].rsplit('/', 1)[1], s['sequence'], s['byterange']) for s in segments] == [
+        ('init.mp4', None, (0, 720)),
+        ('seg7.m4s', 7, None),
+        ('all.m4s', 8, (720, 1000)),
+        ('all.m4s', 9, (1720, 500))
+    ]
+    assert segments[1]['key'] == {'method': 'AES-128', 'uri': 'https://example.com/hls/1080p/key.bin', 'iv': '0x1'}
+    assert segments[2]['key'] is None
+    assert container_extension(segments) == '.mp4'
+    assert container_extension(segments[1:]) == '.ts'
+
+
+class FakeResponse:
+    def __init__(self, content):
+        self.content = content
+    
+    def raise_for_status(self):
+        pass
+
+
+class SlowSession:
+    """随机延迟返回分片，完成顺序与请求顺序不同"""
+    
+    def __init__(self, bodies):
+        self.bodies = bodies
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+    
+    def get(self, url, headers=None, timeout=None):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(random.uniform(0, 0.02))
+        with self._lock:
+            self.active -= 1
+        return FakeResponse(self.bodies[url])
+
+
+def test_prefetch_window_writes_segments_in_order(tmp_path):
+    bodies = {f'https://example.com/s{i}.ts': f'<{i}>'.encode() for i in range(40)}
+    segments = [{'url': url, 'sequence': i, 'key': None, 'byterange': None} for i, url in enumerate(bodies)]
+    session = SlowSession(bodies)
+    downloader = HLSPipelineDownloader(output_dir=str(tmp_path), prefetch=4, session=session)
+    
+    output = tmp_path / 'out.ts'
+    downloader.download_segments(segments, str(output))
+    assert output.read_bytes() == b''.join(bodies.values())
+    assert 1 < session.peak <= 4
+
+
+def test_aes_128_segments_are_decrypted(tmp_path):
+    AES = pytest.importorskip('Crypto.Cipher.AES')
+    key = bytes(range(16))
+    plain = b'segment payload'
+    padded = plain + bytes([16 - len(plain) % 16]) * (16 - len(plain) % 16)
+    iv = (3).to_bytes(16, 'big')
+    session = SlowSession({
+        'https://example.com/key.bin': key,
+        'https://example.com/s3.ts': AES.new(key, AES.MODE_CBC, iv).encrypt(padded)
+    })
+    segment = {
+        'url': 'https://example.com/s3.ts',
+        'sequence': 3,
+        'key': {'method': 'AES-128', 'uri': 'https://example.com/key.bin', 'iv': None},
+        'byterange': None
+    }
+    downloader = HLSPipelineDownloader(output_dir=str(tmp_path), session=session)
+    assert downloader._fetch_segment(segment) == plain
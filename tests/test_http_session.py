@@ -0,0 +1,71 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from utils.http_session import SessionFactory, apply_cookies, mount_shared_adapter, get_session_factory
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    clients = set()
+    
+    def do_GET(self):
+        Handler.clients.add(self.client_address)
+        body = (self.headers.get('Cookie') or '').encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    Handler.clients = set()
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_sessions_share_keep_alive_connections(server):
+    factory = SessionFactory()
+    first = factory.create_session(cookies={'a': '1'})
+    second = factory.create_session(referer='https://example.com/')
+    for session in (first, second, first):
+        session.get(server + '/page').close()
+    # 三个请求复用同一个TCP连接
+    assert len(Handler.clients) == 1
+
+
+def test_sessions_keep_separate_state(server):
+    factory = SessionFactory()
+    first = factory.create_session(cookies={'a': '1'}, proxy='http://proxy.invalid:8080')
+    second = factory.create_session(referer='https://example.com/')
+    assert first.get_adapter('https://x') is second.get_adapter('https://x')
+    assert first.proxies == {'http': 'http://proxy.invalid:8080', 'https': 'http://proxy.invalid:8080'}
+    assert second.proxies == {} and 'Referer' not in first.headers
+    assert second.get(server + '/').text == ''
+
+
+def test_apply_cookies_accepts_selenium_cookie_dicts():
+    session = requests.Session()
+    apply_cookies(session, [
+        {'name': 'sid', 'value': 'abc', 'domain': '.example.com', 'path': '/'},
+        {'value': 'ignored'}
+    ])
+    assert session.cookies.get('sid', domain='.example.com') == 'abc'
+    assert len(session.cookies) == 1
+
+
+def test_mount_shared_adapter():
+    session = requests.Session()
+    assert mount_shared_adapter(session)
+    assert session.get_adapter('https://example.com/') is get_session_factory().adapter
+    assert not mount_shared_adapter(object())
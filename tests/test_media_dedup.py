@@ -0,0 +1,42 @@
+from utils.media_dedup import canonical_media_key, dedupe_media_urls
+
+
+def test_signed_cdn_ignores_signature_and_expiry():
+    a = 'https://d1.cloudfront.net/v/clip.mp4?Expires=1700000000&Signature=abc&Key-Pair-Id=K1&t=5'
+    b = 'http://d1.cloudfront.net/v/clip.mp4?t=9&Signature=xyz&Expires=1700009999#start'
+    assert canonical_media_key(a) == canonical_media_key(b) == 'd1.cloudfront.net/v/clip.mp4'
+
+
+def test_mirror_hosts_share_a_key():
+    a = 'https://upos-sz-mirrorcos.bilivideo.com/upgcxcode/12/34/video.m4s?e=ig8euxZM&deadline=1700000000&uipk=5'
+    b = 'https://cn-gdfs-ct-01-08.bilivideo.com/upgcxcode/12/34/video.m4s?e=other&deadline=1700003600&os=bcache'
+    assert canonical_media_key(a) == canonical_media_key(b) == 'bilivideo.com/upgcxcode/12/34/video.m4s'
+
+
+def test_googlevideo_keeps_only_id_and_itag():
+    a = 'https://rr3---sn-abc.googlevideo.com/videoplayback?id=o-AB&itag=137&range=0-1000&sig=1&expire=2'
+    b = 'https://rr5---sn-xyz.googlevideo.com/videoplayback?itag=137&expire=3&id=o-AB'
+    assert canonical_media_key(a) == canonical_media_key(b)
+    assert canonical_media_key(a) != canonical_media_key(b.replace('itag=137', 'itag=140'))
+
+
+def test_generic_params_identify_media_on_unsigned_hosts():
+    # 非签名CDN上的f、t只有值像签名或时间戳时才忽略
+    assert canonical_media_key('https://example.com/play.mp4?f=1') != canonical_media_key('https://example.com/play.mp4?f=2')
+    assert canonical_media_key('https://example.com/play.mp4?t=1700000000') == 'example.com/play.mp4'
+
+
+def test_byte_ranges_and_param_order():
+    a = 'https://example.com/v.mp4?id=7&range=0-1023&lang=en'
+    b = 'https://EXAMPLE.com:443/v.mp4?lang=en&id=7&range=1024-2047'
+    assert canonical_media_key(a) == canonical_media_key(b) == 'example.com/v.mp4?id=7&lang=en'
+    assert canonical_media_key('https://example.com:8080/v.mp4') == 'example.com:8080/v.mp4'
+
+
+def test_dedupe_keeps_first_occurrence():
+    urls = [
+        'https://d1.cloudfront.net/a.mp4?Signature=1',
+        'https://d1.cloudfront.net/b.mp4',
+        'https://d1.cloudfront.net/a.mp4?Signature=2'
+    ]
+    assert dedupe_media_urls(urls) == urls[:2]
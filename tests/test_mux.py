@@ -0,0 +1,132 @@
+import os
+import struct
+import sys
+import textwrap
+
+import pytest
+
+from utils import mux
+from utils.mux import StreamingMuxer, concat_files, needs_seeking
+
+
+def box(name, payload=b''):
+    return struct.pack('>I4s', 8 + len(payload), name) + payload
+
+
+FTYP = box(b'ftyp', b'isom\0\0\0\0')
+
+
+def test_faststart_and_fragmented_mp4_stream():
+    assert not needs_seeking(FTYP + box(b'moov', b'x' * 20) + box(b'mdat', b'y' * 20))
+    assert not needs_seeking(FTYP + box(b'free') + box(b'moof') + box(b'mdat'))
+
+
+def test_moov_after_mdat_needs_seeking():
+    assert needs_seeking(FTYP + box(b'mdat', b'y' * 100) + box(b'moov'))
+    # 64位大小的mdat
+    large = struct.pack('>I4sQ', 1, b'mdat', 16 + 4) + b'data'
+    assert needs_seeking(FTYP + large + box(b'moov'))
+    # 头部中找不到moov
+    assert needs_seeking(FTYP + box(b'free', b'z' * 50))
+
+
+def test_other_containers_stream():
+    assert not needs_seeking(b'\x1a\x45\xdf\xa3' + b'\0' * 60)
+    assert not needs_seeking(b'\x47' + b'\0' * 187)
+
+
+FAKE_FFMPEG = '''
+    #!{python}
+    import sys
+    args = sys.argv[1:]
+    inputs = [args[i + 1] for i, arg in enumerate(args) if arg == '-i']
+    if '-f' in args and args[args.index('-f') + 1] == 'concat':
+        # concat分离器：按文件列表顺序拼接
+        with open(inputs[0], encoding='utf-8') as listing:
+            inputs = [line[6:-1].replace("'\\\\''", "'") for line in listing.read().splitlines()]
+    with open(args[-1], 'wb') as output:
+        for path in inputs:
+            with open(path, 'rb') as f:
+                output.write(f.read())
+'''
+
+
+@pytest.fixture
+def fake_ffmpeg(tmp_path, monkeypatch):
+    path = tmp_path / 'ffmpeg'
+    path.write_text(textwrap.dedent(FAKE_FFMPEG).lstrip().format(python=sys.executable))
+    path.chmod(0o755)
+    monkeypatch.setattr(mux, 'find_ffmpeg', lambda: str(path))
+    return path
+
+
+class FakeResponse:
+    def __init__(self, body):
+        self.body = body
+        self.closed = False
+    
+    def raise_for_status(self):
+        pass
+    
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.body), chunk_size):
+            yield self.body[i:i + chunk_size]
+    
+    def close(self):
+        self.closed = True
+
+
+class FakeSession:
+    def __init__(self, bodies):
+        self.bodies = bodies
+        self.responses = []
+    
+    def get(self, url, **kwargs):
+        response = FakeResponse(self.bodies[url])
+        self.responses.append(response)
+        return response
+
+
+@pytest.mark.skipif(not hasattr(os, 'mkfifo'), reason='需要命名管道')
+def test_streaming_merge_feeds_both_pipes(tmp_path, fake_ffmpeg):
+    video = FTYP + box(b'moov') + box(b'mdat', b'v' * 300000)
+    audio = b'\x1a\x45\xdf\xa3' + b'a' * 100000
+    session = FakeSession({'v': video, 'a': audio})
+    output = tmp_path / 'out.mp4'
+    
+    assert StreamingMuxer(session=session, chunk_size=4096).merge('v', 'a', str(output)) == str(output)
+    assert output.read_bytes() == video + audio
+    assert all(response.closed for response in session.responses)
+
+
+def test_streaming_merge_declines_non_faststart_input(tmp_path, fake_ffmpeg):
+    video = FTYP + box(b'mdat', b'v' * 1000) + box(b'moov')
+    session = FakeSession({'v': video, 'a': b'\x1a\x45\xdf\xa3'})
+    assert StreamingMuxer(session=session).merge('v', 'a', str(tmp_path / 'out.mp4')) is None
+    assert all(response.closed for response in session.responses)
+
+
+def test_ffmpeg_helpers_fail_cleanly_without_ffmpeg(tmp_path, monkeypatch):
+    monkeypatch.setattr(mux, 'find_ffmpeg', lambda: None)
+    assert mux.mux_streams('v', 'a', str(tmp_path / 'o.mp4')) is None
+    assert mux.remux('v.ts', str(tmp_path / 'o.mp4')) is None
+    assert not StreamingMuxer(session=FakeSession({})).is_supported()
+
+
+def test_concat_files_in_order(tmp_path, fake_ffmpeg):
+    parts = []
+    for index, name in enumerate(["seg-1.flv", "it's-2.flv", "seg 3.flv"]):
+        path = tmp_path / name
+        path.write_bytes(f'part{index}'.encode())
+        parts.append(str(path))
+    
+    output = str(tmp_path / 'joined.flv')
+    assert concat_files(parts, output) == output
+    assert open(output, 'rb').read() == b'part0part1part2'
+    # 临时文件列表已删除
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.txt')]
+
+
+def test_concat_files_without_ffmpeg(tmp_path, monkeypatch):
+    monkeypatch.setattr(mux, 'find_ffmpeg', lambda: None)
+    assert concat_files([str(tmp_path / 'a.flv')], str(tmp_path / 'out.flv')) is None
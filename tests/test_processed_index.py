@@ -0,0 +1,98 @@
+import os
+import sqlite3
+
+from utils.processed_index import ProcessedFileIndex, process_directory_incremental
+
+
+class FakeHandler:
+    def __init__(self):
+        self.directories = []
+    
+    def batch_process_directory(self, directory):
+        self.directories.append(directory)
+        return []
+
+
+def age(path, seconds=60):
+    # 把目录修改时间调到过去，避开刚修改过的目录不记录的保护
+    past = os.stat(path).st_mtime_ns - seconds * 1_000_000_000
+    os.utime(path, ns=(past, past))
+
+
+def test_unchanged_directory_reuses_indexed_signatures(tmp_path):
+    directory = tmp_path / 'downloads'
+    directory.mkdir()
+    (directory / 'a.mp4').write_bytes(b'a' * 10)
+    age(directory)
+    index = ProcessedFileIndex(str(directory), str(tmp_path / 'index.db'))
+    index.mark(['a.mp4'])
+    index.scan()
+    
+    # 原地改写不会改变目录修改时间，已记录的文件直接沿用索引中的签名
+    (directory / 'a.mp4').write_bytes(b'a' * 20)
+    age(directory, 120)
+    index.conn.execute('UPDATE scanned_directories SET mtime_ns = ?', (os.stat(directory).st_mtime_ns,))
+    assert index.scan()['a.mp4'][0] == 10
+    assert index.pending_files() == []
+    
+    # 新增文件改变目录修改时间，整个目录重新stat
+    (directory / 'b.mp4').write_bytes(b'b')
+    files = index.scan()
+    assert files['a.mp4'][0] == 20
+    assert index.pending_files(files) == ['a.mp4', 'b.mp4']
+    index.close()
+
+
+def test_recently_modified_directory_is_not_recorded(tmp_path):
+    directory = tmp_path / 'downloads'
+    directory.mkdir()
+    (directory / 'a.mp4').write_bytes(b'a')
+    index = ProcessedFileIndex(str(directory), str(tmp_path / 'index.db'))
+    index.scan()
+    assert index.conn.execute('SELECT COUNT(*) FROM scanned_directories').fetchone()[0] == 0
+    
+    age(directory)
+    index.scan()
+    assert index.conn.execute('SELECT path FROM scanned_directories').fetchall() == [('.',)]
+    index.close()
+
+
+def test_incremental_pass_prunes_missing_files(tmp_path):
+    directory = tmp_path / 'downloads'
+    directory.mkdir()
+    (directory / 'a.mp4').write_bytes(b'a')
+    (directory / 'b.mp4').write_bytes(b'b')
+    db_path = str(tmp_path / 'index.db')
+    index = ProcessedFileIndex(str(directory), db_path)
+    index.mark(['a.mp4', 'b.mp4'])
+    index.close()
+    
+    os.remove(directory / 'b.mp4')
+    handler = FakeHandler()
+    assert process_directory_incremental(handler, str(directory), db_path=db_path) == []
+    assert handler.directories == []
+    
+    conn = sqlite3.connect(db_path)
+    assert conn.execute('SELECT path FROM processed_files').fetchall() == [('a.mp4',)]
+    conn.close()
+
+
+def test_incremental_pass_only_stages_new_files(tmp_path):
+    directory = tmp_path / 'downloads'
+    directory.mkdir()
+    (directory / 'a.mp4').write_bytes(b'a')
+    db_path = str(tmp_path / 'index.db')
+    index = ProcessedFileIndex(str(directory), db_path)
+    index.mark(['a.mp4'])
+    index.close()
+    
+    (directory / 'b.mp4').write_bytes(b'b')
+    staged = []
+    handler = FakeHandler()
+    handler.batch_process_directory = lambda path: staged.extend(sorted(os.listdir(path))) or []
+    process_directory_incremental(handler, str(directory), db_path=db_path)
+    assert staged == ['b.mp4']
+    
+    index = ProcessedFileIndex(str(directory), db_path)
+    assert index.pending_files() == []
+    index.close()
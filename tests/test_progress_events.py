@@ -0,0 +1,122 @@
+import json
+import time
+
+import pytest
+
+from utils import progress_events
+from utils.progress_events import ProgressBroadcaster, Subscription
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+    
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(progress_events, 'time', fake)
+    return fake
+
+
+def by_task(deltas):
+    return {delta['task_id']: delta for delta in deltas}
+
+
+def test_updates_within_interval_are_merged(clock):
+    subscription = Subscription(min_interval=1.0)
+    subscription.offer('a', {'progress': 1})
+    assert subscription.get(timeout=0) == [{'task_id': 'a', 'progress': 1}]
+    
+    subscription.offer('a', {'progress': 5, 'downloaded': 50})
+    subscription.offer('a', {'progress': 9})
+    assert subscription.get(timeout=0) == []
+    
+    clock.now += 1.0
+    assert subscription.get(timeout=0) == [{'task_id': 'a', 'progress': 9, 'downloaded': 50}]
+
+
+def test_interval_is_tracked_per_task(clock):
+    subscription = Subscription(min_interval=1.0)
+    subscription.offer('a', {'progress': 1})
+    assert len(subscription.get(timeout=0)) == 1
+    
+    # a还在间隔内，第一次出现的b立即推送
+    clock.now += 0.5
+    subscription.offer('a', {'progress': 2})
+    subscription.offer('b', {'progress': 1})
+    assert subscription.get(timeout=0) == [{'task_id': 'b', 'progress': 1}]
+    
+    subscription.offer('b', {'progress': 2})
+    clock.now += 0.5
+    assert subscription.get(timeout=0) == [{'task_id': 'a', 'progress': 2}]
+    clock.now += 0.5
+    assert subscription.get(timeout=0) == [{'task_id': 'b', 'progress': 2}]
+
+
+def test_final_status_only_flushes_its_own_task(clock):
+    subscription = Subscription(min_interval=1.0)
+    subscription.offer('a', {'progress': 1})
+    subscription.offer('b', {'progress': 1})
+    assert len(subscription.get(timeout=0)) == 2
+    
+    subscription.offer('a', {'progress': 50})
+    subscription.offer('b', {'status': 'completed', 'progress': 100}, final=True)
+    assert subscription.get(timeout=0) == [{'task_id': 'b', 'status': 'completed', 'progress': 100}]
+    assert subscription.get(timeout=0) == []
+    
+    # 结束的任务不再占用间隔记录
+    assert 'b' not in subscription._last_sent
+    clock.now += 1.0
+    assert subscription.get(timeout=0) == [{'task_id': 'a', 'progress': 50}]
+
+
+def test_get_waits_until_task_interval_ends():
+    subscription = Subscription(min_interval=0.1)
+    subscription.offer('a', {'progress': 1})
+    subscription.get(timeout=0)
+    subscription.offer('a', {'progress': 2})
+    
+    started = time.monotonic()
+    assert subscription.get(timeout=5) == [{'task_id': 'a', 'progress': 2}]
+    assert 0.05 <= time.monotonic() - started < 1
+
+
+def test_broadcaster_filters_and_versions(clock):
+    broadcaster = ProgressBroadcaster(min_interval=1.0)
+    everything = broadcaster.subscribe()
+    only_b = broadcaster.subscribe(['b'])
+    assert broadcaster.subscriber_count() == 2
+    
+    report = broadcaster.progress_reporter('a')
+    report(25, 100)
+    broadcaster.publish('b', {'status': 'failed', 'error_message': 'timeout'})
+    
+    deltas = by_task(everything.get(timeout=0))
+    assert deltas['a']['progress'] == 25.0
+    assert deltas['a']['downloaded'] == 25
+    assert deltas['b']['status'] == 'failed'
+    assert deltas['b']['version'] > deltas['a']['version']
+    assert [delta['task_id'] for delta in only_b.get(timeout=0)] == ['b']
+    
+    broadcaster.unsubscribe(only_b)
+    assert broadcaster.subscriber_count() == 1
+
+
+def test_stream_formats_sse_and_unsubscribes(clock):
+    broadcaster = ProgressBroadcaster()
+    subscription = broadcaster.subscribe()
+    broadcaster.publish('a', {'progress': 10})
+    
+    messages = broadcaster.stream(subscription, keepalive=0)
+    assert next(messages) == 'retry: 3000\n\n'
+    event = next(messages)
+    assert event.startswith('event: progress\ndata: ')
+    assert json.loads(event.split('data: ', 1)[1])[0]['progress'] == 10
+    assert next(messages) == ': keepalive\n\n'
+    
+    messages.close()
+    assert broadcaster.subscriber_count() == 0
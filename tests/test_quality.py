@@ -0,0 +1,74 @@
+import pytest
+
+from utils.quality import (
+    height_from_url, load_quality_preference, parse_quality, parse_resolution, pick_variant,
+    platform_of, rank_variants
+)
+
+
+VARIANTS = [
+    {'name': '480', 'height': 480, 'bandwidth': 1_000_000},
+    {'name': '1080', 'height': 1080, 'bandwidth': 5_000_000},
+    {'name': '720', 'height': 720, 'bandwidth': 2_500_000},
+    {'name': '720-low', 'height': 720, 'bandwidth': 1_500_000},
+    {'name': 'unknown', 'bandwidth': 3_000_000}
+]
+
+
+def names(variants):
+    return [variant['name'] for variant in variants]
+
+
+def test_parse_quality():
+    assert parse_quality(None) == 'best'
+    assert parse_quality(' Worst ') == 'worst'
+    assert parse_quality('1080p') == 1080
+    assert parse_quality(720) == 720
+    with pytest.raises(ValueError):
+        parse_quality('hd')
+
+
+def test_resolution_and_height_from_url():
+    assert parse_resolution('RESOLUTION=1920x1080') == (1920, 1080)
+    assert parse_resolution('1280 × 720') == (1280, 720)
+    assert parse_resolution(None) == (0, 0)
+    assert height_from_url('https://cdn.example.com/720p/index.m3u8?q=1080p') == 720
+    assert height_from_url('https://cdn.example.com/video.mp4') == 0
+
+
+def test_rank_best_and_worst():
+    assert names(rank_variants(VARIANTS, 'best')) == ['1080', '720', '720-low', '480', 'unknown']
+    # 未知高度排在已知的之后
+    assert names(rank_variants(VARIANTS, 'worst')) == ['480', '720-low', '720', '1080', 'unknown']
+
+
+def test_rank_target_height():
+    # 不超过目标的最高画质优先，其次是超过目标的最低画质，未知高度最后
+    assert names(rank_variants(VARIANTS, 720)) == ['720', '720-low', '480', '1080', 'unknown']
+    assert names(rank_variants(VARIANTS, 360)) == ['480', '720', '720-low', '1080', 'unknown']
+
+
+def test_pick_variant_reads_resolution():
+    variants = [
+        {'bandwidth': 800_000, 'resolution': '640x360'},
+        {'bandwidth': 5_000_000, 'resolution': '1920x1080'},
+        {'bandwidth': 2_000_000, 'resolution': '1280x720'}
+    ]
+    assert pick_variant(variants, 'best')['resolution'] == '1920x1080'
+    assert pick_variant(variants, 720)['resolution'] == '1280x720'
+    assert pick_variant(variants, 'worst')['resolution'] == '640x360'
+    assert pick_variant([], 'best') is None
+
+
+def test_platform_preference_overrides_default(tmp_path):
+    config = tmp_path / 'config.ini'
+    config.write_text('[download]\nquality = 720p\n[platforms]\nbilibili_quality = 1080p\nyoutube_quality = nonsense\n',
+                      encoding='utf-8')
+    
+    assert platform_of('https://upos-sz.bilivideo.com/x.m4s') == 'bilibili'
+    assert platform_of('https://notbilibili.com/') is None
+    assert load_quality_preference('https://www.bilibili.com/video/BV1', str(config)) == 1080
+    assert load_quality_preference('https://example.com/', str(config)) == 720
+    # 无效的设置回退为best
+    assert load_quality_preference('https://youtu.be/x', str(config)) == 'best'
+    assert load_quality_preference(None, str(tmp_path / 'missing.ini')) == 'best'
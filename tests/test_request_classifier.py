@@ -0,0 +1,84 @@
+from utils.request_classifier import (
+    RequestClassifier, classify_request, contains_keyword, is_high_confidence, url_extension
+)
+
+
+def req(url, mime_type='', size=0, kind=''):
+    return {'url': url, 'method': 'GET', 'type': kind, 'status': 200, 'mime_type': mime_type, 'size': size, 'headers': {}}
+
+
+REQUESTS = [
+    req('https://example.com/index.html', 'text/html'),
+    req('https://cdn.example.com/live/index.m3u8?token=1'),
+    req('https://cdn.example.com/manifest', 'application/dash+xml'),
+    req('https://cdn.example.com/seg-1.ts'),
+    req('https://upos.example.com/1080/video-30080.m4s', 'video/mp4', 5 * 1024 * 1024),
+    req('https://upos.example.com/audio/audio-30280.m4s', 'audio/mp4', 512 * 1024),
+    req('https://cdn.example.com/stream', 'video/mp4', 1000),
+    req('https://cdn.example.com/live/index.m3u8?token=1')
+]
+
+
+def test_url_extension_ignores_query_and_directories():
+    assert url_extension('https://a/b/C.MP4?x=1.ts#y') == '.mp4'
+    assert url_extension('https://a/v1.0/play') == ''
+    assert contains_keyword('https://a/Movie.mp4', ['movie'])
+
+
+def test_classify_request_prefers_extension_then_mime():
+    assert classify_request(req('https://a/x.m3u8', 'video/mp4')) == 'hls'
+    assert classify_request(req('https://a/play', 'application/x-mpegURL')) == 'hls'
+    assert classify_request(req('https://a/play', 'video/mp2t')) == 'segments'
+    assert classify_request(req('https://a/play', kind='Media')) == 'direct'
+    assert classify_request(req('https://a/app.js', 'text/javascript')) is None
+
+
+def test_high_confidence_needs_manifest_video_file_or_large_response():
+    assert is_high_confidence(req('https://a/x.mpd'))
+    assert is_high_confidence(req('https://a/x.webm'))
+    assert is_high_confidence(req('https://a/play', 'video/mp4', 2 * 1024 * 1024))
+    assert not is_high_confidence(req('https://a/play', 'video/mp4', 1000))
+    assert not is_high_confidence(req('https://a/seg.ts'))
+
+
+def test_single_pass_classification():
+    result = RequestClassifier().classify(REQUESTS)
+    
+    assert len(result.tags) == len(REQUESTS)
+    assert result.tags[0] == {'kind': None, 'confidence': None, 'keywords': [], 'role': None}
+    assert result.candidates['high_confidence'] == [
+        'https://cdn.example.com/live/index.m3u8?token=1',
+        'https://cdn.example.com/manifest'
+    ]
+    assert result.candidates['medium_confidence'] == ['https://cdn.example.com/stream']
+    assert result.streams['hls'] == ['https://cdn.example.com/live/index.m3u8?token=1']
+    assert result.streams['dash'] == ['https://cdn.example.com/manifest']
+    assert result.streams['direct'] == ['https://cdn.example.com/stream']
+    assert result.streams['segments'] == [
+        'https://cdn.example.com/seg-1.ts',
+        'https://upos.example.com/1080/video-30080.m4s',
+        'https://upos.example.com/audio/audio-30280.m4s'
+    ]
+    # 重复的请求保留在media中，但各URL列表去重
+    assert len(result.media) == 7
+    assert result.separate == {
+        'has_separate': True,
+        'video_urls': ['https://upos.example.com/1080/video-30080.m4s', 'https://cdn.example.com/stream'],
+        'audio_urls': ['https://upos.example.com/audio/audio-30280.m4s']
+    }
+
+
+def test_keywords_filter_media_but_not_candidates():
+    result = RequestClassifier(['UPOS', 'upos.example', '']).classify(REQUESTS)
+    
+    assert result.candidates['keyword_matches'] == [
+        'https://upos.example.com/1080/video-30080.m4s',
+        'https://upos.example.com/audio/audio-30280.m4s'
+    ]
+    # 置信度候选不受关键词影响
+    assert 'https://cdn.example.com/manifest' in result.candidates['high_confidence']
+    assert [r['url'] for r in result.media] == result.candidates['keyword_matches']
+    assert result.streams['hls'] == []
+    # 长关键词优先匹配，不会被前缀截断
+    assert result.tags[4]['keywords'] == ['upos.example']
+    assert result.separate['has_separate']
@@ -0,0 +1,137 @@
+import json
+import os
+import threading
+
+import pytest
+
+from utils.segmented import SegmentedDownloader
+
+
+MB = 1024 * 1024
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=b'', headers=None):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.body = body
+        self.headers = headers or {}
+    
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.body), chunk_size):
+            yield self.body[i:i + chunk_size]
+    
+    def close(self):
+        pass
+
+
+class FakeSession:
+    """按URL提供内存中的文件，支持HEAD和Range请求，记录每个请求"""
+    
+    def __init__(self, files, ranges=True):
+        self.files = files
+        self.ranges = ranges
+        self.requests = []
+        self._lock = threading.Lock()
+    
+    def head(self, url, **kwargs):
+        with self._lock:
+            self.requests.append(('HEAD', url, None))
+        body = self.files[url]
+        headers = {'Content-Length': str(len(body))}
+        if self.ranges:
+            headers['Accept-Ranges'] = 'bytes'
+        return FakeResponse(200, headers=headers)
+    
+    def get(self, url, headers=None, **kwargs):
+        byte_range = (headers or {}).get('Range')
+        with self._lock:
+            self.requests.append(('GET', url, byte_range))
+        body = self.files[url]
+        if not byte_range or not self.ranges:
+            return FakeResponse(200, body)
+        start, end = (int(v) for v in byte_range[len('bytes='):].split('-'))
+        return FakeResponse(206, body[start:end + 1], {'Content-Range': f'bytes {start}-{end}/{len(body)}'})
+    
+    def ranges_for(self, url):
+        return sorted(r for method, u, r in self.requests if method == 'GET' and u == url and r)
+
+
+def payload(size):
+    return bytes(i % 251 for i in range(size))
+
+
+@pytest.fixture
+def files():
+    return {
+        'https://cdn.example.com/big.mp4': payload(3 * MB + 12345),
+        'https://cdn.example.com/small.mp4': payload(1000)
+    }
+
+
+def downloader(tmp_path, session, **kwargs):
+    kwargs.setdefault('connections', 3)
+    kwargs.setdefault('chunk_size', MB)
+    kwargs.setdefault('min_size', 2 * MB)
+    return SegmentedDownloader(output_dir=str(tmp_path), session=session, **kwargs)
+
+
+def test_partition_splits_by_size_and_returns_probed_sizes(tmp_path, files):
+    session = FakeSession(files)
+    large, others, sizes = downloader(tmp_path, session).partition(list(files))
+    assert large == ['https://cdn.example.com/big.mp4']
+    assert others == ['https://cdn.example.com/small.mp4']
+    assert sizes == {url: len(body) for url, body in files.items()}
+
+
+def test_partition_without_range_support_falls_back(tmp_path, files):
+    large, others, sizes = downloader(tmp_path, FakeSession(files, ranges=False)).partition(list(files))
+    assert large == [] and sorted(others) == sorted(files)
+    assert set(sizes.values()) == {None}
+
+
+def test_download_requests_each_chunk_once(tmp_path, files):
+    url = 'https://cdn.example.com/big.mp4'
+    session = FakeSession(files)
+    path = downloader(tmp_path, session).download(url)
+    
+    with open(path, 'rb') as f:
+        assert f.read() == files[url]
+    size = len(files[url])
+    assert session.ranges_for(url) == sorted([
+        f'bytes=0-{MB - 1}', f'bytes={MB}-{2 * MB - 1}', f'bytes={2 * MB}-{3 * MB - 1}', f'bytes={3 * MB}-{size - 1}'
+    ])
+    assert not os.path.exists(path + SegmentedDownloader.CHUNK_MAP_SUFFIX)
+
+
+def test_resume_downloads_only_missing_chunks(tmp_path, files):
+    url = 'https://cdn.example.com/big.mp4'
+    size = len(files[url])
+    path = tmp_path / 'big.mp4'
+    # 上次运行完成了第0、2块
+    data = bytearray(size)
+    data[0:MB] = files[url][0:MB]
+    data[2 * MB:3 * MB] = files[url][2 * MB:3 * MB]
+    path.write_bytes(bytes(data))
+    (tmp_path / ('big.mp4' + SegmentedDownloader.CHUNK_MAP_SUFFIX)).write_text(
+        json.dumps({'url': url, 'size': size, 'chunk_size': MB, 'done': [0, 2]})
+    )
+    
+    session = FakeSession(files)
+    assert downloader(tmp_path, session, resume=True).download(url, size=size)
+    assert path.read_bytes() == files[url]
+    assert session.ranges_for(url) == sorted([f'bytes={MB}-{2 * MB - 1}', f'bytes={3 * MB}-{size - 1}'])
+
+
+def test_download_videos_reuses_partition_sizes(tmp_path, files):
+    url = 'https://cdn.example.com/big.mp4'
+    session = FakeSession(files)
+    segmented = downloader(tmp_path, session)
+    large, _, sizes = segmented.partition(list(files))
+    probes = len([r for r in session.requests if r[0] == 'HEAD'])
+    
+    assert segmented.download_videos(large, sizes) == {'success': 1, 'failed': 0, 'skipped': 0}
+    assert len([r for r in session.requests if r[0] == 'HEAD']) == probes
+    # 再次下载时文件已完整，直接跳过
+    assert segmented.download_videos(large, sizes) == {'success': 0, 'failed': 0, 'skipped': 1}
+    assert (tmp_path / 'big.mp4').read_bytes() == files[url]
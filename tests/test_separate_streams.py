@@ -0,0 +1,66 @@
+import os
+
+import requests
+
+from utils import separate_streams
+from utils.separate_streams import SeparateStreamDownloader
+
+
+class FakeResponse:
+    def __init__(self, body):
+        self.body = body
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        pass
+    
+    def raise_for_status(self):
+        if self.body is None:
+            raise requests.exceptions.HTTPError('404')
+    
+    def iter_content(self, chunk_size=1):
+        yield self.body
+
+
+class FakeSession:
+    def __init__(self, bodies):
+        self.bodies = bodies
+        self.calls = []
+    
+    def get(self, url, **kwargs):
+        self.calls.append(url)
+        return FakeResponse(self.bodies.get(url))
+
+
+def fake_mux(video_path, audio_path, output_path, logger=None):
+    with open(output_path, 'wb') as output:
+        for path in (video_path, audio_path):
+            with open(path, 'rb') as f:
+                output.write(f.read())
+    return output_path
+
+
+def test_pairs_download_both_tracks_and_merge(tmp_path, monkeypatch):
+    monkeypatch.setattr(separate_streams, 'mux_streams', fake_mux)
+    session = FakeSession({'v1': b'V1', 'a1': b'A1', 'v2': b'V2', 'a2': b'A2'})
+    downloader = SeparateStreamDownloader(output_dir=str(tmp_path), streaming=False, session=session)
+    
+    results = downloader.download_pairs([('v1', 'a1'), ('v2', 'a2')], 'merged.mp4')
+    assert results == [str(tmp_path / 'merged.mp4'), str(tmp_path / 'merged_2.mp4')]
+    assert (tmp_path / 'merged.mp4').read_bytes() == b'V1A1'
+    assert (tmp_path / 'merged_2.mp4').read_bytes() == b'V2A2'
+    # 临时轨道文件已删除，两条轨道都计入统计
+    assert sorted(os.listdir(tmp_path)) == ['merged.mp4', 'merged_2.mp4']
+    assert downloader.meter.snapshot()['total_bytes'] == 8
+
+
+def test_failed_track_is_retried_then_reported(tmp_path, monkeypatch):
+    monkeypatch.setattr(separate_streams, 'mux_streams', fake_mux)
+    session = FakeSession({'v': b'V'})
+    downloader = SeparateStreamDownloader(output_dir=str(tmp_path), streaming=False, retries=2, session=session)
+    
+    assert downloader.download_pair('v', 'missing', 'out.mp4') is None
+    assert session.calls.count('missing') == 2
+    assert os.listdir(tmp_path) == []
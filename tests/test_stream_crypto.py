@@ -0,0 +1,91 @@
+import random
+
+import pytest
+
+from utils.stream_crypto import WebMaskDecryptor, create_decryptor
+
+
+AES = pytest.importorskip('Crypto.Cipher.AES')
+
+KEY = bytes(range(16))
+IV = bytes(range(100, 116))
+PLAIN = bytes(random.Random(1).getrandbits(8) for _ in range(10000))
+
+
+def chunks(data, seed=0):
+    """把数据切成随机大小的块（包括不足16字节的块）"""
+    rng = random.Random(seed)
+    offset = 0
+    while offset < len(data):
+        size = rng.choice([1, 7, 15, 16, 17, 100, 4096])
+        yield data[offset:offset + size]
+        offset += size
+
+
+def stream_decrypt(decryptor, data):
+    return b''.join(decryptor.update(chunk) for chunk in chunks(data)) + decryptor.finalize()
+
+
+def test_webmask_round_trip_and_length():
+    mask = b'\x13\x37\xbe\xef\x42'
+    masked = bytes(b ^ mask[i % len(mask)] for i, b in enumerate(PLAIN[:300])) + PLAIN[300:]
+    assert stream_decrypt(create_decryptor('webmask', mask, length=300), masked) == PLAIN
+    assert WebMaskDecryptor(mask).decrypt_at(3, masked[3:10]) == PLAIN[3:10]
+    with pytest.raises(ValueError):
+        WebMaskDecryptor(b'')
+
+
+def test_ctr_round_trip_sequential_and_random_access():
+    encrypted = AES.new(KEY, AES.MODE_CTR, nonce=b'', initial_value=IV).encrypt(PLAIN)
+    assert stream_decrypt(create_decryptor('aes-ctr', KEY, IV), encrypted) == PLAIN
+    
+    # 分段下载：分块乱序到达，按偏移解密
+    decryptor = create_decryptor('aes-ctr', KEY, IV)
+    pieces = [(offset, offset + 1000) for offset in range(0, len(PLAIN), 1000)]
+    random.Random(2).shuffle(pieces)
+    result = bytearray(len(PLAIN))
+    for start, end in pieces:
+        result[start + 5:end] = decryptor.decrypt_at(start + 5, encrypted[start + 5:end])
+        result[start:start + 5] = decryptor.decrypt_at(start, encrypted[start:start + 5])
+    assert bytes(result) == PLAIN
+
+
+def test_ctr_counter_wraps_around():
+    iv = b'\xfe' + b'\xff' * 15
+    # 计数器按128位整数回绕：第3块（偏移32）的计数器为0
+    counters = [((int.from_bytes(iv, 'big') + i) % (1 << 128)).to_bytes(16, 'big') for i in range(4)]
+    keystream = AES.new(KEY, AES.MODE_ECB).encrypt(b''.join(counters))
+    encrypted = bytes(p ^ k for p, k in zip(PLAIN[:64], keystream))
+    assert create_decryptor('aes-ctr', KEY, iv).decrypt_at(32, encrypted[32:]) == PLAIN[32:64]
+
+
+def test_cbc_round_trip_removes_padding():
+    padding = 16 - len(PLAIN) % 16
+    encrypted = AES.new(KEY, AES.MODE_CBC, IV).encrypt(PLAIN + bytes([padding]) * padding)
+    decryptor = create_decryptor('aes-128-cbc', KEY, IV)
+    assert not decryptor.random_access
+    assert stream_decrypt(decryptor, encrypted) == PLAIN
+
+
+def test_cbc_rejects_truncated_ciphertext():
+    decryptor = create_decryptor('aes-128-cbc', KEY, IV)
+    decryptor.update(b'x' * 40)
+    with pytest.raises(ValueError):
+        decryptor.finalize()
+
+
+def test_default_iv_is_zero():
+    encrypted = AES.new(KEY, AES.MODE_CTR, nonce=b'', initial_value=0).encrypt(PLAIN[:50])
+    assert create_decryptor('aes-ctr', KEY).update(encrypted) == PLAIN[:50]
+
+
+@pytest.mark.parametrize('method, key, iv', [
+    ('aes-128-cbc', b'k' * 24, None),
+    ('aes-128-cbc', b'k' * 16, b'i' * 15),
+    ('aes-ctr', b'k' * 20, None),
+    ('aes-ctr', b'k' * 32, b'i' * 8),
+    ('rot13', b'k' * 16, None)
+])
+def test_invalid_parameters_are_rejected(method, key, iv):
+    with pytest.raises(ValueError):
+        create_decryptor(method, key, iv)
@@ -0,0 +1,43 @@
+from utils.stream_parser import StreamingVideoParser
+
+
+def links(chunks, limit=None):
+    return list(StreamingVideoParser().iter_links(chunks, 'https://example.com/page/', limit))
+
+
+def test_url_split_across_chunks_is_found_whole():
+    html = '<script>var src = "https://cdn.example.com/media/clip-1080p.mp4?token=abc";</script>'
+    cut = html.index('clip-') + 3
+    assert links([html[:cut], html[cut:]]) == ['https://cdn.example.com/media/clip-1080p.mp4?token=abc']
+
+
+def test_partial_url_at_chunk_end_is_not_reported():
+    # 块末尾的地址可能还没有读完，只能在后续块到达后产出
+    first = 'var a = "https://cdn.example.com/video.mp4'
+    second = '?part=2";'
+    assert links([first, second]) == ['https://cdn.example.com/video.mp4?part=2']
+
+
+def test_url_at_end_of_document():
+    assert links(['files: https://cdn.example.com/a.webm']) == ['https://cdn.example.com/a.webm']
+
+
+def test_tags_relative_urls_and_limit():
+    html = (
+        '<video src="/stream/1"></video>'
+        '<a href="movie.mp4">download</a>'
+        '<a href="about.html">about</a>'
+        '<meta property="og:video" content="https://cdn.example.com/og.mp4">'
+    )
+    chunks = [html[i:i + 7] for i in range(0, len(html), 7)]
+    assert links(chunks) == [
+        'https://example.com/stream/1',
+        'https://example.com/page/movie.mp4',
+        'https://cdn.example.com/og.mp4'
+    ]
+    assert links(chunks, limit=1) == ['https://example.com/stream/1']
+
+
+def test_duplicates_are_reported_once():
+    html = '"https://cdn.example.com/a.mp4" "https://cdn.example.com/a.mp4" <source src="https://cdn.example.com/a.mp4">'
+    assert links([html]) == ['https://cdn.example.com/a.mp4']
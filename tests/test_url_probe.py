@@ -0,0 +1,111 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from utils.http_session import create_session
+from utils.url_probe import PageCache, URLProbe, sniff_type, type_from_content_type
+
+
+PAGE = '<!DOCTYPE html><html><head><title>视频</title></head><body>播放页</body></html>'.encode('utf-8')
+GBK_PAGE = '<html><body>中文页面</body></html>'.encode('gbk')
+MP4 = b'\x00\x00\x00\x20ftypisom' + b'\x00' * 8000
+
+# 路径: (Content-Type, 正文, 是否支持Range)
+ROUTES = {
+    '/page': ('text/html', PAGE, False),
+    '/ranged-page': ('text/html', PAGE * 200, True),
+    '/gbk': ('text/html; charset=gbk', GBK_PAGE, False),
+    '/bogus': ('text/html; charset=no-such-codec', PAGE, False),
+    '/movie.mp4': ('application/octet-stream', MP4, True)
+}
+
+
+class Handler(BaseHTTPRequestHandler):
+    def send_body(self, head_only):
+        route = ROUTES.get(self.path)
+        if route is None:
+            self.send_error(404)
+            return
+        content_type, body, ranges = route
+        start, end = 0, len(body) - 1
+        requested = self.headers.get('Range', '')
+        if ranges and requested.startswith('bytes='):
+            first, _, last = requested[6:].partition('-')
+            start, end = int(first), min(int(last) if last else end, end)
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(body)}')
+        else:
+            self.send_response(200)
+        if ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        if not head_only:
+            self.wfile.write(body[start:end + 1])
+    
+    def do_GET(self):
+        self.send_body(False)
+    
+    def do_HEAD(self):
+        self.send_body(True)
+    
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_sniff_type_and_content_type():
+    assert sniff_type(b'\xef\xbb\xbf#EXTM3U\n') == 'hls'
+    assert sniff_type(b'<?xml version="1.0"?><MPD>') == 'dash'
+    assert sniff_type(PAGE) == 'webpage'
+    assert sniff_type(MP4) == 'video'
+    assert sniff_type(b'\x00\x00\x00\x20ftypM4A ') == 'audio'
+    assert sniff_type(b'ID3\x04') == 'audio'
+    assert sniff_type(b'plain') is None
+    assert type_from_content_type('Application/Vnd.Apple.Mpegurl; charset=utf-8') == 'hls'
+    assert type_from_content_type('application/octet-stream') is None
+
+
+def test_fetch_decodes_undeclared_charset_as_utf8(server):
+    cache = PageCache()
+    session = create_session()
+    assert cache.fetch(server + '/page', session=session) == PAGE.decode('utf-8')
+    assert cache.fetch(server + '/gbk', session=session) == GBK_PAGE.decode('gbk')
+    assert cache.fetch(server + '/bogus', session=session) == PAGE.decode('utf-8')
+    # 已缓存的页面不再请求
+    assert cache.get(server + '/page#player') == PAGE.decode('utf-8')
+
+
+def test_probe_caches_full_page_when_range_is_ignored(server):
+    cache = PageCache()
+    probe = URLProbe(cache=cache)
+    assert probe.detect_url_type(server + '/page') == 'webpage'
+    assert cache.get(server + '/page') == PAGE.decode('utf-8')
+
+
+def test_probe_reads_rest_of_ranged_page(server):
+    cache = PageCache()
+    probe = URLProbe(cache=cache)
+    result = probe.probe(server + '/ranged-page')
+    assert result['type'] == 'webpage'
+    assert result['accept_ranges']
+    assert cache.get(server + '/ranged-page') == (PAGE * 200).decode('utf-8')
+
+
+def test_probe_sniffs_media_behind_generic_content_type(server):
+    probe = URLProbe()
+    result = probe.probe(server + '/movie.mp4')
+    assert result['type'] == 'video'
+    assert result['size'] == len(MP4)
+    assert probe.recommend_strategy(server + '/movie.mp4')['method'] == 'direct_download'
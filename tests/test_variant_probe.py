@@ -0,0 +1,120 @@
+import struct
+
+import requests
+
+from utils.variant_probe import VariantProber, parse_mp4_header
+
+
+def box(kind, payload):
+    return struct.pack('>I4s', 8 + len(payload), kind) + payload
+
+
+def mp4_header(width, height, duration, timescale=1000):
+    mvhd = bytes(12) + struct.pack('>II', timescale, int(duration * timescale)) + bytes(80)
+    tkhd = bytearray(84)
+    tkhd[76:84] = struct.pack('>II', width << 16, height << 16)
+    audio_tkhd = bytes(84)
+    moov = box(b'moov', box(b'mvhd', mvhd) + box(b'trak', box(b'tkhd', audio_tkhd)) + box(b'trak', box(b'tkhd', bytes(tkhd))))
+    return box(b'ftyp', b'isom' + bytes(4)) + moov
+
+
+MASTER = '''#EXTM3U
+#EXT-X-STREAM-INF:BANDWIDTH=800000,RESOLUTION=640x360
+360/index.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=5000000,RESOLUTION=1920x1080
+1080/index.m3u8
+'''
+
+
+class FakeResponse:
+    def __init__(self, url, body=b'', status_code=200, headers=None):
+        self.url = url
+        self.content = body
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.ok = status_code < 400
+    
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+    
+    def raise_for_status(self):
+        if not self.ok:
+            raise requests.exceptions.HTTPError(str(self.status_code))
+    
+    def iter_content(self, chunk_size=1):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        pass
+
+
+class FakeSession:
+    """按URL返回预设的响应；文件按Range返回206"""
+    
+    def __init__(self, files):
+        self.files = files
+    
+    def get(self, url, headers=None, timeout=None, stream=False):
+        body = self.files.get(url)
+        if body is None:
+            return FakeResponse(url, status_code=404)
+        if isinstance(body, str):
+            return FakeResponse(url, body.encode('utf-8'))
+        start, end = (int(value) for value in headers['Range'][6:].split('-'))
+        end = min(end, len(body) - 1)
+        return FakeResponse(url, body[start:end + 1], 206, {'Content-Range': f'bytes {start}-{end}/{len(body)}'})
+    
+    def head(self, url, timeout=None, allow_redirects=True):
+        return FakeResponse(url, status_code=404)
+
+
+def test_parse_mp4_header_uses_video_track():
+    info = parse_mp4_header(mp4_header(1280, 720, 12.5))
+    assert info == {'width': 1280, 'height': 720, 'duration': 12.5}
+    # 截断的数据不会出错
+    assert parse_mp4_header(mp4_header(1280, 720, 12.5)[:40])['height'] == 0
+
+
+def test_probe_file_computes_average_bitrate():
+    header = mp4_header(1920, 1080, 10)
+    session = FakeSession({'https://cdn.example.com/a.mp4': header + bytes(1_000_000 - len(header))})
+    info = VariantProber(session=session).probe('https://cdn.example.com/a.mp4')
+    assert (info['width'], info['height'], info['size']) == (1920, 1080, 1_000_000)
+    assert info['bandwidth'] == 800_000
+
+
+def test_probe_hls_master_picks_variant_by_quality():
+    session = FakeSession({'https://cdn.example.com/master.m3u8': MASTER})
+    prober = VariantProber(session=session)
+    assert prober.probe('https://cdn.example.com/master.m3u8')['height'] == 1080
+    assert prober.probe('https://cdn.example.com/master.m3u8', 480)['bandwidth'] == 800_000
+
+
+def test_rank_orders_candidates_and_tolerates_failures():
+    small = mp4_header(640, 360, 10)
+    large = mp4_header(1920, 1080, 10)
+    session = FakeSession({
+        'https://cdn.example.com/360.mp4': small + bytes(100_000),
+        'https://cdn.example.com/1080.mp4': large + bytes(500_000),
+        'https://cdn.example.com/master.m3u8': MASTER.replace('1920x1080', '1280x720')
+    })
+    urls = [
+        'https://cdn.example.com/360.mp4',
+        'https://cdn.example.com/missing_480p.mp4',
+        'https://cdn.example.com/1080.mp4',
+        'https://cdn.example.com/master.m3u8',
+        'https://cdn.example.com/360.mp4'
+    ]
+    prober = VariantProber(session=session)
+    assert prober.rank(urls, 'best') == [
+        'https://cdn.example.com/1080.mp4',
+        'https://cdn.example.com/master.m3u8',
+        'https://cdn.example.com/missing_480p.mp4',
+        'https://cdn.example.com/360.mp4'
+    ]
+    assert prober.rank(urls, 480)[0] == 'https://cdn.example.com/missing_480p.mp4'
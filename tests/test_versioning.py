@@ -0,0 +1,54 @@
+import sqlite3
+
+from utils.versioning import ChangeIndex, HistoryVersions
+
+
+def test_changed_since_returns_latest_version_per_key():
+    index = ChangeIndex()
+    index.touch('a')
+    index.touch('b')
+    index.touch('a')
+    assert index.changed_since(0) == [(2, 'b'), (3, 'a')]
+    assert index.changed_since(2) == [(3, 'a')]
+    assert index.changed_since(3) == []
+    assert index.changed_since(0, limit=1) == [(2, 'b')]
+    assert index.version_of('a') == 3
+    assert index.version_of('missing') == 0
+
+
+def test_changed_since_survives_log_compaction():
+    index = ChangeIndex()
+    for i in range(3000):
+        index.touch(i % 3)
+    assert len(index._log_versions) < 3000
+    assert index.changed_since(0) == [(2998, 0), (2999, 1), (3000, 2)]
+    assert index.changed_since(2999) == [(3000, 2)]
+
+
+def test_history_versions_report_updates_and_tombstones(tmp_path):
+    path = str(tmp_path / 'downloads.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE download_history (id INTEGER PRIMARY KEY, task_id TEXT, url TEXT, status TEXT)')
+    conn.execute("INSERT INTO download_history (task_id, url, status) VALUES ('t1', 'u1', 'running')")
+    conn.commit()
+    
+    versions = HistoryVersions(path)
+    since = versions.current_version()
+    conn.execute("INSERT INTO download_history (task_id, url, status) VALUES ('t2', 'u2', 'running')")
+    conn.execute("UPDATE download_history SET status = 'completed' WHERE task_id = 't1'")
+    conn.commit()
+    changes = versions.changed_since(since)
+    assert [(c['task_id'], c['removed']) for c in changes] == [('t2', False), ('t1', False)]
+    
+    # 状态过滤：不再符合条件的记录以墓碑返回
+    since = versions.current_version()
+    conn.execute("UPDATE download_history SET status = 'failed' WHERE task_id = 't2'")
+    conn.execute("DELETE FROM download_history WHERE task_id = 't1'")
+    conn.commit()
+    changes = versions.changed_since(since, status='running')
+    assert [(c['record_id'], c['removed']) for c in changes] == [(2, True), (1, True)]
+    
+    records, cursor = versions.page(limit=1)
+    assert [r['task_id'] for r in records] == ['t2'] and cursor is None
+    versions.close()
+    conn.close()
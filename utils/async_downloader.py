@@ -0,0 +1,212 @@
+"""异步下载引擎 - 基于asyncio/aiohttp的高并发传输"""
+
+import asyncio
+import logging
+import os
+from urllib.parse import urlparse
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from .bandwidth import get_bandwidth_limiter
+from .http_session import DEFAULT_USER_AGENT
+from .segmented import unique_filenames
+
+
+# 写盘缓冲区大小，攒够后在线程池中写入，事件循环不等待磁盘
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+class AsyncVideoDownloader:
+    """
+    异步视频下载器
+    
+    与VideoDownloader接口一致（download_videos返回相同的结果字典），
+    但在单个事件循环中由固定数量的协程从队列中取任务，以流式方式写盘。
+    同时在途的传输数由concurrency决定，内存占用只与并发数和块大小相关，
+    与URL总数无关，适合大量小文件或流媒体分片。
+    """
+    
+    def __init__(self, output_dir='downloads', concurrency=100, per_host=0, retries=3,
+                 proxy=None, resume=False, verify=True, logger=None, cookies=None,
+                 referer=None, chunk_size=64 * 1024, decryptor_factory=None, index=None):
+        """
+        初始化异步下载器
+        
+        Args:
+            output_dir: 保存目录
+            concurrency: 同时进行的最大传输数
+            per_host: 单个主机的最大连接数，0表示不限制
+            retries: 下载失败重试次数
+            proxy: 代理服务器地址（仅支持HTTP代理）
+            resume: 是否启用断点续传
+            verify: 是否校验文件大小
+            logger: 日志记录器
+            cookies: Cookie（字典或Selenium风格的字典列表）
+            referer: Referer地址
+            chunk_size: 流式写盘的块大小（字节）
+            decryptor_factory: 返回流式解密器的可调用对象，提供时数据写盘前先解密
+            index: 已下载媒体索引（DownloadIndex），下载过的媒体不再建立连接
+        """
+        if aiohttp is None:
+            raise ImportError("异步下载引擎需要aiohttp，请运行: pip install aiohttp")
+        
+        self.output_dir = output_dir
+        self.concurrency = max(1, concurrency)
+        self.per_host = max(0, per_host)
+        self.retries = retries
+        self.proxy = proxy
+        self.resume = resume
+        self.verify = verify
+        self.logger = logger or logging.getLogger(__name__)
+        self.chunk_size = chunk_size
+        self.decryptor_factory = decryptor_factory
+        self.index = index
+        
+        self.headers = {'User-Agent': DEFAULT_USER_AGENT}
+        if referer:
+            self.headers['Referer'] = referer
+        
+        self.cookies = {}
+        if isinstance(cookies, dict):
+            self.cookies = dict(cookies)
+        elif cookies:
+            self.cookies = {c['name']: c.get('value', '') for c in cookies if isinstance(c, dict) and 'name' in c}
+        
+        os.makedirs(output_dir, exist_ok=True)
+    
+    def download_videos(self, urls):
+        """
+        下载多个视频文件
+        
+        Args:
+            urls: URL列表
+        
+        Returns:
+            dict: {'success': 成功数, 'failed': 失败数, 'skipped': 跳过数}
+        """
+        if not urls:
+            return {'success': 0, 'failed': 0, 'skipped': 0}
+        return asyncio.run(self._download_all(urls))
+    
+    async def _download_all(self, urls):
+        """在事件循环中下载全部URL"""
+        # 同一批中文件名相同的不同URL分别保存，重复的URL只下载一次
+        filenames = unique_filenames(urls)
+        results = {'success': 0, 'failed': 0, 'skipped': len(urls) - len(filenames)}
+        queue = asyncio.Queue()
+        for url in filenames:
+            queue.put_nowait(url)
+        
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.per_host)
+        timeout = aiohttp.ClientTimeout(total=None, connect=30, sock_read=60)
+        
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                         headers=self.headers, cookies=self.cookies) as session:
+            async def worker():
+                while True:
+                    try:
+                        url = queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        return
+                    status = await self._download_one(session, url, filenames[url])
+                    results[status] += 1
+            
+            workers = [asyncio.create_task(worker()) for _ in range(min(self.concurrency, len(filenames)))]
+            await asyncio.gather(*workers)
+        
+        return results
+    
+    async def _download_one(self, session, url, filename):
+        """
+        下载单个文件（带重试）
+        
+        Returns:
+            str: 'success'、'failed' 或 'skipped'
+        """
+        output_path = os.path.join(self.output_dir, filename)
+        temp_path = output_path + '.part'
+        
+        if os.path.exists(output_path):
+            self.logger.info(f"文件已存在，跳过: {filename}")
+            return 'skipped'
+        if self.index and self.index.contains(url):
+            self.logger.info(f"以前已下载过，跳过: {filename}")
+            return 'skipped'
+        
+        for attempt in range(1, self.retries + 1):
+            try:
+                await self._fetch(session, url, temp_path)
+                os.replace(temp_path, output_path)
+                self.logger.info(f"下载完成: {filename}")
+                if self.index:
+                    self.index.add(url, output_path)
+                return 'success'
+            
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError, ValueError) as e:
+                self.logger.warning(f"下载失败 (第{attempt}次): {filename} - {e}")
+                if attempt < self.retries:
+                    await asyncio.sleep(min(2 ** attempt, 10))
+        
+        self.logger.error(f"下载失败: {url}")
+        return 'failed'
+    
+    async def _fetch(self, session, url, temp_path):
+        """流式下载到临时文件，支持断点续传和边下载边解密"""
+        offset = os.path.getsize(temp_path) if self.resume and os.path.exists(temp_path) else 0
+        decryptor = self.decryptor_factory() if self.decryptor_factory else None
+        if decryptor and not decryptor.random_access:
+            # 顺序解密的状态无法从文件中途恢复，只能从头下载
+            offset = 0
+        headers = {'Range': f'bytes={offset}-'} if offset else None
+        
+        limiter = get_bandwidth_limiter()
+        host = urlparse(url).hostname
+        owner = object()
+        await limiter.acquire_async(host, owner)
+        
+        try:
+            await self._transfer(session, url, headers, offset, temp_path, decryptor, limiter, host)
+        finally:
+            limiter.release(host, owner)
+    
+    async def _transfer(self, session, url, headers, offset, temp_path, decryptor, limiter, host):
+        """在已占用主机连接名额的情况下传输数据"""
+        async with session.get(url, headers=headers, proxy=self.proxy) as response:
+            if response.status == 416 and offset:
+                # 临时文件已完整
+                return
+            response.raise_for_status()
+            
+            if offset and response.status != 206:
+                # 服务器不支持Range，从头下载
+                offset = 0
+            if decryptor:
+                decryptor.position = offset if decryptor.random_access else 0
+            
+            # 压缩传输时aiohttp自动解压，Content-Length是压缩后的大小，无法用于校验
+            encoding = response.headers.get('Content-Encoding', 'identity').lower()
+            expected = response.content_length if encoding == 'identity' else None
+            written = 0
+            buffer = bytearray()
+            f = await asyncio.to_thread(open, temp_path, 'ab' if offset else 'wb')
+            try:
+                async for data in response.content.iter_chunked(self.chunk_size):
+                    written += len(data)
+                    buffer += decryptor.update(data) if decryptor else data
+                    if len(buffer) >= WRITE_BUFFER_SIZE:
+                        await asyncio.to_thread(f.write, bytes(buffer))
+                        buffer.clear()
+                    delay = await limiter.reserve_async(len(data), host)
+                    if delay:
+                        await asyncio.sleep(delay)
+                if decryptor:
+                    buffer += decryptor.finalize()
+                await asyncio.to_thread(f.write, bytes(buffer))
+            finally:
+                await asyncio.to_thread(f.close)
+        
+        if self.verify and expected is not None and written != expected:
+            raise ValueError(f"文件大小不匹配: {written}/{expected}")
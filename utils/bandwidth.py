@@ -0,0 +1,600 @@
+"""带宽统计与限速 - 多个传输共享的字节计数、速度估算、全局带宽预算和主机并发上限"""
+
+import asyncio
+import configparser
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+
+class HostLimitError(Exception):
+    """同一持有者已占满主机的全部连接名额，继续等待会死锁"""
+
+
+class TransferMeter:
+    """
+    传输计量器
+    
+    多个下载线程共享同一个计量器，累计总字节数并估算整体速度，
+    每个来源（例如 video / audio）单独统计。另外按秒记录最近window秒的
+    字节数，给出实时速度。
+    """
+    
+    def __init__(self, window=5):
+        """
+        初始化传输计量器
+        
+        Args:
+            window: 计算实时速度的时间窗口（秒）
+        """
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._total = 0
+        self._by_source = {}
+        self.window = max(1, window)
+        self._recent = deque()
+    
+    def _trim(self, now):
+        while self._recent and self._recent[0][0] <= now - self.window:
+            self._recent.popleft()
+    
+    def add(self, size, source=None):
+        """
+        记录传输的字节数
+        
+        Args:
+            size: 字节数
+            source: 来源标识
+        """
+        with self._lock:
+            self._total += size
+            if source is not None:
+                self._by_source[source] = self._by_source.get(source, 0) + size
+            
+            second = int(time.monotonic())
+            if self._recent and self._recent[-1][0] == second:
+                self._recent[-1][1] += size
+            else:
+                self._recent.append([second, size])
+                self._trim(second)
+    
+    def snapshot(self):
+        """
+        获取当前统计
+        
+        Returns:
+            dict: {'total_bytes', 'elapsed', 'speed', 'current_speed', 'sources'}，
+                  speed为平均速度，current_speed为最近window秒的速度，单位为字节/秒
+        """
+        with self._lock:
+            now = time.monotonic()
+            elapsed = max(now - self._started, 1e-6)
+            self._trim(int(now))
+            recent = sum(size for _, size in self._recent)
+            return {
+                'total_bytes': self._total,
+                'elapsed': elapsed,
+                'speed': self._total / elapsed,
+                'current_speed': recent / min(self.window, elapsed),
+                'sources': dict(self._by_source)
+            }
+
+
+class TokenBucket:
+    """
+    令牌桶
+    
+    以rate字节/秒的速度补充令牌，最多积累burst字节。令牌不足时允许透支，
+    透支的部分由调用方等待偿还，因此多个线程按到达顺序公平分享带宽。
+    """
+    
+    def __init__(self, rate=0, burst=None):
+        """
+        初始化令牌桶
+        
+        Args:
+            rate: 速率（字节/秒），0表示不限速
+            burst: 突发容量（字节），默认为1秒的流量
+        """
+        self.rate = max(0, rate)
+        self.burst = burst or self.rate
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def reserve(self, size):
+        """
+        取走size字节的令牌
+        
+        Returns:
+            float: 调用方需要等待的秒数
+        """
+        if not self.rate:
+            return 0.0
+        
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= size
+            return max(0.0, -self._tokens / self.rate)
+    
+    def reserve_local(self, size):
+        """
+        不访问任何外部状态地取走size字节的令牌（内存中的令牌桶总是可以）
+        
+        Returns:
+            float: 调用方需要等待的秒数，需要访问外部状态时返回None
+        """
+        return self.reserve(size)
+    
+    def consume(self, size):
+        """取走size字节的令牌，令牌不足时阻塞等待"""
+        delay = self.reserve(size)
+        if delay:
+            time.sleep(delay)
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    跨进程共享的令牌桶
+    
+    令牌余量保存在SQLite文件中，同一台机器上的命令行、GUI和API服务器
+    打开同一个文件即共用一份带宽预算。为避免每读一块数据都开一次事务，
+    进程每次从共享桶预取lease字节的令牌，在本地用完后再取。
+    """
+    
+    def __init__(self, path, rate=0, burst=None, lease=None, name='global'):
+        """
+        初始化跨进程共享的令牌桶
+        
+        Args:
+            path: 状态文件路径
+            rate: 速率（字节/秒），0表示不限速
+            burst: 突发容量（字节），默认为1秒的流量
+            lease: 每次从共享桶预取的字节数，默认为50毫秒的流量（至少64KB）
+            name: 桶名称，同一文件中可保存多个桶
+        """
+        super().__init__(rate, burst)
+        self.path = path
+        self.name = name
+        self.lease = lease or max(64 * 1024, self.rate // 20)
+        self._local = 0
+        self._ready_at = 0.0
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS token_buckets '
+            '(name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)'
+        )
+    
+    def _take_shared(self, size):
+        """从共享桶取走size字节的令牌，返回需要等待的秒数（调用方持有锁）"""
+        now = time.time()
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = self.conn.execute(
+                'SELECT tokens, updated FROM token_buckets WHERE name = ?', (self.name,)
+            ).fetchone()
+            tokens, updated = row if row else (self.burst, now)
+            # 各进程的时钟相同，时间回拨时不补充令牌
+            tokens = min(self.burst, tokens + max(0.0, now - updated) * self.rate) - size
+            self.conn.execute(
+                'INSERT OR REPLACE INTO token_buckets (name, tokens, updated) VALUES (?, ?, ?)',
+                (self.name, tokens, now)
+            )
+            self.conn.execute('COMMIT')
+        except sqlite3.Error:
+            self.conn.execute('ROLLBACK')
+            raise
+        return max(0.0, -tokens / self.rate)
+    
+    def reserve(self, size):
+        """
+        取走size字节的令牌
+        
+        Returns:
+            float: 调用方需要等待的秒数
+        """
+        if not self.rate:
+            return 0.0
+        
+        with self._lock:
+            now = time.monotonic()
+            if self._local < size:
+                amount = max(size - self._local, self.lease)
+                delay = self._take_shared(amount)
+                self._local += amount
+                self._ready_at = max(self._ready_at, now + delay)
+            self._local -= size
+            return max(0.0, self._ready_at - now)
+    
+    def reserve_local(self, size):
+        """
+        只用本进程预取的令牌取走size字节，不打开状态文件的事务
+        
+        Returns:
+            float: 调用方需要等待的秒数，预取的令牌不足时返回None
+        """
+        if not self.rate:
+            return 0.0
+        
+        with self._lock:
+            if self._local < size:
+                return None
+            self._local -= size
+            return max(0.0, self._ready_at - time.monotonic())
+    
+    def close(self):
+        """关闭状态文件"""
+        with self._lock:
+            self.conn.close()
+
+
+class BandwidthLimiter:
+    """
+    带宽限制器
+    
+    所有下载共享一个全局令牌桶（提供shared_state时与本机其他进程共享），
+    并按主机限制本进程同时打开的连接数，避免单个大任务占满上行链路或同时
+    触发多个CDN的限流。同时记录每个主机的活动连接数、等待数和已传输字节数。
+    """
+    
+    def __init__(self, max_rate=0, burst=None, per_host=0, host_limits=None, shared_state=None):
+        """
+        初始化带宽限制器
+        
+        Args:
+            max_rate: 全局带宽上限（字节/秒），0表示不限制
+            burst: 突发容量（字节）
+            per_host: 默认的单主机最大连接数，0表示不限制
+            host_limits: 特定主机的连接数上限 {主机: 连接数}
+            shared_state: 跨进程共享带宽预算的状态文件，None表示只在进程内限速
+        """
+        if max_rate and shared_state:
+            self.bucket = SharedTokenBucket(shared_state, max_rate, burst)
+        else:
+            self.bucket = TokenBucket(max_rate, burst)
+        self.shared_state = shared_state if isinstance(self.bucket, SharedTokenBucket) else None
+        self.per_host = max(0, per_host)
+        self.host_limits = {host.lower(): limit for host, limit in (host_limits or {}).items()}
+        self.meter = TransferMeter()
+        self._condition = threading.Condition()
+        self._active = {}
+        self._waiting = {}
+        self._owners = {}
+        self._async_waiters = {}
+    
+    def limit_for(self, host):
+        """获取主机的连接数上限，0表示不限制"""
+        return self.host_limits.get(host, self.per_host)
+    
+    def _try_acquire(self, host, key):
+        """
+        名额未满时占用一个名额（调用方持有锁）
+        
+        Raises:
+            HostLimitError: 该持有者已占满全部名额，等待其他持有者释放不会有结果
+        """
+        limit = self.limit_for(host)
+        if limit and self._active.get(host, 0) >= limit:
+            if self._owners.get(key, 0) >= limit:
+                raise HostLimitError(f"{host} 的 {limit} 个连接名额已全部被同一持有者占用")
+            return False
+        self._active[host] = self._active.get(host, 0) + 1
+        self._owners[key] = self._owners.get(key, 0) + 1
+        return True
+    
+    def acquire(self, host, blocking=True, timeout=None, owner=None):
+        """
+        占用主机的一个连接名额
+        
+        名额严格按上限分配。同一持有者已占满全部名额时再次请求（例如上限为1时
+        在同一线程中同时打开视频流和音频流）会抛出HostLimitError，而不是
+        永远等待自己释放名额。
+        
+        Args:
+            host: 主机名
+            blocking: 名额已满时是否等待
+            timeout: 最长等待秒数
+            owner: 名额持有者标识，默认为当前线程（协程应传入各自的标识）
+        
+        Returns:
+            bool: 是否成功占用
+        
+        Raises:
+            HostLimitError: 继续等待会死锁
+        """
+        host = (host or '').lower()
+        key = (host, owner or threading.get_ident())
+        deadline = None if timeout is None else time.monotonic() + timeout
+        
+        with self._condition:
+            if self._try_acquire(host, key):
+                return True
+            if not blocking:
+                return False
+            self._waiting[host] = self._waiting.get(host, 0) + 1
+            try:
+                while not self._try_acquire(host, key):
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self._condition.wait(remaining)
+                return True
+            finally:
+                self._waiting[host] -= 1
+    
+    async def acquire_async(self, host, owner):
+        """
+        在事件循环中等待并占用主机的一个连接名额
+        
+        名额已满时在Future上等待，释放名额时由release()唤醒，不占用线程也不轮询。
+        
+        Args:
+            host: 主机名
+            owner: 名额持有者标识（每个协程各自的标识）
+        """
+        host = (host or '').lower()
+        key = (host, owner)
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._condition:
+                if self._try_acquire(host, key):
+                    return
+                future = loop.create_future()
+                self._async_waiters.setdefault(host, []).append((loop, future))
+                self._waiting[host] = self._waiting.get(host, 0) + 1
+            try:
+                await future
+            finally:
+                with self._condition:
+                    self._waiting[host] -= 1
+                    waiters = self._async_waiters.get(host, [])
+                    if (loop, future) in waiters:
+                        waiters.remove((loop, future))
+    
+    def release(self, host, owner=None):
+        """
+        释放主机的一个连接名额
+        
+        Args:
+            host: 主机名
+            owner: 名额持有者标识，默认为当前线程
+        """
+        host = (host or '').lower()
+        key = (host, owner or threading.get_ident())
+        with self._condition:
+            self._active[host] = max(0, self._active.get(host, 0) - 1)
+            if self._owners.get(key, 0) > 1:
+                self._owners[key] -= 1
+            else:
+                self._owners.pop(key, None)
+            self._condition.notify_all()
+            for loop, future in self._async_waiters.pop(host, []):
+                try:
+                    loop.call_soon_threadsafe(_wake, future)
+                except RuntimeError:
+                    # 事件循环已关闭
+                    pass
+    
+    @contextmanager
+    def slot(self, url):
+        """在with块内占用URL所在主机的一个连接名额"""
+        host = urlparse(url).hostname
+        self.acquire(host)
+        try:
+            yield
+        finally:
+            self.release(host)
+    
+    def reserve(self, size, host=None):
+        """记录传输的字节数并返回限速需要等待的秒数（供异步代码使用）"""
+        self.meter.add(size, (host or '').lower() or None)
+        return self.bucket.reserve(size)
+    
+    async def reserve_async(self, size, host=None):
+        """
+        reserve()的协程版本
+        
+        共享令牌桶需要从状态文件预取令牌时，SQLite事务可能要等待其他进程
+        释放锁，放到线程中执行，不阻塞事件循环中的其他传输。
+        """
+        delay = self.bucket.reserve_local(size)
+        if delay is None:
+            delay = await asyncio.to_thread(self.bucket.reserve, size)
+        self.meter.add(size, (host or '').lower() or None)
+        return delay
+    
+    def throttle(self, size, host=None):
+        """记录传输的字节数，超出带宽预算时阻塞等待"""
+        delay = self.reserve(size, host)
+        if delay:
+            time.sleep(delay)
+    
+    def snapshot(self):
+        """
+        获取实时统计
+        
+        Returns:
+            dict: {'max_rate', 'shared_state', 'total_bytes', 'speed', 'current_speed',
+                   'utilization', 'hosts'}，
+                  hosts中每项为 {'active', 'waiting', 'limit', 'usage', 'bytes'}，
+                  usage为活动连接数占上限的比例（无上限时为None），
+                  utilization为本进程实时速度占预算的比例
+        """
+        stats = self.meter.snapshot()
+        with self._condition:
+            hosts = set(self._active) | set(self._waiting) | set(stats['sources'])
+            counters = {}
+            for host in sorted(hosts):
+                active = self._active.get(host, 0)
+                limit = self.limit_for(host)
+                counters[host] = {
+                    'active': active,
+                    'waiting': self._waiting.get(host, 0),
+                    'limit': limit,
+                    'usage': active / limit if limit else None,
+                    'bytes': stats['sources'].get(host, 0)
+                }
+        
+        max_rate = self.bucket.rate
+        return {
+            'max_rate': max_rate,
+            'shared_state': self.shared_state,
+            'total_bytes': stats['total_bytes'],
+            'speed': stats['speed'],
+            'current_speed': stats['current_speed'],
+            'utilization': stats['current_speed'] / max_rate if max_rate else None,
+            'hosts': counters
+        }
+    
+    def is_limited(self):
+        """是否配置了带宽上限或主机连接上限"""
+        return bool(self.bucket.rate or self.per_host or any(self.host_limits.values()))
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+def format_bandwidth(snapshot):
+    """
+    把带宽统计格式化为一行文字
+    
+    Args:
+        snapshot: BandwidthLimiter.snapshot()的结果
+    
+    Returns:
+        str: 例如 "1200 KB/s / 上限 2048 KB/s | cdn.example.com 2/2 (等待1)"
+    """
+    text = f"{snapshot['current_speed'] / 1024:.0f} KB/s"
+    if snapshot['max_rate']:
+        text += f" / 上限 {snapshot['max_rate'] / 1024:.0f} KB/s"
+        if snapshot['shared_state']:
+            text += "（本机共享）"
+    hosts = []
+    for host, counters in snapshot['hosts'].items():
+        if not counters['active'] and not counters['waiting']:
+            continue
+        item = f"{host} {counters['active']}/{counters['limit'] or '-'}"
+        if counters['waiting']:
+            item += f" (等待{counters['waiting']})"
+        hosts.append(item)
+    if hosts:
+        text += " | " + ", ".join(hosts)
+    return text
+
+
+class BandwidthMonitor:
+    """定期把实时带宽统计交给回调（命令行输出或界面刷新）"""
+    
+    def __init__(self, limiter, callback, interval=2.0):
+        """
+        初始化带宽监视器
+        
+        Args:
+            limiter: 带宽限制器
+            callback: 接收snapshot()结果的回调
+            interval: 间隔（秒）
+        """
+        self.limiter = limiter
+        self.callback = callback
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        """启动监视线程"""
+        self._thread = threading.Thread(target=self._run, name='bandwidth-monitor', daemon=True)
+        self._thread.start()
+        return self
+    
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.callback(self.limiter.snapshot())
+    
+    def stop(self):
+        """停止监视线程"""
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+
+
+def parse_host_limits(value):
+    """
+    解析主机连接数配置，例如 "cdn.example.com=2, video.example.org=4"
+    
+    Returns:
+        dict: {主机: 连接数}
+    """
+    limits = {}
+    for item in (value or '').split(','):
+        host, sep, limit = item.partition('=')
+        if sep and host.strip() and limit.strip().isdigit():
+            limits[host.strip().lower()] = int(limit)
+    return limits
+
+
+_default_limiter = BandwidthLimiter()
+_limiter_lock = threading.Lock()
+
+
+def get_bandwidth_limiter():
+    """获取进程内共享的带宽限制器"""
+    return _default_limiter
+
+
+def configure_bandwidth(max_rate=0, burst=None, per_host=0, host_limits=None, shared_state=None):
+    """
+    替换进程内共享的带宽限制器（应在开始下载前调用）
+    
+    Args:
+        max_rate: 全局带宽上限（字节/秒），0表示不限制
+        burst: 突发容量（字节）
+        per_host: 默认的单主机最大连接数，0表示不限制
+        host_limits: 特定主机的连接数上限 {主机: 连接数}
+        shared_state: 跨进程共享带宽预算的状态文件
+    
+    Returns:
+        BandwidthLimiter: 新的带宽限制器
+    """
+    global _default_limiter
+    
+    with _limiter_lock:
+        _default_limiter = BandwidthLimiter(max_rate, burst, per_host, host_limits, shared_state)
+        return _default_limiter
+
+
+def load_bandwidth_config(config_file='config.ini', max_rate=None):
+    """
+    从配置文件的[limits]节读取并应用带宽限制
+    
+    Args:
+        config_file: 配置文件路径
+        max_rate: 覆盖配置的全局带宽上限（字节/秒）
+    
+    Returns:
+        BandwidthLimiter: 新的带宽限制器
+    """
+    config = configparser.ConfigParser()
+    config.read(config_file, encoding='utf-8')
+    limits = config['limits'] if config.has_section('limits') else {}
+    
+    burst = int(limits.get('burst', 0) or 0) * 1024
+    return configure_bandwidth(
+        max_rate=int(limits.get('max_bandwidth', 0) or 0) * 1024 if max_rate is None else max_rate,
+        burst=burst or None,
+        per_host=int(limits.get('per_host_connections', 0) or 0),
+        host_limits=parse_host_limits(limits.get('host_connections', '')),
+        shared_state=limits.get('shared_state', 'data/bandwidth.db') or None
+    )
@@ -0,0 +1,562 @@
+"""浏览器池 - 复用预热的无头浏览器进行网络抓包"""
+
+import atexit
+import configparser
+import json
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    from selenium import webdriver
+    from selenium.common.exceptions import WebDriverException
+except ImportError:
+    webdriver = None
+    WebDriverException = Exception
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from .request_classifier import RequestClassifier, classify_request, is_high_confidence
+
+
+# 抓包时轮询性能日志的间隔（秒）
+POLL_INTERVAL = 0.25
+# 发现高置信度候选后继续等待的秒数，以便收集同时发出的音频轨或清单
+CANDIDATE_GRACE = 1.0
+
+
+class _Browser:
+    """池中的一个浏览器实例及其使用统计"""
+    
+    def __init__(self, driver):
+        self.driver = driver
+        self.uses = 0
+        self.created = time.monotonic()
+        # 浏览器启动时的窗口，借出期间保持打开，浏览器不会因最后一个窗口关闭而退出
+        self.home = driver.current_window_handle
+        self.context = None
+
+
+class BrowserPool:
+    """
+    浏览器池
+    
+    维护若干个已启动的无头Chrome，抓包时借出、用完归还，省去每次冷启动
+    浏览器的数秒时间。每次借出都在新的浏览器上下文（相当于独立的隐身窗口）
+    中打开页面，归还时销毁该上下文，Cookie、缓存和存储随之清除，各次抓包
+    互不影响；使用次数达到上限或内存占用过高的浏览器会被关闭，下次借用时
+    重新启动。
+    """
+    
+    def __init__(self, size=0, headless=True, max_uses=20, max_memory_mb=1024, proxy=None, logger=None):
+        """
+        初始化浏览器池
+        
+        Args:
+            size: 同时存在的最大浏览器数
+            headless: 是否无头模式
+            max_uses: 单个浏览器最多使用的次数，达到后回收
+            max_memory_mb: 浏览器进程树的内存上限（MB），超过后回收，需要psutil
+            proxy: 代理服务器地址
+            logger: 日志记录器
+        """
+        self.size = max(0, size)
+        self.headless = headless
+        self.max_uses = max(1, max_uses)
+        self.max_memory_mb = max_memory_mb
+        self.proxy = proxy
+        self.logger = logger or logging.getLogger(__name__)
+        
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max(1, self.size))
+        self._closed = False
+    
+    def warm(self, count=1):
+        """
+        在后台预先启动浏览器
+        
+        Args:
+            count: 预热的浏览器数量
+        """
+        def start():
+            for _ in range(min(count, self.size)):
+                if not self._slots.acquire(blocking=False):
+                    return
+                try:
+                    self._idle.put(_Browser(self._create_driver()))
+                except (WebDriverException, ImportError) as e:
+                    self.logger.warning(f"预热浏览器失败: {e}")
+                    return
+                finally:
+                    self._slots.release()
+        
+        threading.Thread(target=start, daemon=True).start()
+    
+    @contextmanager
+    def lease(self, timeout=None):
+        """
+        借出一个浏览器
+        
+        Args:
+            timeout: 等待空闲浏览器的最长秒数
+        
+        Yields:
+            WebDriver: 干净的浏览器实例
+        """
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("等待空闲浏览器超时")
+        
+        browser = None
+        healthy = False
+        try:
+            try:
+                browser = self._idle.get_nowait()
+            except queue.Empty:
+                browser = _Browser(self._create_driver())
+            
+            self._open_context(browser)
+            yield browser.driver
+            healthy = True
+        finally:
+            if browser:
+                browser.uses += 1
+                self._release(browser, healthy)
+            self._slots.release()
+    
+    def close(self):
+        """关闭所有空闲浏览器"""
+        self._closed = True
+        while True:
+            try:
+                self._quit(self._idle.get_nowait())
+            except queue.Empty:
+                break
+    
+    def _release(self, browser, healthy):
+        """归还浏览器：需要回收时关闭，否则清理后放回池中"""
+        reason = None
+        if self._closed:
+            reason = "浏览器池已关闭"
+        elif not healthy:
+            reason = "抓包过程出错"
+        elif browser.uses >= self.max_uses:
+            reason = f"已使用 {browser.uses} 次"
+        else:
+            memory = self._memory_mb(browser.driver)
+            if memory and self.max_memory_mb and memory > self.max_memory_mb:
+                reason = f"内存占用 {memory:.0f} MB"
+        
+        if reason is None:
+            try:
+                self._reset(browser)
+            except WebDriverException as e:
+                reason = f"清理失败: {e}"
+        
+        if reason:
+            self.logger.debug(f"回收浏览器（{reason}）")
+            self._quit(browser)
+        else:
+            self._idle.put(browser)
+    
+    def _create_driver(self):
+        """启动一个开启性能日志的Chrome"""
+        if webdriver is None:
+            raise ImportError("浏览器池需要selenium，请运行: pip install selenium")
+        
+        options = webdriver.ChromeOptions()
+        if self.headless:
+            options.add_argument('--headless=new')
+        options.add_argument('--disable-gpu')
+        options.add_argument('--no-sandbox')
+        options.add_argument('--disable-dev-shm-usage')
+        options.add_argument('--mute-audio')
+        options.add_argument('--autoplay-policy=no-user-gesture-required')
+        if self.proxy:
+            options.add_argument(f'--proxy-server={self.proxy}')
+        options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+        
+        started = time.monotonic()
+        driver = webdriver.Chrome(options=options)
+        self.logger.debug(f"浏览器启动耗时 {time.monotonic() - started:.1f} 秒")
+        return driver
+    
+    def _open_context(self, browser):
+        """为本次借出创建独立的浏览器上下文，并切换到其中的新窗口"""
+        driver = browser.driver
+        existing = set(driver.window_handles)
+        browser.context = driver.execute_cdp_cmd('Target.createBrowserContext', {})['browserContextId']
+        target = driver.execute_cdp_cmd('Target.createTarget', {
+            'url': 'about:blank',
+            'browserContextId': browser.context
+        })['targetId']
+        # ChromeDriver的窗口句柄就是targetId，个别版本不同时按新出现的句柄查找
+        handles = driver.window_handles
+        if target not in handles:
+            target = next(handle for handle in handles if handle not in existing)
+        driver.switch_to.window(target)
+        driver.execute_cdp_cmd('Network.enable', {})
+        # 丢弃切换窗口之前产生的日志
+        driver.get_log('performance')
+    
+    def _reset(self, browser):
+        """关闭本次借出打开的窗口并销毁浏览器上下文，清除其中的全部状态"""
+        driver = browser.driver
+        for handle in driver.window_handles:
+            if handle != browser.home:
+                driver.switch_to.window(handle)
+                driver.close()
+        driver.switch_to.window(browser.home)
+        
+        if browser.context:
+            driver.execute_cdp_cmd('Target.disposeBrowserContext', {'browserContextId': browser.context})
+            browser.context = None
+        driver.get_log('performance')
+    
+    def _memory_mb(self, driver):
+        """浏览器进程树占用的内存（MB），无法获取时返回None"""
+        if psutil is None:
+            return None
+        try:
+            process = psutil.Process(driver.service.process.pid)
+            processes = [process] + process.children(recursive=True)
+            return sum(p.memory_info().rss for p in processes) / 1024 / 1024
+        except (AttributeError, psutil.Error):
+            return None
+    
+    def _quit(self, browser):
+        """关闭浏览器"""
+        try:
+            browser.driver.quit()
+        except WebDriverException:
+            pass
+
+
+class PooledCapture:
+    """
+    基于浏览器池的网络抓包
+    
+    与NetworkCapture的抓包接口一致（start_capture / get_cookies / get_referer /
+    filter_video_requests / get_all_video_candidates / extract_stream_urls），
+    但从浏览器池借用已启动的浏览器，通过Chrome性能日志收集网络请求。
+    
+    页面加载后不再固定等待wait_time：网络空闲idle_time秒，或发现高置信度
+    视频候选后，即提前结束；wait_time只作为等待上限。实际等待的秒数和
+    结束原因记录在wait_elapsed和wait_reason中。
+    """
+    
+    def __init__(self, pool=None, logger=None, idle_time=0.5):
+        """
+        初始化抓包器
+        
+        Args:
+            pool: 浏览器池，为None时使用进程内共享的浏览器池
+            logger: 日志记录器
+            idle_time: 没有未完成请求持续多少秒视为网络空闲，0表示总是等满wait_time
+        """
+        self.pool = pool or get_browser_pool()
+        self.logger = logger or logging.getLogger(__name__)
+        self.idle_time = idle_time
+        self.requests = []
+        self.cookies = []
+        self.referer = None
+        self.wait_elapsed = 0.0
+        self.wait_reason = None
+    
+    def start_capture(self, url, wait_time=10, on_candidate=None):
+        """
+        打开页面并收集网络请求
+        
+        Args:
+            url: 页面URL
+            wait_time: 等待页面加载媒体的最长秒数
+            on_candidate: 回调函数，页面加载过程中每发现一个高置信度候选就以
+                          {'url', 'kind', 'request', 'cookies', 'referer'} 调用一次
+        
+        Returns:
+            list: 请求列表，每项为 {'url', 'method', 'type', 'status', 'mime_type', 'size', 'headers'}
+        """
+        with self.pool.lease() as driver:
+            started = time.monotonic()
+            deadline = started + wait_time
+            network = NetworkLog()
+            driver.get(url)
+            
+            reason = 'timeout'
+            candidate_seen = None
+            emitted = set()
+            while True:
+                network.feed(driver.get_log('performance'))
+                if on_candidate:
+                    self._emit_candidates(driver, network.requests, emitted, on_candidate)
+                now = time.monotonic()
+                if now >= deadline:
+                    break
+                if self.idle_time and network.idle_for() >= self.idle_time:
+                    reason = 'idle'
+                    break
+                if candidate_seen is None and any(is_high_confidence(req) for req in network.requests):
+                    candidate_seen = now
+                if candidate_seen is not None and now - candidate_seen >= CANDIDATE_GRACE:
+                    reason = 'candidate'
+                    break
+                time.sleep(min(POLL_INTERVAL, deadline - now))
+            
+            self.wait_elapsed = time.monotonic() - started
+            self.wait_reason = reason
+            self.requests = network.requests
+            self.cookies = driver.get_cookies()
+            self.referer = driver.current_url
+        
+        reasons = {'idle': '网络空闲', 'candidate': '已发现视频', 'timeout': '达到等待上限'}
+        self.logger.info(f"抓包完成，共 {len(self.requests)} 个请求，"
+                         f"实际等待 {self.wait_elapsed:.1f} 秒（{reasons[reason]}）")
+        return self.requests
+    
+    def _emit_candidates(self, driver, requests_list, emitted, on_candidate):
+        """把新发现的高置信度候选交给回调"""
+        fresh = [req for req in requests_list if req['url'] not in emitted and is_high_confidence(req)]
+        if not fresh:
+            return
+        
+        cookies = driver.get_cookies()
+        referer = driver.current_url
+        for req in fresh:
+            emitted.add(req['url'])
+            try:
+                on_candidate({
+                    'url': req['url'],
+                    'kind': classify_request(req),
+                    'request': req,
+                    'cookies': cookies,
+                    'referer': referer
+                })
+            except Exception as e:
+                self.logger.warning(f"处理候选URL失败: {req['url']} - {e}")
+    
+    def get_cookies(self):
+        """获取页面Cookie（Selenium风格的字典列表）"""
+        return self.cookies
+    
+    def get_referer(self):
+        """获取页面地址，作为后续下载的Referer"""
+        return self.referer
+    
+    def filter_video_requests(self, requests_list=None, keywords=None):
+        """
+        过滤出媒体相关的请求
+        
+        Args:
+            requests_list: 请求列表，默认为最近一次抓包的结果
+            keywords: 关键词列表，提供时只保留URL包含任一关键词的请求
+        
+        Returns:
+            list: 媒体请求列表
+        """
+        requests_list = self.requests if requests_list is None else requests_list
+        return RequestClassifier(keywords).classify(requests_list).media
+    
+    def get_all_video_candidates(self, keywords=None):
+        """
+        按置信度整理视频候选URL
+        
+        Returns:
+            dict: {'high_confidence', 'medium_confidence', 'keyword_matches'}，每项为URL列表
+        """
+        return RequestClassifier(keywords).classify(self.requests).candidates
+    
+    def classify(self, requests_list=None, keywords=None):
+        """
+        一次遍历完成全部分类（代替分别调用上面三个方法和分离音视频检测）
+        
+        Args:
+            requests_list: 请求列表，默认为最近一次抓包的结果
+            keywords: 关键词列表
+        
+        Returns:
+            Classification: 分类结果
+        """
+        requests_list = self.requests if requests_list is None else requests_list
+        return RequestClassifier(keywords).classify(requests_list)
+    
+    def extract_stream_urls(self, requests_list):
+        """
+        按流媒体类型分组
+        
+        Returns:
+            dict: {'hls', 'dash', 'direct', 'segments'}，每项为URL列表
+        """
+        return RequestClassifier().classify(requests_list).streams
+
+
+class NetworkLog:
+    """
+    网络请求记录
+    
+    增量读取Chrome性能日志，整理出请求列表，并跟踪尚未完成的请求，
+    用于判断页面网络是否已经空闲。
+    """
+    
+    # 媒体播放、WebSocket等长连接可能一直不结束，不参与空闲判断
+    LONG_LIVED_TYPES = ('Media', 'WebSocket', 'EventSource')
+    
+    def __init__(self):
+        """初始化网络请求记录"""
+        self._requests = {}
+        self._pending = set()
+        self._last_activity = time.monotonic()
+    
+    @property
+    def requests(self):
+        """按发出顺序排列的请求列表"""
+        return list(self._requests.values())
+    
+    def feed(self, entries):
+        """
+        处理新的性能日志条目
+        
+        Args:
+            entries: driver.get_log('performance') 的返回值
+        """
+        for entry in entries:
+            try:
+                message = json.loads(entry['message'])['message']
+            except (KeyError, ValueError):
+                continue
+            
+            method = message.get('method')
+            params = message.get('params', {})
+            request_id = params.get('requestId')
+            
+            if method == 'Network.requestWillBeSent':
+                request = params['request']
+                if not request['url'].startswith('http'):
+                    continue
+                self._requests[request_id] = {
+                    'url': request['url'],
+                    'method': request.get('method', 'GET'),
+                    'type': params.get('type', ''),
+                    'status': None,
+                    'mime_type': '',
+                    'size': 0,
+                    'headers': request.get('headers', {})
+                }
+                if params.get('type') not in self.LONG_LIVED_TYPES:
+                    self._pending.add(request_id)
+            elif method == 'Network.responseReceived' and request_id in self._requests:
+                response = params['response']
+                headers = {key.lower(): value for key, value in response.get('headers', {}).items()}
+                self._requests[request_id].update({
+                    'status': response.get('status'),
+                    'mime_type': response.get('mimeType', ''),
+                    'size': int(headers.get('content-length', 0) or 0)
+                })
+            elif method in ('Network.loadingFinished', 'Network.loadingFailed') and request_id in self._requests:
+                req = self._requests[request_id]
+                req['size'] = max(req['size'], int(params.get('encodedDataLength', 0)))
+                self._pending.discard(request_id)
+            else:
+                continue
+            
+            self._last_activity = time.monotonic()
+    
+    def idle_for(self):
+        """网络已经空闲的秒数，仍有未完成的请求时返回0"""
+        if self._pending:
+            return 0.0
+        return time.monotonic() - self._last_activity
+
+
+def parse_performance_log(entries):
+    """
+    从Chrome性能日志中整理网络请求
+    
+    Args:
+        entries: driver.get_log('performance') 的返回值
+    
+    Returns:
+        list: 按发出顺序排列的请求列表
+    """
+    network = NetworkLog()
+    network.feed(entries)
+    return network.requests
+
+
+_default_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_browser_pool():
+    """获取进程内共享的浏览器池"""
+    global _default_pool
+    
+    with _pool_lock:
+        if _default_pool is None:
+            _default_pool = BrowserPool()
+        return _default_pool
+
+
+def configure_browser_pool(size=0, headless=True, max_uses=20, max_memory_mb=1024, proxy=None, logger=None):
+    """
+    替换进程内共享的浏览器池（原有空闲浏览器会被关闭）
+    
+    Returns:
+        BrowserPool: 新的浏览器池
+    """
+    global _default_pool
+    
+    with _pool_lock:
+        if _default_pool is not None:
+            _default_pool.close()
+        _default_pool = BrowserPool(size, headless, max_uses, max_memory_mb, proxy, logger)
+        return _default_pool
+
+
+def load_capture_idle_time(config_file='config.ini'):
+    """读取[capture]节的network_idle（秒），未配置时为0.5"""
+    config = configparser.ConfigParser()
+    config.read(config_file, encoding='utf-8')
+    if config.has_section('capture'):
+        return config['capture'].getfloat('network_idle', 0.5)
+    return 0.5
+
+
+def load_browser_pool_size(config_file='config.ini'):
+    """读取[capture]节的pool_size，未配置时为0（不使用浏览器池）"""
+    config = configparser.ConfigParser()
+    config.read(config_file, encoding='utf-8')
+    if config.has_section('capture'):
+        return max(0, config['capture'].getint('pool_size', 0))
+    return 0
+
+
+def load_browser_pool_config(config_file='config.ini', headless=True, proxy=None, logger=None):
+    """
+    从配置文件的[capture]节读取并应用浏览器池设置
+    
+    Returns:
+        BrowserPool: 新的浏览器池，pool_size为0时其size为0，表示不使用浏览器池
+    """
+    config = configparser.ConfigParser()
+    config.read(config_file, encoding='utf-8')
+    capture = config['capture'] if config.has_section('capture') else {}
+    
+    return configure_browser_pool(
+        size=load_browser_pool_size(config_file),
+        headless=headless,
+        max_uses=int(capture.get('pool_max_uses', 20) or 20),
+        max_memory_mb=int(capture.get('pool_max_memory', 1024) or 0),
+        proxy=proxy,
+        logger=logger
+    )
+
+
+@atexit.register
+def _close_default_pool():
+    """进程退出时关闭共享浏览器池中的浏览器"""
+    if _default_pool is not None:
+        _default_pool.close()
@@ -0,0 +1,284 @@
+"""抓包结果缓存 - 按页面URL缓存Cookie、Referer和视频候选，重复运行时跳过浏览器"""
+
+import configparser
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+
+from .browser_pool import PooledCapture
+from .http_session import create_session
+
+
+# 规范化URL时去掉的跟踪参数
+TRACKING_PARAMS = ('spm_id_from', 'from_source', 'share_source', 'share_medium', 'vd_source', 'fbclid', 'gclid')
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+# 缓存记录的格式版本，格式变化后旧记录视为未命中
+ENTRY_VERSION = 2
+
+
+def normalize_url(url):
+    """
+    规范化页面URL作为缓存键
+    
+    协议和主机转为小写，去掉默认端口、片段和跟踪参数，查询参数按名称排序。
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith('utm_') and key not in TRACKING_PARAMS
+    )
+    return urlunsplit((scheme, host, parts.path or '/', urlencode(query), ''))
+
+
+class CaptureCache:
+    """
+    抓包结果缓存
+    
+    保存在SQLite中，每条记录有有效期（ttl），超过max_entries条时按最近使用
+    时间淘汰最旧的记录。记录中保存未经关键词过滤的完整请求列表（PooledCapture
+    的请求格式），换用其他关键词时重新分类即可。
+    
+    会话Cookie（没有过期时间）随浏览器关闭而失效，不写入缓存；记录的有效期
+    不超过其中最早过期的Cookie，过期记录连同Cookie一并删除。数据库文件只允许
+    当前用户读写。
+    """
+    
+    def __init__(self, path='data/capture_cache.db', ttl=3600, max_entries=200, logger=None):
+        """
+        初始化抓包结果缓存
+        
+        Args:
+            path: 缓存数据库路径
+            ttl: 记录有效期（秒）
+            max_entries: 最多保存的记录数
+            logger: 日志记录器
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self.logger = logger or logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        try:
+            os.chmod(path, 0o600)
+        except OSError as e:
+            self.logger.debug(f"无法限制缓存文件权限: {e}")
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS capture_cache (
+                url TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                expires_at REAL NOT NULL DEFAULT 0
+            )
+        ''')
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(capture_cache)')]
+        if 'expires_at' not in columns:
+            # 旧版本的记录可能包含会话Cookie，没有过期时间，随下面的清理一起删除
+            self.conn.execute('ALTER TABLE capture_cache ADD COLUMN expires_at REAL NOT NULL DEFAULT 0')
+        self.conn.execute('DELETE FROM capture_cache WHERE expires_at <= ?', (time.time(),))
+        self.conn.commit()
+    
+    def get(self, url):
+        """
+        读取未过期的缓存记录
+        
+        Returns:
+            dict: {'cookies', 'referer', 'requests', 'candidates', 'streams', 'keywords', 'version'}，
+                  未命中或记录格式已过时返回None
+        """
+        key = normalize_url(url)
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT data, created_at, expires_at FROM capture_cache WHERE url = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl or now >= row[2]:
+                self.conn.execute('DELETE FROM capture_cache WHERE url = ?', (key,))
+                self.conn.commit()
+                return None
+            
+            self.conn.execute('UPDATE capture_cache SET last_used = ? WHERE url = ?', (now, key))
+            self.conn.commit()
+        entry = json.loads(row[0])
+        return entry if entry.get('version') == ENTRY_VERSION else None
+    
+    def put(self, url, entry):
+        """
+        写入缓存记录
+        
+        Args:
+            url: 页面URL
+            entry: 抓包结果，需要能序列化为JSON；requests为完整的请求列表
+        
+        Returns:
+            bool: 是否写入成功
+        """
+        now = time.time()
+        cookies, expires_at = _persistent_cookies(entry.get('cookies'), now + self.ttl)
+        try:
+            data = json.dumps(dict(entry, cookies=cookies, version=ENTRY_VERSION), ensure_ascii=False)
+        except (TypeError, ValueError) as e:
+            self.logger.debug(f"抓包结果无法缓存: {e}")
+            return False
+        
+        with self._lock:
+            self.conn.execute('DELETE FROM capture_cache WHERE expires_at <= ?', (now,))
+            self.conn.execute(
+                'INSERT OR REPLACE INTO capture_cache VALUES (?, ?, ?, ?, ?)',
+                (normalize_url(url), data, now, now, expires_at)
+            )
+            self.conn.execute('''
+                DELETE FROM capture_cache WHERE url IN (
+                    SELECT url FROM capture_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+            ''', (self.max_entries,))
+            self.conn.commit()
+        return True
+    
+    def invalidate(self, url):
+        """删除页面的缓存记录"""
+        with self._lock:
+            self.conn.execute('DELETE FROM capture_cache WHERE url = ?', (normalize_url(url),))
+            self.conn.commit()
+    
+    def validate(self, entry, proxy=None):
+        """
+        复用前的快速校验
+        
+        首选视频URL的HEAD请求没有返回401/403/404/410（带签名的媒体地址过期后
+        通常返回这些状态码）。Cookie过期的记录在get()时已被删除。
+        
+        Returns:
+            bool: 缓存是否仍然可用
+        """
+        url = _first_url(entry)
+        if not url:
+            return True
+        
+        session = create_session(proxy=proxy, cookies=entry.get('cookies'), referer=entry.get('referer'))
+        try:
+            response = session.head(url, timeout=5, allow_redirects=True)
+            return response.status_code not in (401, 403, 404, 410)
+        except requests.exceptions.RequestException:
+            return False
+        finally:
+            session.close()
+    
+    def close(self):
+        """关闭缓存数据库"""
+        with self._lock:
+            self.conn.close()
+
+
+class CachedCapture(PooledCapture):
+    """
+    从缓存恢复的抓包结果
+    
+    与PooledCapture接口一致，但不启动浏览器：start_capture直接返回缓存的
+    完整请求列表，过滤和分类与实时抓包相同。关键词与缓存时相同时直接返回
+    缓存的候选列表。
+    """
+    
+    def __init__(self, entry, logger=None):
+        """
+        初始化缓存抓包结果
+        
+        Args:
+            entry: CaptureCache.get() 返回的记录
+            logger: 日志记录器
+        """
+        super().__init__(logger=logger, idle_time=0)
+        self.entry = entry
+        self.requests = entry.get('requests') or []
+        self.cookies = entry.get('cookies') or []
+        self.referer = entry.get('referer')
+        self.wait_reason = 'cache'
+    
+    def start_capture(self, url, wait_time=10, on_candidate=None):
+        """返回缓存的请求列表"""
+        self.logger.info(f"使用缓存的抓包结果: {url}")
+        return self.requests
+    
+    def get_all_video_candidates(self, keywords=None):
+        """关键词与缓存时一致时返回缓存的候选列表"""
+        if self.entry.get('candidates') and self.entry.get('keywords') == keywords:
+            return self.entry['candidates']
+        return super().get_all_video_candidates(keywords)
+
+
+def _persistent_cookies(cookies, expires_at):
+    """
+    筛选可以写入缓存的Cookie
+    
+    只保留带过期时间且尚未过期的Cookie（Selenium风格的字典列表）；没有过期
+    时间的会话Cookie和无法判断过期时间的Cookie字典不写入磁盘。
+    
+    Args:
+        cookies: 抓包得到的Cookie
+        expires_at: 记录本身的过期时间戳
+    
+    Returns:
+        tuple: (保留的Cookie列表, 不晚于最早过期Cookie的记录过期时间戳)
+    """
+    kept = []
+    if not isinstance(cookies, list):
+        return kept, expires_at
+    
+    now = time.time()
+    for cookie in cookies:
+        expiry = cookie.get('expiry') if isinstance(cookie, dict) else None
+        if expiry and expiry > now:
+            kept.append(cookie)
+            expires_at = min(expires_at, expiry)
+    return kept, expires_at
+
+
+def _first_url(entry):
+    """缓存记录中最可能被下载的URL"""
+    candidates = entry.get('candidates') or {}
+    streams = entry.get('streams') or {}
+    for urls in (candidates.get('high_confidence'), streams.get('hls'), streams.get('dash'),
+                 streams.get('direct'), candidates.get('medium_confidence')):
+        if urls:
+            return urls[0]
+    return None
+
+
+def load_capture_cache_config(config_file='config.ini', logger=None):
+    """
+    从配置文件的[capture]节读取缓存设置
+    
+    Returns:
+        CaptureCache: 抓包结果缓存，cache_ttl为0时返回None
+    """
+    config = configparser.ConfigParser()
+    config.read(config_file, encoding='utf-8')
+    capture = config['capture'] if config.has_section('capture') else {}
+    
+    ttl = int(capture.get('cache_ttl', 3600) or 0)
+    if ttl <= 0:
+        return None
+    return CaptureCache(
+        path=capture.get('cache_file', 'data/capture_cache.db') or 'data/capture_cache.db',
+        ttl=ttl,
+        max_entries=int(capture.get('cache_size', 200) or 200),
+        logger=logger
+    )
@@ -0,0 +1,239 @@
+"""自适应并发控制 - 按吞吐量、错误率和延迟以AIMD方式调整同时执行的任务数"""
+
+import configparser
+import logging
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+
+
+# 计算每MB耗时时文件大小的下限，小文件的耗时主要是建立连接的固定开销
+MIN_COST_BYTES = 256 * 1024
+
+
+class AdaptiveConcurrencyController:
+    """
+    自适应并发控制器
+    
+    每个任务执行前占用一个名额，传输过程中随时报告已传输的字节数，结束时
+    报告是否成功和耗时。每隔interval秒根据这段时间的统计调整名额上限（AIMD）：
+    
+    - 错误率超过error_threshold，或每MB的中位耗时超过基线的latency_tolerance倍：
+      上限乘以decrease_factor（乘性减）
+    - 名额被用满且总吞吐量没有下降：上限加1（加性增）
+    - 上次加名额后吞吐量明显下降：撤回这次增加，并保持一个间隔
+    
+    上限始终保持在 [min_limit, max_limit] 之间。
+    """
+    
+    def __init__(self, min_limit=1, max_limit=16, initial=None, interval=5.0,
+                 error_threshold=0.2, latency_tolerance=3.0, decrease_factor=0.5, logger=None):
+        """
+        初始化自适应并发控制器
+        
+        Args:
+            min_limit: 最小并发数
+            max_limit: 最大并发数
+            initial: 初始并发数，默认为min_limit与max_limit的中间值
+            interval: 调整间隔（秒）
+            error_threshold: 触发减少并发的错误率
+            latency_tolerance: 每MB的中位耗时超过基线多少倍时减少并发
+            decrease_factor: 乘性减少的系数
+            logger: 日志记录器
+        """
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        if initial is None:
+            initial = (self.min_limit + self.max_limit) // 2
+        self.limit = min(self.max_limit, max(self.min_limit, initial))
+        self.interval = interval
+        self.error_threshold = error_threshold
+        self.latency_tolerance = latency_tolerance
+        self.decrease_factor = decrease_factor
+        self.logger = logger or logging.getLogger(__name__)
+        
+        self.active = 0
+        self.waiting = 0
+        self.adjustments = 0
+        self._condition = threading.Condition()
+        self._window_start = time.monotonic()
+        self._window = self._new_window()
+        self._last = {'throughput': 0.0, 'error_rate': 0.0, 'latency': 0.0}
+        self._baseline_latency = None
+        self._last_action = None
+    
+    def _new_window(self):
+        return {'completed': 0, 'errors': 0, 'bytes': 0, 'costs': [], 'saturated': self.active >= self.limit}
+    
+    def acquire(self, timeout=None):
+        """
+        占用一个名额，达到上限时等待
+        
+        Returns:
+            bool: 是否成功占用（超时返回False）
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            self.waiting += 1
+            try:
+                while self.active >= self.limit:
+                    self._window['saturated'] = True
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self._condition.wait(remaining if remaining is not None else self.interval)
+                    self._maybe_adjust()
+            finally:
+                self.waiting -= 1
+            self.active += 1
+            if self.active >= self.limit:
+                self._window['saturated'] = True
+            return True
+    
+    def release(self, success=True, nbytes=0, latency=0.0, reported=0):
+        """
+        释放名额并报告任务结果
+        
+        Args:
+            success: 任务是否成功
+            nbytes: 任务传输的总字节数
+            latency: 任务耗时（秒）
+            reported: 已通过transferred()计入的字节数，不再重复计入吞吐量
+        """
+        with self._condition:
+            self.active = max(0, self.active - 1)
+            window = self._window
+            window['completed'] += 1
+            window['bytes'] += max(0, nbytes - reported)
+            if success:
+                # 按大小归一化，耗时不随文件大小变化
+                window['costs'].append(latency * 1024 * 1024 / max(nbytes, reported, MIN_COST_BYTES))
+            else:
+                window['errors'] += 1
+            self._maybe_adjust()
+            self._condition.notify_all()
+    
+    def transferred(self, result, nbytes):
+        """
+        报告任务传输过程中新传输的字节数，吞吐量按实际传输的时间统计
+        
+        Args:
+            result: slot()产出的任务结果
+            nbytes: 新传输的字节数
+        """
+        with self._condition:
+            self._window['bytes'] += nbytes
+            result['reported'] += nbytes
+            self._maybe_adjust()
+    
+    @contextmanager
+    def slot(self):
+        """
+        占用名额执行一个任务
+        
+        Yields:
+            dict: 任务结果，调用方填写 'success' 和 'bytes'（总字节数）；
+                  传输过程中可以用transferred()报告进度；抛出异常时记为失败
+        """
+        self.acquire()
+        result = {'success': False, 'bytes': 0, 'reported': 0}
+        start = time.monotonic()
+        try:
+            yield result
+        finally:
+            self.release(result['success'], result['bytes'], time.monotonic() - start, result['reported'])
+    
+    def _maybe_adjust(self):
+        """到达调整间隔时根据窗口统计调整上限（调用方持有锁）"""
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed < self.interval:
+            return
+        
+        window = self._window
+        if not window['completed']:
+            # 还没有任务结束，继续累积传输的字节数
+            return
+        self._window_start = now
+        self._window = self._new_window()
+        
+        throughput = window['bytes'] / elapsed
+        error_rate = window['errors'] / window['completed']
+        latency = statistics.median(window['costs']) if window['costs'] else 0.0
+        if latency:
+            # 基线取观察到的每MB最小中位耗时，缓慢上浮以适应网络状况的变化
+            if self._baseline_latency is None or latency < self._baseline_latency:
+                self._baseline_latency = latency
+            else:
+                self._baseline_latency *= 1.05
+        
+        previous = self._last
+        old_limit = self.limit
+        if error_rate > self.error_threshold or (
+                latency and self._baseline_latency and latency > self._baseline_latency * self.latency_tolerance):
+            self.limit = max(self.min_limit, int(self.limit * self.decrease_factor))
+            self._last_action = 'decrease'
+        elif self._last_action == 'increase' and throughput < previous['throughput'] * 0.8:
+            self.limit = max(self.min_limit, self.limit - 1)
+            self._last_action = 'revert'
+        elif self._last_action == 'revert':
+            # 撤回后保持一个间隔，避免在拐点两侧来回振荡
+            self._last_action = None
+        elif window['saturated'] and throughput >= previous['throughput'] * 0.95:
+            self.limit = min(self.max_limit, self.limit + 1)
+            self._last_action = 'increase'
+        else:
+            self._last_action = None
+        
+        self._last = {'throughput': throughput, 'error_rate': error_rate, 'latency': latency}
+        if self.limit != old_limit:
+            self.adjustments += 1
+            self.logger.info(
+                f"并发数调整: {old_limit} -> {self.limit} "
+                f"(吞吐 {throughput / 1024 / 1024:.2f} MB/s, 错误率 {error_rate:.0%}, 中位耗时 {latency:.2f}s/MB)"
+            )
+    
+    def snapshot(self):
+        """
+        当前状态
+        
+        Returns:
+            dict: {'limit', 'min_limit', 'max_limit', 'active', 'waiting',
+                   'throughput', 'error_rate', 'latency', 'adjustments'}，
+                  latency为上个间隔每MB的中位耗时（秒）
+        """
+        with self._condition:
+            return {
+                'limit': self.limit,
+                'min_limit': self.min_limit,
+                'max_limit': self.max_limit,
+                'active': self.active,
+                'waiting': self.waiting,
+                'throughput': self._last['throughput'],
+                'error_rate': self._last['error_rate'],
+                'latency': self._last['latency'],
+                'adjustments': self.adjustments
+            }
+
+
+def load_concurrency_config(config_file='config.ini', logger=None):
+    """
+    从配置文件的[tasks]节创建自适应并发控制器
+    
+    Returns:
+        AdaptiveConcurrencyController: 并发控制器
+    """
+    config = configparser.ConfigParser()
+    config.read(config_file, encoding='utf-8')
+    tasks = config['tasks'] if config.has_section('tasks') else {}
+    
+    initial = tasks.get('initial_workers')
+    return AdaptiveConcurrencyController(
+        min_limit=int(tasks.get('min_workers', 1) or 1),
+        max_limit=int(tasks.get('max_workers', 16) or 16),
+        initial=int(initial) if initial else None,
+        interval=float(tasks.get('adjust_interval', 5) or 5),
+        error_threshold=float(tasks.get('error_threshold', 0.2) or 0.2),
+        logger=logger
+    )
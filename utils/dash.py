@@ -0,0 +1,420 @@
+"""DASH流下载器 - 解析MPD并并行下载视频轨和音频轨"""
+
+import logging
+import math
+import os
+import re
+import threading
+import xml.etree.ElementTree as ET
+from urllib.parse import urljoin
+
+import requests
+
+from .hls import HLSPipelineDownloader
+from .http_session import create_session
+from .mux import mux_streams
+from .quality import pick_variant
+
+
+DURATION_PATTERN = re.compile(
+    r'P(?:(?P<days>\d+(?:\.\d+)?)D)?'
+    r'(?:T(?:(?P<hours>\d+(?:\.\d+)?)H)?(?:(?P<minutes>\d+(?:\.\d+)?)M)?(?:(?P<seconds>\d+(?:\.\d+)?)S)?)?'
+)
+TEMPLATE_PATTERN = re.compile(r'\$(RepresentationID|Number|Bandwidth|Time)(?:%0(\d+)d)?\$')
+
+# 单文件（SegmentBase）表示按该大小拆分为多个Range请求并行下载
+RANGE_PART_SIZE = 4 * 1024 * 1024
+
+
+def parse_duration(value):
+    """解析ISO 8601时长（例如 PT1H2M3.5S），返回秒数"""
+    match = DURATION_PATTERN.fullmatch(value or '')
+    if not match:
+        return 0.0
+    parts = {key: float(val) for key, val in match.groupdict().items() if val}
+    return (parts.get('days', 0) * 86400 + parts.get('hours', 0) * 3600
+            + parts.get('minutes', 0) * 60 + parts.get('seconds', 0))
+
+
+def _local(tag):
+    """去掉XML命名空间前缀"""
+    return tag.rsplit('}', 1)[-1]
+
+
+def _child(element, name):
+    """查找第一个指定名称的子元素（忽略命名空间）"""
+    for child in element:
+        if _local(child.tag) == name:
+            return child
+    return None
+
+
+def _child_of(elements, name):
+    """在多个元素中依次查找指定名称的子元素，返回第一个找到的"""
+    for element in elements:
+        child = _child(element, name)
+        if child is not None:
+            return child
+    return None
+
+
+def _children(element, name):
+    """查找所有指定名称的子元素（忽略命名空间）"""
+    return [child for child in element if _local(child.tag) == name]
+
+
+def _join_base(base_url, element):
+    """根据元素的BaseURL子元素更新基础地址"""
+    base = _child(element, 'BaseURL')
+    if base is not None and base.text:
+        return urljoin(base_url, base.text.strip())
+    return base_url
+
+
+def _parse_range(value):
+    """将 'start-end' 转换为 (start, length)"""
+    start, end = value.split('-')
+    return int(start), int(end) - int(start) + 1
+
+
+def _fill_template(template, representation, number=None, time=None):
+    """
+    替换SegmentTemplate中的 $RepresentationID$ / $Number$ / $Bandwidth$ / $Time$
+    
+    Raises:
+        ValueError: 模板使用了当前分片没有的标识符（例如初始化分片中的 $Number$）
+    """
+    values = {
+        'RepresentationID': representation.get('id', ''),
+        'Bandwidth': representation.get('bandwidth', ''),
+        'Number': number,
+        'Time': time
+    }
+    
+    def replace(match):
+        value = values[match.group(1)]
+        if value is None:
+            raise ValueError(f"SegmentTemplate中的 ${match.group(1)}$ 没有可用的值: {template}")
+        if match.group(2):
+            return str(value).zfill(int(match.group(2)))
+        return str(value)
+    
+    return TEMPLATE_PATTERN.sub(replace, template.replace('$$', '$'))
+
+
+def _template_segments(template, representation, base_url, period_duration):
+    """根据SegmentTemplate生成分片URL列表"""
+    segments = []
+    timescale = int(template.get('timescale', 1))
+    start_number = int(template.get('startNumber', 1))
+    offset = int(template.get('presentationTimeOffset', 0))
+    
+    init = template.get('initialization')
+    if init:
+        segments.append((urljoin(base_url, _fill_template(init, representation)), None))
+    
+    media = template.get('media')
+    if not media:
+        return segments
+    
+    timeline = _child(template, 'SegmentTimeline')
+    if timeline is not None:
+        number = start_number
+        time = 0
+        entries = _children(timeline, 'S')
+        for i, s in enumerate(entries):
+            time = int(s.get('t', time))
+            duration = int(s.get('d'))
+            repeat = int(s.get('r', 0))
+            if repeat < 0:
+                # r=-1：重复到下一个S的@t为止，最后一个S重复到Period结束
+                if i + 1 < len(entries):
+                    until = entries[i + 1].get('t')
+                    if until is None:
+                        raise ValueError("SegmentTimeline中r=-1之后的S缺少@t")
+                    until = int(until)
+                elif period_duration:
+                    until = offset + period_duration * timescale
+                else:
+                    raise ValueError("SegmentTimeline中r=-1需要Period的时长")
+                repeat = max(0, math.ceil((until - time) / duration) - 1)
+            for _ in range(repeat + 1):
+                segments.append((urljoin(base_url, _fill_template(media, representation, number, time)), None))
+                time += duration
+                number += 1
+    else:
+        duration = int(template.get('duration', 0))
+        if not duration or not period_duration:
+            raise ValueError("SegmentTemplate缺少duration或时长信息，无法计算分片数")
+        count = math.ceil(period_duration * timescale / duration)
+        # 没有SegmentTimeline时，分片的开始时间按序号和固定时长推算
+        for number in range(start_number, start_number + count):
+            time = offset + (number - start_number) * duration
+            segments.append((urljoin(base_url, _fill_template(media, representation, number, time)), None))
+    
+    return segments
+
+
+def _list_segments(segment_list, base_url):
+    """根据SegmentList生成分片列表"""
+    segments = []
+    
+    init = _child(segment_list, 'Initialization')
+    if init is not None:
+        init_range = init.get('range')
+        segments.append((
+            urljoin(base_url, init.get('sourceURL', '')),
+            _parse_range(init_range) if init_range else None
+        ))
+    
+    for segment_url in _children(segment_list, 'SegmentURL'):
+        media_range = segment_url.get('mediaRange')
+        segments.append((
+            urljoin(base_url, segment_url.get('media', '')),
+            _parse_range(media_range) if media_range else None
+        ))
+    
+    return segments
+
+
+def parse_mpd(text, mpd_url):
+    """
+    解析静态MPD清单（仅处理第一个Period，其余Period的数量记录在skipped_periods中）
+    
+    Args:
+        text: MPD内容
+        mpd_url: MPD的URL，用于拼接相对地址
+    
+    Returns:
+        dict: {'video': [...], 'audio': [...], 'skipped_periods': 未处理的Period数}，
+              video和audio中每项为表示（Representation）信息：
+              {'id', 'bandwidth', 'width', 'height', 'codecs', 'mime_type', 'segments'}
+              segments为 (url, byterange) 列表，byterange为None时表示整个文件
+    """
+    root = ET.fromstring(text)
+    if root.get('type') == 'dynamic':
+        raise ValueError("不支持直播（dynamic）类型的MPD")
+    
+    periods = _children(root, 'Period')
+    if not periods:
+        raise ValueError("MPD中没有Period")
+    period = periods[0]
+    
+    # 没有@duration时，时长由下一个Period的@start或整个清单的时长推算
+    period_duration = parse_duration(period.get('duration'))
+    if not period_duration:
+        end = periods[1].get('start') if len(periods) > 1 else root.get('mediaPresentationDuration')
+        period_duration = max(0.0, parse_duration(end) - parse_duration(period.get('start')))
+    period_base = _join_base(_join_base(mpd_url, root), period)
+    tracks = {'video': [], 'audio': [], 'skipped_periods': len(periods) - 1}
+    
+    for adaptation in _children(period, 'AdaptationSet'):
+        adaptation_base = _join_base(period_base, adaptation)
+        
+        for rep in _children(adaptation, 'Representation'):
+            mime_type = rep.get('mimeType') or adaptation.get('mimeType') or ''
+            content_type = adaptation.get('contentType') or mime_type.split('/')[0]
+            if content_type not in ('video', 'audio'):
+                continue
+            
+            representation = {
+                'id': rep.get('id', ''),
+                'bandwidth': int(rep.get('bandwidth', 0)),
+                'width': int(rep.get('width') or adaptation.get('width') or 0),
+                'height': int(rep.get('height') or adaptation.get('height') or 0),
+                'codecs': rep.get('codecs') or adaptation.get('codecs') or '',
+                'mime_type': mime_type
+            }
+            rep_base = _join_base(adaptation_base, rep)
+            
+            # SegmentTemplate可以定义在AdaptationSet上，由Representation继承并覆盖
+            template = _child(rep, 'SegmentTemplate')
+            parent_template = _child(adaptation, 'SegmentTemplate')
+            if template is None:
+                template = parent_template
+            elif parent_template is not None:
+                merged = dict(parent_template.attrib)
+                merged.update(template.attrib)
+                timeline = _child_of((template, parent_template), 'SegmentTimeline')
+                template = ET.Element('SegmentTemplate', merged)
+                if timeline is not None:
+                    template.append(timeline)
+            
+            segment_list = _child_of((rep, adaptation), 'SegmentList')
+            
+            if template is not None:
+                representation['segments'] = _template_segments(template, representation, rep_base, period_duration)
+            elif segment_list is not None:
+                representation['segments'] = _list_segments(segment_list, rep_base)
+            else:
+                representation['segments'] = [(rep_base, None)]
+            
+            tracks[content_type].append(representation)
+    
+    return tracks
+
+
+class DashDownloader:
+    """
+    DASH流下载器
+    
+    解析MPD，为视频和音频各选择一个表示，两条轨道同时下载，
+    每条轨道内部通过有界窗口并行预取分片（与HLS流水线相同），最后用FFmpeg封装。
+    """
+    
+    def __init__(self, output_dir='downloads', prefetch=8, retries=3, session=None,
+                 proxy=None, logger=None, quality='best'):
+        """
+        初始化DASH下载器
+        
+        Args:
+            output_dir: 保存目录
+            prefetch: 每条轨道的预取窗口大小
+            retries: 单个分片的重试次数
+            session: 共享的requests会话，为None时从共享连接池创建
+            proxy: 代理服务器地址（未提供session时使用）
+            logger: 日志记录器
+            quality: 视频表示的选择偏好（'best'、'worst'或目标高度）
+        """
+        self.output_dir = output_dir
+        self.session = session or create_session(proxy=proxy)
+        self.logger = logger or logging.getLogger(__name__)
+        self.quality = quality
+        self.pipeline = HLSPipelineDownloader(
+            output_dir=output_dir,
+            prefetch=prefetch,
+            retries=retries,
+            session=self.session,
+            logger=self.logger
+        )
+        
+        os.makedirs(output_dir, exist_ok=True)
+    
+    def load_tracks(self, mpd_url):
+        """
+        获取并解析MPD
+        
+        Args:
+            mpd_url: MPD的URL
+        
+        Returns:
+            dict: {'video': [...], 'audio': [...]}，失败返回None
+        """
+        try:
+            response = self.session.get(mpd_url, timeout=30)
+            response.raise_for_status()
+            tracks = parse_mpd(response.text, response.url)
+        except (requests.exceptions.RequestException, ET.ParseError, ValueError) as e:
+            self.logger.error(f"解析MPD失败: {e}")
+            return None
+        
+        if tracks['skipped_periods']:
+            self.logger.warning(f"MPD包含 {tracks['skipped_periods'] + 1} 个Period，只下载第一个，其余已跳过")
+        return tracks
+    
+    def select_representation(self, representations, quality='best'):
+        """按画质偏好选择表示，默认选择画质和码率最高的"""
+        return pick_variant(representations, quality)
+    
+    def download(self, mpd_url, output_name='dash_video.mp4', merge=True):
+        """
+        下载DASH流
+        
+        Args:
+            mpd_url: MPD的URL
+            output_name: 输出文件名
+            merge: 是否用FFmpeg合并视频轨和音频轨
+        
+        Returns:
+            str: 输出文件路径（未合并时为视频轨路径），失败返回None
+        """
+        tracks = self.load_tracks(mpd_url)
+        if not tracks:
+            return None
+        
+        video = self.select_representation(tracks['video'], self.quality)
+        audio = self.select_representation(tracks['audio'])
+        if not video and not audio:
+            self.logger.error("MPD中没有可下载的视频或音频")
+            return None
+        
+        base_name = os.path.splitext(output_name)[0]
+        jobs = {}
+        if video:
+            self.logger.info(f"选择视频: {video['width']}x{video['height']} {video['codecs']} ({video['bandwidth']} bps)")
+            jobs['video'] = (video, os.path.join(self.output_dir, f"{base_name}.video{self._extension(video)}"))
+        if audio:
+            self.logger.info(f"选择音频: {audio['codecs']} ({audio['bandwidth']} bps)")
+            jobs['audio'] = (audio, os.path.join(self.output_dir, f"{base_name}.audio{self._extension(audio)}"))
+        
+        # 视频轨和音频轨同时下载
+        errors = {}
+        threads = [
+            threading.Thread(target=self._download_track, args=(kind, rep, path, errors), daemon=True)
+            for kind, (rep, path) in jobs.items()
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        if errors:
+            for kind, error in errors.items():
+                self.logger.error(f"DASH {kind} 轨道下载失败: {error}")
+            return None
+        
+        if 'video' in jobs and 'audio' in jobs and merge:
+            output_path = os.path.join(self.output_dir, output_name)
+            if mux_streams(jobs['video'][1], jobs['audio'][1], output_path, self.logger):
+                os.remove(jobs['video'][1])
+                os.remove(jobs['audio'][1])
+                return output_path
+            self.logger.warning("合并失败，保留独立的视频轨和音频轨文件")
+        
+        return jobs['video'][1] if 'video' in jobs else jobs['audio'][1]
+    
+    def _download_track(self, kind, representation, output_path, errors):
+        """下载单条轨道的全部分片"""
+        try:
+            segments = self._expand_segments(representation['segments'])
+            self.logger.info(f"开始下载DASH {kind} 轨道: {len(segments)} 个分片")
+            self.pipeline.download_segments(segments, output_path)
+        except Exception as e:
+            errors[kind] = e
+            if os.path.exists(output_path):
+                os.remove(output_path)
+    
+    def _expand_segments(self, segments):
+        """转换为流水线使用的分片格式；单文件表示拆分为多个Range请求"""
+        if len(segments) == 1 and segments[0][1] is None:
+            url = segments[0][0]
+            size = self._probe_size(url)
+            if size:
+                return [
+                    {'url': url, 'sequence': None, 'key': None,
+                     'byterange': (start, min(RANGE_PART_SIZE, size - start))}
+                    for start in range(0, size, RANGE_PART_SIZE)
+                ]
+        
+        return [
+            {'url': url, 'sequence': None, 'key': None, 'byterange': byterange}
+            for url, byterange in segments
+        ]
+    
+    def _probe_size(self, url):
+        """获取支持Range请求的文件大小，不支持时返回None"""
+        try:
+            response = self.session.head(url, timeout=15, allow_redirects=True)
+            if response.ok and response.headers.get('Accept-Ranges', '').lower() == 'bytes':
+                return int(response.headers.get('Content-Length') or 0) or None
+        except requests.exceptions.RequestException:
+            pass
+        return None
+    
+    def _extension(self, representation):
+        """根据MIME类型选择轨道文件扩展名"""
+        if 'webm' in representation['mime_type']:
+            return '.webm'
+        if representation['mime_type'].startswith('audio'):
+            return '.m4a'
+        return '.mp4'
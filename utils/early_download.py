@@ -0,0 +1,163 @@
+"""提前下载 - 抓包过程中发现视频后立即开始下载"""
+
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from .request_classifier import VIDEO_EXTENSIONS, contains_keyword, url_extension
+from .http_session import create_session
+from .media_dedup import canonical_media_key
+from .segmented import SegmentedDownloader, reserve_filename
+
+
+class EarlyDownloader:
+    """
+    提前下载器
+    
+    作为PooledCapture.start_capture的on_candidate回调使用：页面还在加载时，
+    每发现一个高置信度的视频文件就提交到后台线程池下载，浏览器等待时间
+    与传输时间重叠。流媒体清单和分片不在这里处理，仍由抓包结束后的流程
+    交给HLS/DASH下载器。
+    """
+    
+    def __init__(self, output_dir='downloads', workers=3, max_downloads=10, connections=1,
+                 retries=3, proxy=None, resume=False, keywords=None, logger=None,
+                 decryptor_factory=None, index=None):
+        """
+        初始化提前下载器
+        
+        Args:
+            output_dir: 保存目录
+            workers: 同时下载的文件数
+            max_downloads: 最多提前下载的文件数
+            connections: 支持Range的文件使用的连接数
+            retries: 下载失败重试次数
+            proxy: 代理服务器地址
+            resume: 是否启用断点续传
+            keywords: 关键词列表，提供时只下载URL包含任一关键词的视频
+            logger: 日志记录器
+            decryptor_factory: 返回流式解密器的可调用对象
+            index: 已下载媒体索引（DownloadIndex），下载过的媒体不再提交
+        """
+        self.output_dir = output_dir
+        self.max_downloads = max_downloads
+        self.connections = max(1, connections)
+        self.retries = max(1, retries)
+        self.proxy = proxy
+        self.resume = resume
+        self.keywords = keywords
+        self.logger = logger or logging.getLogger(__name__)
+        self.decryptor_factory = decryptor_factory
+        self.index = index
+        
+        self.urls = []
+        self._keys = set()
+        # 本次已分配的文件名（小写），路径末段相同的不同媒体依次加 _2、_3 后缀
+        self._names = set()
+        self.session = None
+        self._futures = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        
+        os.makedirs(output_dir, exist_ok=True)
+    
+    def submit(self, event):
+        """
+        处理抓包过程中发现的候选（on_candidate回调）
+        
+        Args:
+            event: {'url', 'kind', 'request', 'cookies', 'referer'}
+        """
+        url = event['url']
+        if event['kind'] != 'direct' or url_extension(url) not in VIDEO_EXTENSIONS:
+            return
+        if self.keywords and not contains_keyword(url, self.keywords):
+            return
+        if self.index and self.index.contains(url):
+            return
+        
+        with self._lock:
+            # 签名参数或镜像主机不同的同一媒体只下载一次
+            key = canonical_media_key(url)
+            if key in self._keys or len(self.urls) >= self.max_downloads:
+                return
+            self._keys.add(key)
+            self.urls.append(url)
+            filename = reserve_filename(url, self._names)
+            if self.session is None:
+                # 第一个候选出现时页面Cookie已基本就绪，后续下载共用该会话
+                self.session = create_session(proxy=self.proxy, cookies=event.get('cookies'),
+                                              referer=event.get('referer'))
+            
+            self.logger.info(f"抓包中发现视频，立即开始下载: {url}")
+            self._futures.append(self._executor.submit(self._download, url, filename))
+    
+    def wait(self):
+        """
+        等待所有提前下载完成
+        
+        Returns:
+            dict: {'success': 成功数, 'failed': 失败数, 'skipped': 跳过数}
+        """
+        results = {'success': 0, 'failed': 0, 'skipped': 0}
+        with self._lock:
+            futures = list(self._futures)
+        for future in futures:
+            results[future.result()] += 1
+        self._executor.shutdown()
+        return results
+    
+    def _download(self, url, filename):
+        """下载单个文件：支持Range时分段下载，否则流式下载"""
+        output_path = os.path.join(self.output_dir, filename)
+        if os.path.exists(output_path) and not os.path.exists(output_path + SegmentedDownloader.CHUNK_MAP_SUFFIX):
+            self.logger.info(f"文件已存在，跳过: {filename}")
+            return 'skipped'
+        
+        try:
+            segmented = SegmentedDownloader(
+                output_dir=self.output_dir,
+                connections=self.connections,
+                retries=self.retries,
+                resume=self.resume,
+                logger=self.logger,
+                session=self.session,
+                decryptor_factory=self.decryptor_factory
+            )
+            size = segmented.probe(url)
+            if size and (self.decryptor_factory is None or self.decryptor_factory().random_access):
+                ok = segmented.download(url, filename, size)
+            else:
+                ok = self._stream(url, output_path)
+            if ok and self.index:
+                self.index.add(url, output_path)
+            return 'success' if ok else 'failed'
+        except Exception as e:
+            self.logger.error(f"提前下载失败: {url} - {e}")
+            return 'failed'
+    
+    def _stream(self, url, output_path):
+        """单连接流式下载到临时文件（带重试）"""
+        temp_path = output_path + '.part'
+        for attempt in range(1, self.retries + 1):
+            decryptor = self.decryptor_factory() if self.decryptor_factory else None
+            try:
+                with self.session.get(url, stream=True, timeout=30) as response:
+                    response.raise_for_status()
+                    with open(temp_path, 'wb') as f:
+                        for data in response.iter_content(chunk_size=256 * 1024):
+                            f.write(decryptor.update(data) if decryptor else data)
+                        if decryptor:
+                            f.write(decryptor.finalize())
+                os.replace(temp_path, output_path)
+                self.logger.info(f"下载完成: {os.path.basename(output_path)}")
+                return output_path
+            except (requests.exceptions.RequestException, OSError, ValueError) as e:
+                self.logger.warning(f"下载失败 (第{attempt}次): {url} - {e}")
+        
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return None
@@ -0,0 +1,60 @@
+"""站点解析器 - 已知站点直接请求播放地址接口，无需启动浏览器抓包"""
+
+from .base import Extraction, ExtractionError, SiteExtractor
+from .bilibili import BilibiliExtractor
+from .vimeo import VimeoExtractor
+
+
+EXTRACTORS = [BilibiliExtractor, VimeoExtractor]
+
+
+def register_extractor(extractor_class):
+    """
+    注册站点解析器（可用作类装饰器），后注册的优先匹配
+    
+    Args:
+        extractor_class: SiteExtractor的子类
+    
+    Returns:
+        type: extractor_class
+    """
+    EXTRACTORS.insert(0, extractor_class)
+    return extractor_class
+
+
+def find_extractor(url):
+    """返回能处理该URL的解析器类，没有时返回None"""
+    for extractor_class in EXTRACTORS:
+        if extractor_class.suitable(url):
+            return extractor_class
+    return None
+
+
+def extract(url, quality='best', proxy=None, logger=None):
+    """
+    使用匹配的站点解析器解析页面
+    
+    Args:
+        url: 页面URL
+        quality: 画质偏好
+        proxy: 代理服务器地址
+        logger: 日志记录器
+    
+    Returns:
+        Extraction: 解析结果，没有匹配的解析器或解析失败时返回None
+    """
+    extractor_class = find_extractor(url)
+    if extractor_class is None:
+        return None
+    
+    extractor = extractor_class(proxy=proxy, logger=logger)
+    try:
+        result = extractor.extract(url, quality)
+    except ExtractionError as e:
+        extractor.logger.warning(f"{extractor_class.name} 解析失败: {e}")
+        return None
+    
+    if result.is_empty():
+        return None
+    extractor.logger.info(f"{extractor_class.name} 解析完成: {result.title or url}")
+    return result
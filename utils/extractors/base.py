@@ -0,0 +1,106 @@
+"""站点解析器基类"""
+
+import logging
+from urllib.parse import urlparse
+
+import requests
+
+from ..http_session import create_session
+
+
+class ExtractionError(Exception):
+    """站点解析失败（接口返回错误、需要登录、地区限制等）"""
+
+
+class Extraction:
+    """
+    站点解析结果
+    
+    Attributes:
+        title: 视频标题
+        direct: 可直接下载的视频文件URL列表
+        pairs: 需要合并的 (视频轨URL, 音频轨URL) 列表
+        segments: 同一个视频按顺序分段的文件URL列表，下载后依次拼接
+        hls: HLS播放列表URL列表
+        dash: DASH清单URL列表
+        cookies: 下载时需要携带的Cookie（字典）
+        referer: 下载时需要携带的Referer
+    """
+    
+    def __init__(self, title='', direct=None, pairs=None, segments=None, hls=None, dash=None,
+                 cookies=None, referer=None):
+        self.title = title
+        self.direct = direct or []
+        self.pairs = pairs or []
+        self.segments = segments or []
+        self.hls = hls or []
+        self.dash = dash or []
+        self.cookies = cookies or {}
+        self.referer = referer
+    
+    def is_empty(self):
+        """是否没有任何可下载的地址"""
+        return not (self.direct or self.pairs or self.segments or self.hls or self.dash)
+
+
+class SiteExtractor:
+    """
+    站点解析器基类
+    
+    子类声明name和hosts，实现extract()：只通过HTTP请求站点的播放地址
+    接口取得媒体URL，不启动浏览器。
+    """
+    
+    name = ''
+    hosts = ()
+    referer = None
+    
+    def __init__(self, proxy=None, timeout=10, logger=None):
+        """
+        初始化站点解析器
+        
+        Args:
+            proxy: 代理服务器地址
+            timeout: 接口请求超时时间（秒）
+            logger: 日志记录器
+        """
+        self.timeout = timeout
+        self.logger = logger or logging.getLogger(__name__)
+        self.session = create_session(proxy=proxy, referer=self.referer)
+    
+    @classmethod
+    def suitable(cls, url):
+        """URL的主机是否属于该站点"""
+        host = (urlparse(url).hostname or '').lower()
+        return any(host == domain or host.endswith('.' + domain) for domain in cls.hosts)
+    
+    def extract(self, url, quality='best'):
+        """
+        解析页面的媒体地址
+        
+        Args:
+            url: 页面URL
+            quality: 画质偏好（'best'、'worst'或目标高度）
+        
+        Returns:
+            Extraction: 解析结果
+        
+        Raises:
+            ExtractionError: 解析失败
+        """
+        raise NotImplementedError
+    
+    def _get_json(self, url, params=None):
+        """请求JSON接口"""
+        try:
+            response = self.session.get(url, params=params, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            raise ExtractionError(f"请求接口失败: {url} - {e}") from e
+    
+    def _result(self, **kwargs):
+        """创建解析结果，附带接口请求过程中得到的Cookie和Referer"""
+        kwargs.setdefault('cookies', self.session.cookies.get_dict())
+        kwargs.setdefault('referer', self.referer)
+        return Extraction(**kwargs)
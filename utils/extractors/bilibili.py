@@ -0,0 +1,112 @@
+"""B站解析器 - 调用视频信息和播放地址接口"""
+
+import re
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+from ..quality import pick_variant
+from .base import ExtractionError, SiteExtractor
+
+
+BVID_PATTERN = re.compile(r'(BV[0-9A-Za-z]{10})')
+AID_PATTERN = re.compile(r'/av(\d+)', re.IGNORECASE)
+
+
+class BilibiliExtractor(SiteExtractor):
+    """
+    B站视频解析器
+    
+    先用视频信息接口取得分P的cid，再请求播放地址接口（fnval=4048，返回
+    DASH格式的独立视频轨和音频轨）。未登录时接口只返回较低画质。
+    """
+    
+    name = 'bilibili'
+    hosts = ('bilibili.com', 'b23.tv')
+    referer = 'https://www.bilibili.com/'
+    
+    VIEW_API = 'https://api.bilibili.com/x/web-interface/view'
+    PLAYURL_API = 'https://api.bilibili.com/x/player/playurl'
+    
+    def extract(self, url, quality='best'):
+        if (urlparse(url).hostname or '').endswith('b23.tv'):
+            url = self._resolve_short_link(url)
+        
+        ids = self._video_ids(url)
+        view = self._call(self.VIEW_API, ids)
+        pages = view.get('pages') or []
+        page = parse_qs(urlparse(url).query).get('p', ['1'])[0]
+        index = int(page) - 1 if page.isdigit() else 0
+        cid = pages[index]['cid'] if 0 <= index < len(pages) else view.get('cid')
+        if not cid:
+            raise ExtractionError("视频信息中没有cid")
+        
+        play = self._call(self.PLAYURL_API, dict(ids, cid=cid, qn=127, fnval=4048, fourk=1))
+        title = view.get('title', '')
+        
+        dash = play.get('dash')
+        if dash:
+            video = self._pick_video(dash.get('video') or [], quality)
+            audio = self._pick_audio(dash)
+            if video and audio:
+                return self._result(title=title, pairs=[(video, audio)])
+            if video:
+                return self._result(title=title, direct=[video])
+        
+        # 旧格式的durl是同一个视频的多个分段，需要按顺序拼接
+        segments = [item['url'] for item in play.get('durl') or [] if item.get('url')]
+        if len(segments) > 1:
+            return self._result(title=title, segments=segments)
+        if segments:
+            return self._result(title=title, direct=segments)
+        raise ExtractionError("播放地址接口没有返回可下载的地址")
+    
+    def _call(self, api, params):
+        """请求接口并检查B站的业务状态码"""
+        data = self._get_json(api, params)
+        if data.get('code') != 0:
+            raise ExtractionError(f"接口返回错误: {data.get('code')} {data.get('message', '')}")
+        return data.get('data') or {}
+    
+    def _resolve_short_link(self, url):
+        """b23.tv短链接跳转到视频页"""
+        try:
+            return self.session.head(url, allow_redirects=True, timeout=self.timeout).url
+        except requests.exceptions.RequestException as e:
+            raise ExtractionError(f"短链接解析失败: {e}") from e
+    
+    @staticmethod
+    def _video_ids(url):
+        match = BVID_PATTERN.search(url)
+        if match:
+            return {'bvid': match.group(1)}
+        match = AID_PATTERN.search(url)
+        if match:
+            return {'aid': match.group(1)}
+        raise ExtractionError("URL中没有BV号或av号")
+    
+    @staticmethod
+    def _track_url(track):
+        return track.get('baseUrl') or track.get('base_url')
+    
+    def _pick_video(self, tracks, quality):
+        """按画质偏好选择视频轨，相同高度优先AVC编码（兼容性最好）"""
+        best = pick_variant(tracks, quality)
+        if not best:
+            return None
+        same_height = [track for track in tracks if track.get('height') == best.get('height')]
+        avc = [track for track in same_height if (track.get('codecs') or '').startswith('avc1')]
+        if avc:
+            best = max(avc, key=lambda track: track.get('bandwidth', 0))
+        return self._track_url(best)
+    
+    def _pick_audio(self, dash):
+        """选择码率最高的音频轨（包括无损和杜比音轨）"""
+        tracks = list(dash.get('audio') or [])
+        flac = (dash.get('flac') or {}).get('audio')
+        if flac:
+            tracks.append(flac)
+        tracks.extend((dash.get('dolby') or {}).get('audio') or [])
+        if not tracks:
+            return None
+        return self._track_url(max(tracks, key=lambda track: track.get('bandwidth', 0)))
@@ -0,0 +1,257 @@
+"""下载历史全文检索 - 基于SQLite FTS5的URL、标题、标签和站点索引"""
+
+import logging
+import re
+import sqlite3
+import threading
+
+from .versioning import load_database_path
+
+
+FTS_TABLE = 'download_history_fts'
+
+# 索引列及排序权重（bm25的列权重，越大越重要）
+FTS_COLUMNS = ('url', 'title', 'site', 'tags')
+COLUMN_WEIGHTS = (1.0, 4.0, 2.0, 3.0)
+
+# download_history中可作为标题的列，按优先级
+TITLE_COLUMNS = ('title', 'filename', 'output_path')
+
+# download_tags中指向下载记录的列：按rowid关联或按task_id关联
+TAG_LINK_COLUMNS = ('download_id', 'history_id', 'record_id', 'task_id')
+
+HIGHLIGHT_START = '<mark>'
+HIGHLIGHT_END = '</mark>'
+
+FIELD_TERM_PATTERN = re.compile(r'^(url|title|site|tags):(.+)$')
+
+
+def site_expression(url):
+    """从URL取主机名的SQL表达式（只用内置函数，触发器在任何连接中都能执行）"""
+    rest = f"substr({url}, instr({url}, '://') + 3)"
+    return (
+        f"lower(CASE WHEN instr({url}, '://') = 0 THEN '' "
+        f"WHEN instr({rest}, '/') > 0 THEN substr({rest}, 1, instr({rest}, '/') - 1) "
+        f"ELSE {rest} END)"
+    )
+
+
+def build_match_query(keyword):
+    """
+    把用户输入转换为FTS5查询
+    
+    每个词都按前缀匹配，词之间为AND关系；"site:bilibili"形式的词只匹配
+    指定的列。
+    
+    Args:
+        keyword: 用户输入
+    
+    Returns:
+        str: FTS5 MATCH表达式，没有有效的词时返回空字符串
+    """
+    terms = []
+    for word in keyword.split():
+        column = None
+        match = FIELD_TERM_PATTERN.match(word)
+        if match:
+            column, word = match.groups()
+        # FTS5字符串中的双引号写两次转义
+        term = '"' + word.replace('"', '""') + '"*'
+        terms.append(f'{column} : {term}' if column else term)
+    return ' AND '.join(terms)
+
+
+class HistorySearchIndex:
+    """
+    下载历史全文检索索引
+    
+    FTS5表的rowid与download_history的rowid一致，由触发器在插入、删除和
+    URL/标题修改时同步，标签由download_tags上的触发器同步；状态更新不会
+    触及索引。触发器只使用SQLite内置函数，DatabaseManager自己的写入也会
+    同步到索引。
+    """
+    
+    def __init__(self, path='data/downloads.db', logger=None):
+        """
+        初始化全文检索索引，首次创建时自动补齐已有记录
+        
+        Args:
+            path: 数据库路径（与DatabaseManager相同）
+            logger: 日志记录器
+        
+        Raises:
+            sqlite3.OperationalError: SQLite不支持FTS5，或没有download_history表
+        """
+        self.path = path
+        self.logger = logger or logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._inspect_schema()
+        if self._create_schema():
+            count = self.rebuild()
+            self.logger.info(f"下载历史全文索引已创建，补齐 {count} 条记录")
+    
+    def _columns(self, table):
+        return [row[1] for row in self.conn.execute(f'PRAGMA table_info({table})')]
+    
+    def _inspect_schema(self):
+        """确定标题列和标签关联方式"""
+        columns = self._columns('download_history')
+        if 'url' not in columns:
+            raise sqlite3.OperationalError("download_history表不存在或没有url列")
+        self.title_column = next((c for c in TITLE_COLUMNS if c in columns), None)
+        self.site_column = 'site' if 'site' in columns else None
+        
+        # 标签：tags(id, name) 与 download_tags(<下载记录>, tag_id)
+        self.tag_link = None
+        tag_columns = self._columns('tags')
+        link_columns = self._columns('download_tags')
+        if 'name' in tag_columns and 'tag_id' in link_columns:
+            link = next((c for c in TAG_LINK_COLUMNS if c in link_columns), None)
+            if link == 'task_id' and 'task_id' not in columns:
+                link = None
+            self.tag_link = link
+    
+    def _title(self, row):
+        return f"COALESCE({row}.{self.title_column}, '')" if self.title_column else "''"
+    
+    def _site(self, row):
+        if self.site_column:
+            return f"COALESCE({row}.{self.site_column}, '')"
+        return site_expression(f'{row}.url')
+    
+    def _tags_for(self, history_row):
+        """指定下载记录的标签文本（子查询）"""
+        if not self.tag_link:
+            return "''"
+        key = f'{history_row}.task_id' if self.tag_link == 'task_id' else f'{history_row}.rowid'
+        return (
+            f"(SELECT COALESCE(group_concat(t.name, ' '), '') FROM download_tags dt "
+            f"JOIN tags t ON t.id = dt.tag_id WHERE dt.{self.tag_link} = {key})"
+        )
+    
+    def _history_rowid(self, tag_row):
+        """download_tags的一行对应的download_history rowid"""
+        if self.tag_link == 'task_id':
+            return f"(SELECT rowid FROM download_history WHERE task_id = {tag_row}.task_id)"
+        return f'{tag_row}.{self.tag_link}'
+    
+    def _create_schema(self):
+        """
+        创建FTS5表和同步触发器
+        
+        Returns:
+            bool: 索引表是否为新创建
+        """
+        created = not self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (FTS_TABLE,)
+        ).fetchone()
+        
+        watched = ', '.join(c for c in ('url', self.title_column, self.site_column) if c)
+        values = f"NEW.url, {self._title('NEW')}, {self._site('NEW')}"
+        with self.conn:
+            self.conn.execute(f'''
+                CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE}
+                USING fts5({', '.join(FTS_COLUMNS)}, tokenize = 'unicode61', prefix = '2 3')
+            ''')
+            self.conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS history_fts_insert AFTER INSERT ON download_history
+                BEGIN
+                    INSERT INTO {FTS_TABLE} (rowid, url, title, site, tags)
+                    VALUES (NEW.rowid, {values}, {self._tags_for('NEW')});
+                END
+            ''')
+            self.conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS history_fts_update AFTER UPDATE OF {watched} ON download_history
+                BEGIN
+                    UPDATE {FTS_TABLE} SET (url, title, site) = ({values}) WHERE rowid = NEW.rowid;
+                END
+            ''')
+            self.conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS history_fts_delete AFTER DELETE ON download_history
+                BEGIN
+                    DELETE FROM {FTS_TABLE} WHERE rowid = OLD.rowid;
+                END
+            ''')
+            if self.tag_link:
+                for event, row in (('INSERT', 'NEW'), ('DELETE', 'OLD')):
+                    history_rowid = self._history_rowid(row)
+                    self.conn.execute(f'''
+                        CREATE TRIGGER IF NOT EXISTS history_fts_tags_{event.lower()}
+                        AFTER {event} ON download_tags
+                        BEGIN
+                            UPDATE {FTS_TABLE}
+                            SET tags = (SELECT {self._tags_for('h')} FROM download_history h WHERE h.rowid = {history_rowid})
+                            WHERE rowid = {history_rowid};
+                        END
+                    ''')
+        return created
+    
+    def rebuild(self):
+        """
+        按download_history重建索引（用于已有数据库的补齐）
+        
+        Returns:
+            int: 索引的记录数
+        """
+        with self._lock, self.conn:
+            self.conn.execute(f'DELETE FROM {FTS_TABLE}')
+            self.conn.execute(f'''
+                INSERT INTO {FTS_TABLE} (rowid, url, title, site, tags)
+                SELECT h.rowid, h.url, {self._title('h')}, {self._site('h')}, {self._tags_for('h')}
+                FROM download_history h
+            ''')
+            self.conn.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+            return self.conn.execute(f'SELECT COUNT(*) FROM {FTS_TABLE}').fetchone()[0]
+    
+    def search(self, keyword, limit=50):
+        """
+        全文检索下载历史，按相关度排序
+        
+        Args:
+            keyword: 关键词（多个词为AND关系，均按前缀匹配，支持 site:xxx 形式）
+            limit: 最多返回的数量
+        
+        Returns:
+            list: 记录字典列表，附带 score（越小越相关）以及
+                  url_highlight、title_highlight、tags_highlight
+        """
+        query = build_match_query(keyword)
+        if not query:
+            return []
+        
+        weights = ', '.join(str(w) for w in COLUMN_WEIGHTS)
+        highlights = ', '.join(
+            f"highlight({FTS_TABLE}, {i}, '{HIGHLIGHT_START}', '{HIGHLIGHT_END}') AS {column}_highlight"
+            for i, column in enumerate(FTS_COLUMNS) if column != 'site'
+        )
+        with self._lock:
+            rows = self.conn.execute(f'''
+                SELECT h.*, {highlights}, bm25({FTS_TABLE}, {weights}) AS score
+                FROM {FTS_TABLE} JOIN download_history h ON h.rowid = {FTS_TABLE}.rowid
+                WHERE {FTS_TABLE} MATCH ?
+                ORDER BY score
+                LIMIT ?
+            ''', (query, limit)).fetchall()
+        return [dict(row) for row in rows]
+    
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self.conn.close()
+
+
+def load_history_search(config_file='config.ini', logger=None):
+    """
+    打开下载历史全文检索索引
+    
+    Returns:
+        HistorySearchIndex: 检索索引，SQLite不支持FTS5或还没有download_history表时返回None
+    """
+    try:
+        return HistorySearchIndex(load_database_path(config_file), logger=logger)
+    except sqlite3.OperationalError as e:
+        (logger or logging.getLogger(__name__)).warning(f"下载历史全文索引不可用: {e}")
+        return None
@@ -0,0 +1,237 @@
+"""下载历史写入线程 - 合并写操作，由单个线程按批在一个事务中写入数据库"""
+
+import configparser
+import logging
+import queue
+import sqlite3
+import threading
+
+from .versioning import load_database_path
+
+
+# 新增和状态更新时可写入的列（只写表中实际存在的列）
+RECORD_COLUMNS = ('task_id', 'url', 'resource_type', 'output_path')
+STATUS_COLUMNS = ('status', 'file_size', 'error_message')
+TIMESTAMP_COLUMNS = {'updated_at': None, 'completed_at': 'completed'}
+
+
+class HistoryWriter:
+    """
+    下载历史写入线程
+    
+    请求线程只把写操作放入队列立即返回；写入线程每隔flush_interval秒取出
+    队列中的全部操作，同一任务的多次状态更新只保留最后一次，插入和更新在同一个
+    事务中提交；整批提交失败时逐条重试，个别失败的操作不影响其他记录。
+    数据库使用WAL模式，读操作使用各自的连接，不被写入阻塞。
+    
+    写入线程使用自己的连接直接执行SQL；数据库中没有download_history表时，
+    改为在写入线程中依次调用DatabaseManager的方法。
+    """
+    
+    def __init__(self, db=None, path='data/downloads.db', flush_interval=0.2, wal=True, logger=None):
+        """
+        初始化下载历史写入线程
+        
+        Args:
+            db: DatabaseManager，无法直接写表时使用
+            path: 数据库路径
+            flush_interval: 合并写入的间隔（秒）
+            wal: 是否启用WAL模式
+            logger: 日志记录器
+        """
+        self.db = db
+        self.path = path
+        self.flush_interval = flush_interval
+        self.logger = logger or logging.getLogger(__name__)
+        
+        self.conn = None
+        self.columns = set()
+        try:
+            conn = sqlite3.connect(path, check_same_thread=False)
+            if wal:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('PRAGMA synchronous=NORMAL')
+            self.columns = {row[1] for row in conn.execute('PRAGMA table_info(download_history)')}
+            if {'task_id', 'url'} <= self.columns:
+                self.conn = conn
+            else:
+                conn.close()
+        except sqlite3.Error as e:
+            self.logger.warning(f"无法直接写入下载历史，使用DatabaseManager: {e}")
+        if self.conn is None and self.db is None:
+            raise ValueError("没有可写入的下载历史数据库")
+        
+        self._queue = queue.Queue()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+        self._thread.start()
+    
+    def add_download_record(self, task_id, url, resource_type='unknown', output_path=''):
+        """添加下载记录"""
+        self._queue.put(('add', (task_id, url, resource_type, output_path)))
+    
+    def add_download_records(self, records):
+        """
+        批量添加下载记录
+        
+        Args:
+            records: [(task_id, url, resource_type, output_path), ...]，后两项可省略
+        """
+        for record in records:
+            task_id, url, resource_type, output_path = (tuple(record) + ('unknown', ''))[:4]
+            self._queue.put(('add', (task_id, url, resource_type, output_path)))
+    
+    def update_download_status(self, task_id, status, file_size=None, error_message=None):
+        """
+        更新下载状态
+        
+        状态和错误信息一起写入：没有错误信息的状态更新（例如重试后的running）
+        会清除上一次失败留下的错误信息。文件大小只在提供时写入。
+        """
+        fields = {'status': status, 'error_message': error_message}
+        if file_size is not None:
+            fields['file_size'] = file_size
+        self._queue.put(('update', (task_id, fields)))
+    
+    def flush(self, timeout=None):
+        """
+        等待此前提交的写操作全部写入
+        
+        Returns:
+            bool: 是否在超时前完成
+        """
+        done = threading.Event()
+        self._queue.put(('flush', done))
+        return done.wait(timeout)
+    
+    def _run(self):
+        while not self._stopped.is_set() or not self._queue.empty():
+            try:
+                operations = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            # 等待一个间隔，让这段时间内的写操作合并到同一批
+            self._stopped.wait(self.flush_interval)
+            while True:
+                try:
+                    operations.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write_batch(operations)
+    
+    def _write_batch(self, operations):
+        """合并并写入一批操作"""
+        inserts = []
+        updates = {}
+        waiters = []
+        for kind, payload in operations:
+            if kind == 'add':
+                inserts.append(payload)
+            elif kind == 'update':
+                task_id, fields = payload
+                # 只保留最后一次状态更新，文件大小沿用之前提供的值
+                previous = updates.pop(task_id, {})
+                if 'file_size' in previous and 'file_size' not in fields:
+                    fields = dict(fields, file_size=previous['file_size'])
+                updates[task_id] = fields
+            else:
+                waiters.append(payload)
+        
+        try:
+            if self.conn is not None:
+                try:
+                    self._write_sql(inserts, updates)
+                except sqlite3.Error as e:
+                    self.logger.warning(f"批量写入下载历史失败，逐条重试: {e}")
+                    self._write_each(inserts, updates)
+            else:
+                self._write_each(inserts, updates)
+        finally:
+            for waiter in waiters:
+                waiter.set()
+    
+    def _write_each(self, inserts, updates):
+        """
+        逐条写入，每条操作单独提交
+        
+        直接写表失败的操作再交给DatabaseManager，仍然失败时只记录日志。
+        """
+        operations = [('add', record) for record in inserts] + [('update', item) for item in updates.items()]
+        for kind, payload in operations:
+            try:
+                if self.conn is not None:
+                    try:
+                        if kind == 'add':
+                            self._write_sql([payload], {})
+                        else:
+                            self._write_sql([], dict([payload]))
+                        continue
+                    except sqlite3.Error:
+                        if self.db is None:
+                            raise
+                if kind == 'add':
+                    self.db.add_download_record(*payload)
+                else:
+                    task_id, fields = payload
+                    self.db.update_download_status(task_id, **fields)
+            except Exception as e:
+                task_id = payload[0]
+                self.logger.error(f"写入下载历史失败（{'新增' if kind == 'add' else '更新'} {task_id}）: {e}")
+    
+    def _write_sql(self, inserts, updates):
+        """在一个事务中执行插入和更新"""
+        indexes = [i for i, column in enumerate(RECORD_COLUMNS) if column in self.columns]
+        with self.conn:
+            if inserts:
+                columns = ', '.join(RECORD_COLUMNS[i] for i in indexes)
+                placeholders = ', '.join('?' * len(indexes))
+                self.conn.executemany(
+                    f"INSERT INTO download_history ({columns}) VALUES ({placeholders})",
+                    [[record[i] for i in indexes] for record in inserts]
+                )
+            for task_id, fields in updates.items():
+                assignments, params = [], []
+                for column in STATUS_COLUMNS:
+                    if column in fields and column in self.columns:
+                        assignments.append(f'{column} = ?')
+                        params.append(fields[column])
+                for column, status in TIMESTAMP_COLUMNS.items():
+                    if column in self.columns and (status is None or fields.get('status') == status):
+                        assignments.append(f'{column} = CURRENT_TIMESTAMP')
+                if assignments:
+                    self.conn.execute(
+                        f"UPDATE download_history SET {', '.join(assignments)} WHERE task_id = ?",
+                        params + [task_id]
+                    )
+    
+    def close(self):
+        """写完队列中剩余的操作后停止写入线程"""
+        self._stopped.set()
+        self._thread.join()
+        if self.conn is not None:
+            self.conn.close()
+
+
+def load_history_writer(db=None, config_file='config.ini', logger=None):
+    """
+    从配置文件的[database]节创建下载历史写入线程
+    
+    Args:
+        db: DatabaseManager，无法直接写表时使用
+        config_file: 配置文件路径
+        logger: 日志记录器
+    
+    Returns:
+        HistoryWriter: 写入线程
+    """
+    config = configparser.ConfigParser()
+    config.read(config_file, encoding='utf-8')
+    database = config['database'] if config.has_section('database') else {}
+    
+    return HistoryWriter(
+        db=db,
+        path=load_database_path(config_file),
+        flush_interval=float(database.get('flush_interval', 0.2) or 0.2),
+        wal=str(database.get('wal', 'true')).strip().lower() not in ('false', 'no', 'off', '0'),
+        logger=logger
+    )
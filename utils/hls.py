@@ -0,0 +1,375 @@
+"""HLS流水线下载器 - 并行预取分片并按顺序写出"""
+
+import logging
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+
+import requests
+
+try:
+    from Crypto.Cipher import AES
+except ImportError:
+    AES = None
+
+from .http_session import create_session
+from .mux import find_ffmpeg, mux_streams, remux
+from .quality import pick_variant
+
+
+ATTRIBUTE_PATTERN = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+
+def parse_attributes(value):
+    """解析M3U8标签属性列表，例如 METHOD=AES-128,URI="key.bin" """
+    return {key: val.strip('"') for key, val in ATTRIBUTE_PATTERN.findall(value)}
+
+
+def parse_playlist(text, base_url):
+    """
+    解析M3U8播放列表
+    
+    Args:
+        text: 播放列表内容
+        base_url: 播放列表URL，用于拼接相对地址
+    
+    Returns:
+        dict: {'variants': [...], 'renditions': [...]} 或 {'segments': [...]}
+              variants中每项为 {'url', 'bandwidth', 'resolution', 'audio'}，audio为音频组ID
+              renditions中每项为 {'type', 'group', 'url', 'default', 'language', 'name'}
+              （EXT-X-MEDIA，url为None表示该轨已包含在码流中）
+              segments中每项为 {'url', 'sequence', 'key', 'byterange'}
+    """
+    variants = []
+    renditions = []
+    segments = []
+    sequence = 0
+    key = None
+    byterange = None
+    next_offset = 0
+    pending_variant = None
+    
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        
+        if line.startswith('#EXT-X-STREAM-INF:'):
+            attrs = parse_attributes(line.split(':', 1)[1])
+            pending_variant = {
+                'bandwidth': int(attrs.get('BANDWIDTH', 0) or 0),
+                'resolution': attrs.get('RESOLUTION', ''),
+                'audio': attrs.get('AUDIO')
+            }
+        elif line.startswith('#EXT-X-MEDIA:'):
+            attrs = parse_attributes(line.split(':', 1)[1])
+            renditions.append({
+                'type': attrs.get('TYPE', ''),
+                'group': attrs.get('GROUP-ID'),
+                'url': urljoin(base_url, attrs['URI']) if attrs.get('URI') else None,
+                'default': attrs.get('DEFAULT', 'NO') == 'YES',
+                'language': attrs.get('LANGUAGE', ''),
+                'name': attrs.get('NAME', '')
+            })
+        elif line.startswith('#EXT-X-MEDIA-SEQUENCE:'):
+            sequence = int(line.split(':', 1)[1])
+        elif line.startswith('#EXT-X-KEY:'):
+            attrs = parse_attributes(line.split(':', 1)[1])
+            if attrs.get('METHOD', 'NONE') == 'NONE':
+                key = None
+            else:
+                key = {
+                    'method': attrs['METHOD'],
+                    'uri': urljoin(base_url, attrs.get('URI', '')),
+                    'iv': attrs.get('IV')
+                }
+        elif line.startswith('#EXT-X-MAP:'):
+            attrs = parse_attributes(line.split(':', 1)[1])
+            map_range = None
+            if 'BYTERANGE' in attrs:
+                length, _, offset = attrs['BYTERANGE'].partition('@')
+                map_range = (int(offset or 0), int(length))
+            segments.append({
+                'url': urljoin(base_url, attrs['URI']),
+                'sequence': None,
+                'key': None,
+                'byterange': map_range
+            })
+        elif line.startswith('#EXT-X-BYTERANGE:'):
+            length, _, offset = line.split(':', 1)[1].partition('@')
+            start = int(offset) if offset else next_offset
+            byterange = (start, int(length))
+            next_offset = start + int(length)
+        elif line.startswith('#'):
+            continue
+        elif pending_variant is not None:
+            pending_variant['url'] = urljoin(base_url, line)
+            variants.append(pending_variant)
+            pending_variant = None
+        else:
+            segments.append({
+                'url': urljoin(base_url, line),
+                'sequence': sequence,
+                'key': key,
+                'byterange': byterange
+            })
+            sequence += 1
+            byterange = None
+    
+    if variants:
+        return {'variants': variants, 'renditions': renditions}
+    return {'segments': segments}
+
+
+def pick_audio_rendition(renditions, group):
+    """
+    选择码流引用的音频组中单独提供的音频轨（优先DEFAULT=YES）
+    
+    Returns:
+        dict: 音频轨，码流没有单独的音频轨时返回None
+    """
+    audio = [r for r in renditions if r['type'] == 'AUDIO' and r['group'] == group and r['url']]
+    if not group or not audio:
+        return None
+    return next((r for r in audio if r['default']), audio[0])
+
+
+def container_extension(segments):
+    """分片拼接后的容器格式：带EXT-X-MAP初始化段的是fMP4，否则是MPEG-TS"""
+    return '.mp4' if any(seg['sequence'] is None for seg in segments) else '.ts'
+
+
+class HLSPipelineDownloader:
+    """
+    HLS流水线下载器
+    
+    以有界窗口并行预取分片：同一时间最多有prefetch个分片在下载或等待写出，
+    调用线程按序号顺序追加，下一个分片一到就立即写入输出文件。
+    AES-128加密的分片在下载线程中直接解密，输出文件落盘时即为明文。
+    码流的音频在EXT-X-MEDIA中单独提供时一并下载，用FFmpeg合并。
+    """
+    
+    def __init__(self, output_dir='downloads', prefetch=8, retries=3, timeout=30,
+                 session=None, proxy=None, logger=None, quality='best'):
+        """
+        初始化HLS流水线下载器
+        
+        Args:
+            output_dir: 保存目录
+            prefetch: 预取窗口大小（同时在途的分片数）
+            retries: 单个分片的重试次数
+            timeout: 单个分片的请求超时时间（秒）
+            session: 共享的requests会话，为None时从共享连接池创建
+            proxy: 代理服务器地址（未提供session时使用）
+            logger: 日志记录器
+            quality: 主播放列表的码流选择偏好（'best'、'worst'或目标高度）
+        """
+        self.output_dir = output_dir
+        self.prefetch = max(1, prefetch)
+        self.retries = max(1, retries)
+        self.timeout = timeout
+        self.session = session or create_session(proxy=proxy)
+        self.logger = logger or logging.getLogger(__name__)
+        self.quality = quality
+        self._keys = {}
+        
+        os.makedirs(output_dir, exist_ok=True)
+    
+    def download(self, m3u8_url, output_name='video.ts'):
+        """
+        下载HLS流
+        
+        分片拼接后的容器（MPEG-TS或fMP4）与输出文件名的扩展名不同时，
+        用FFmpeg转封装为调用方要求的格式；没有FFmpeg时保留原容器并使用
+        对应的扩展名。
+        
+        Args:
+            m3u8_url: M3U8播放列表URL
+            output_name: 输出文件名，没有扩展名时使用分片的容器格式
+        
+        Returns:
+            str: 输出文件路径，失败返回None
+        """
+        segments, audio_url = self.load_playlist(m3u8_url)
+        if not segments:
+            return None
+        audio_segments = self.load_segments(audio_url) if audio_url else []
+        if audio_url and not audio_segments:
+            self.logger.warning("获取音频轨失败，只下载视频")
+        
+        tracks = segments + audio_segments
+        if any(seg['key'] and seg['key']['method'] != 'AES-128' for seg in tracks):
+            self.logger.error("不支持的HLS加密方式（仅支持AES-128）")
+            return None
+        if AES is None and any(seg['key'] for seg in tracks):
+            self.logger.error("HLS流已加密，解密需要pycryptodome: pip install pycryptodome")
+            return None
+        
+        stem, extension = os.path.splitext(output_name)
+        container = container_extension(segments)
+        extension = extension.lower() or container
+        can_mux = find_ffmpeg() is not None
+        if (audio_segments or extension != container) and not can_mux:
+            self.logger.warning(f"未找到FFmpeg，保存为{container}" + ("，音频轨单独保存" if audio_segments else ""))
+            extension = container
+        
+        # 需要合并或转封装时先写入临时文件
+        output_path = os.path.join(self.output_dir, stem + extension)
+        video_path, audio_path = output_path, None
+        if audio_segments:
+            audio_path = os.path.join(self.output_dir, stem + '.audio' + container_extension(audio_segments))
+            if can_mux:
+                video_path = os.path.join(self.output_dir, stem + '.video' + container)
+        elif extension != container:
+            video_path = os.path.join(self.output_dir, stem + '.hls' + container)
+        self.logger.info(f"开始下载HLS流: {len(segments)} 个分片" +
+                         (f"，音频轨 {len(audio_segments)} 个分片" if audio_segments else "") +
+                         f"，预取窗口 {self.prefetch}")
+        
+        try:
+            self.download_segments(segments, video_path)
+            if audio_path:
+                self.download_segments(audio_segments, audio_path)
+        except Exception as e:
+            self.logger.error(f"HLS下载失败: {e}")
+            for path in (video_path, audio_path):
+                if path and os.path.exists(path):
+                    os.remove(path)
+            return None
+        
+        if video_path != output_path:
+            if audio_path:
+                merged = mux_streams(video_path, audio_path, output_path, self.logger)
+            else:
+                merged = remux(video_path, output_path, self.logger)
+            if not merged:
+                self.logger.warning(f"合并或转封装失败，保留分片文件: {video_path}")
+                return video_path
+            for path in (video_path, audio_path):
+                if path:
+                    os.remove(path)
+        
+        self.logger.info(f"HLS下载完成: {output_path}")
+        return output_path
+    
+    def load_playlist(self, m3u8_url):
+        """
+        获取媒体播放列表的分片列表，主播放列表时按画质偏好选择码流
+        
+        Args:
+            m3u8_url: M3U8播放列表URL
+        
+        Returns:
+            tuple: (分片列表, 单独提供的音频轨播放列表URL或None)，失败时分片列表为空
+        """
+        audio_url = None
+        try:
+            for _ in range(3):
+                response = self.session.get(m3u8_url, timeout=self.timeout)
+                response.raise_for_status()
+                playlist = parse_playlist(response.text, response.url)
+                
+                if 'segments' in playlist:
+                    return playlist['segments'], audio_url
+                
+                best = pick_variant(playlist['variants'], self.quality)
+                self.logger.info(f"选择码流: {best['resolution'] or '未知分辨率'} ({best['bandwidth']} bps)")
+                audio = pick_audio_rendition(playlist['renditions'], best['audio'])
+                if audio:
+                    self.logger.info(f"选择音频轨: {audio['name'] or audio['language'] or audio['group']}")
+                    audio_url = audio['url']
+                m3u8_url = best['url']
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            self.logger.error(f"获取播放列表失败: {e}")
+        
+        return [], None
+    
+    def load_segments(self, m3u8_url):
+        """
+        获取媒体播放列表的分片列表（不含单独提供的音频轨）
+        
+        Returns:
+            list: 分片列表，失败返回空列表
+        """
+        return self.load_playlist(m3u8_url)[0]
+    
+    def download_segments(self, segments, output_path):
+        """
+        有界窗口预取分片并按顺序写入输出文件
+        
+        Args:
+            segments: 分片列表，每项为 {'url', 'sequence', 'key', 'byterange'}
+            output_path: 输出文件路径
+        
+        Raises:
+            RuntimeError: 某个分片重试后仍下载失败
+        """
+        with ThreadPoolExecutor(max_workers=self.prefetch) as executor, open(output_path, 'wb') as output:
+            futures = {}
+            next_submit = 0
+            
+            for index in range(len(segments)):
+                while next_submit < len(segments) and next_submit < index + self.prefetch:
+                    futures[next_submit] = executor.submit(self._fetch_segment, segments[next_submit])
+                    next_submit += 1
+                
+                output.write(futures.pop(index).result())
+                
+                if (index + 1) % 100 == 0:
+                    self.logger.info(f"分片进度: {index + 1}/{len(segments)}")
+    
+    def _fetch_segment(self, segment):
+        """下载单个分片（带重试），需要时在线解密"""
+        headers = None
+        if segment['byterange']:
+            start, length = segment['byterange']
+            headers = {'Range': f'bytes={start}-{start + length - 1}'}
+        
+        last_error = None
+        for attempt in range(1, self.retries + 1):
+            try:
+                response = self.session.get(segment['url'], headers=headers, timeout=self.timeout)
+                response.raise_for_status()
+                data = response.content
+                if segment['key']:
+                    data = self._decrypt(data, segment)
+                return data
+            
+            except (requests.exceptions.RequestException, ValueError) as e:
+                last_error = e
+                self.logger.debug(f"分片下载失败 (第{attempt}次): {segment['url']} - {e}")
+                if attempt < self.retries:
+                    time.sleep(min(attempt, 5))
+        
+        raise RuntimeError(f"分片下载失败: {segment['url']} - {last_error}")
+    
+    def _decrypt(self, data, segment):
+        """AES-128-CBC解密分片"""
+        key_info = segment['key']
+        key = self._get_key(key_info['uri'])
+        
+        if key_info['iv']:
+            iv = bytes.fromhex(key_info['iv'][2:] if key_info['iv'].lower().startswith('0x') else key_info['iv'])
+            iv = iv.rjust(16, b'\0')
+        else:
+            iv = (segment['sequence'] or 0).to_bytes(16, 'big')
+        
+        decrypted = AES.new(key, AES.MODE_CBC, iv).decrypt(data)
+        padding = decrypted[-1] if decrypted else 0
+        if 0 < padding <= 16 and decrypted.endswith(bytes([padding]) * padding):
+            decrypted = decrypted[:-padding]
+        return decrypted
+    
+    def _get_key(self, uri):
+        """获取并缓存解密密钥"""
+        key = self._keys.get(uri)
+        if key is None:
+            response = self.session.get(uri, timeout=self.timeout)
+            response.raise_for_status()
+            key = response.content
+            if len(key) != 16:
+                raise ValueError(f"无效的AES-128密钥长度: {len(key)}")
+            self._keys[uri] = key
+        return key
@@ -0,0 +1,210 @@
+"""HTTP会话管理 - 进程内共享的连接池"""
+
+import threading
+import weakref
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .bandwidth import HostLimitError, get_bandwidth_limiter
+
+
+DEFAULT_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+
+class LimitedHTTPAdapter(HTTPAdapter):
+    """
+    受带宽限制器约束的HTTPAdapter
+    
+    发送请求前占用目标主机的连接名额，响应体读完或关闭时释放；
+    读取响应体时按全局带宽预算限速。当前线程已占满该主机的全部名额时
+    抛出ConnectionError，调用方可以按连接失败处理（例如改为先后下载）。
+    """
+    
+    def send(self, request, **kwargs):
+        limiter = get_bandwidth_limiter()
+        host = urlparse(request.url).hostname
+        try:
+            limiter.acquire(host)
+        except HostLimitError as e:
+            raise requests.exceptions.ConnectionError(str(e), request=request)
+        try:
+            response = super().send(request, **kwargs)
+        except Exception:
+            limiter.release(host)
+            raise
+        
+        _limit_response(response.raw, host, limiter, threading.get_ident())
+        return response
+
+
+def _limit_response(raw, host, limiter, owner):
+    """为urllib3响应挂上限速读取和连接名额释放"""
+    lock = threading.Lock()
+    released = []
+    
+    def release():
+        with lock:
+            if released:
+                return
+            released.append(True)
+        limiter.release(host, owner)
+    
+    release_conn = raw.release_conn
+    read = raw.read
+    read_chunked = raw.read_chunked
+    
+    def limited_release_conn():
+        release()
+        release_conn()
+    
+    def limited_read(*args, **kwargs):
+        data = read(*args, **kwargs)
+        if data:
+            limiter.throttle(len(data), host)
+        return data
+    
+    def limited_read_chunked(*args, **kwargs):
+        for data in read_chunked(*args, **kwargs):
+            limiter.throttle(len(data), host)
+            yield data
+    
+    raw.release_conn = limited_release_conn
+    raw.read = limited_read
+    raw.read_chunked = limited_read_chunked
+    # 调用方未读完也未关闭响应时，响应被回收时释放名额
+    weakref.finalize(raw, release)
+
+
+class SessionFactory:
+    """
+    HTTP会话工厂
+    
+    所有会话挂载同一个HTTPAdapter，因此共享底层的keep-alive连接池：
+    同一主机的请求复用已建立的TCP/TLS连接。每个会话仍然拥有独立的
+    代理、Cookie和Referer状态，互不干扰。所有请求都受进程内共享的
+    带宽限制器约束。
+    """
+    
+    def __init__(self, pool_connections=20, pool_maxsize=10, pool_block=False):
+        """
+        初始化会话工厂
+        
+        Args:
+            pool_connections: 缓存的主机连接池数量
+            pool_maxsize: 每个主机连接池的最大连接数
+            pool_block: 连接数达到上限时是否阻塞等待（否则临时新建连接且不放回池中）
+        """
+        self.adapter = LimitedHTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block
+        )
+    
+    def create_session(self, proxy=None, cookies=None, referer=None, headers=None):
+        """
+        创建共享连接池的会话
+        
+        Args:
+            proxy: 代理服务器地址
+            cookies: Cookie（字典或Selenium风格的字典列表）
+            referer: Referer地址
+            headers: 额外的请求头
+        
+        Returns:
+            requests.Session: 会话对象
+        """
+        session = requests.Session()
+        session.mount('http://', self.adapter)
+        session.mount('https://', self.adapter)
+        
+        session.headers['User-Agent'] = DEFAULT_USER_AGENT
+        if headers:
+            session.headers.update(headers)
+        if referer:
+            session.headers['Referer'] = referer
+        if proxy:
+            session.proxies = {'http': proxy, 'https': proxy}
+        if cookies:
+            apply_cookies(session, cookies)
+        
+        return session
+
+
+def apply_cookies(session, cookies):
+    """
+    将Cookie写入会话
+    
+    Args:
+        session: requests会话
+        cookies: Cookie字典，或包含name/value/domain/path的字典列表
+    """
+    if isinstance(cookies, dict):
+        session.cookies.update(cookies)
+        return
+    
+    for cookie in cookies:
+        if isinstance(cookie, dict) and 'name' in cookie:
+            session.cookies.set(
+                cookie['name'],
+                cookie.get('value', ''),
+                domain=cookie.get('domain', ''),
+                path=cookie.get('path', '/')
+            )
+
+
+_default_factory = None
+_factory_lock = threading.Lock()
+
+
+def get_session_factory():
+    """获取进程内共享的默认会话工厂"""
+    global _default_factory
+    
+    with _factory_lock:
+        if _default_factory is None:
+            _default_factory = SessionFactory()
+        return _default_factory
+
+
+def configure_session_factory(pool_connections=20, pool_maxsize=10, pool_block=False):
+    """
+    替换默认会话工厂的连接池参数（应在创建任何会话前调用）
+    
+    Args:
+        pool_connections: 缓存的主机连接池数量
+        pool_maxsize: 每个主机连接池的最大连接数
+        pool_block: 连接数达到上限时是否阻塞等待
+    
+    Returns:
+        SessionFactory: 新的默认会话工厂
+    """
+    global _default_factory
+    
+    with _factory_lock:
+        _default_factory = SessionFactory(pool_connections, pool_maxsize, pool_block)
+        return _default_factory
+
+
+def create_session(proxy=None, cookies=None, referer=None, headers=None):
+    """使用默认会话工厂创建共享连接池的会话"""
+    return get_session_factory().create_session(proxy, cookies, referer, headers)
+
+
+def mount_shared_adapter(session):
+    """
+    为已有的会话挂载默认会话工厂的连接池和限速适配器
+    
+    Args:
+        session: 其他组件创建的会话
+    
+    Returns:
+        bool: 是否成功挂载（session不是requests.Session时为False）
+    """
+    if not isinstance(session, requests.Session):
+        return False
+    adapter = get_session_factory().adapter
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return True
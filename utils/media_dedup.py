@@ -0,0 +1,247 @@
+"""媒体URL去重 - 规范化媒体地址，并跨运行记录已下载的媒体"""
+
+import configparser
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+
+# 签名、鉴权、时效和统计参数：同一媒体每次抓到的值都不同。
+# 其中不少是通用的短参数名（f、t、mid、platform等），只在已知的签名CDN上
+# 一律忽略；其他主机上只有值像签名或时间戳时才忽略。
+VOLATILE_PARAMS = {
+    'sign', 'signature', 'sig', 'lsig', 'token', 'auth_key', 'authkey', 'expires', 'expire',
+    'deadline', 'e', 't', 'ts', 'timestamp', '_', 'nonce', 'policy', 'key-pair-id',
+    'hdnts', 'hdntl', 'wssecret', 'wstime', 'txsecret', 'txtime',
+    'upsig', 'uparams', 'trid', 'mid', 'nbs', 'oi', 'platform', 'gen', 'os', 'og',
+    'uipk', 'bw', 'mcid', 'buvid', 'orderid', 'logo', 'build', 'agrr', 'nettype', 'bvc', 'f'
+}
+VOLATILE_PREFIXES = ('x-amz-', 'x-goog-', 'utm_')
+
+# 字节范围参数：同一文件的不同分段属于同一媒体（值为数字或范围时才忽略）
+RANGE_PARAMS = {'range', 'bytestart', 'byteend', 'rbuf'}
+RANGE_VALUE_PATTERN = re.compile(r'^\d+(-\d*)?$')
+
+# 镜像节点众多的CDN：主机名统一为主域名
+MIRROR_DOMAINS = ('bilivideo.com', 'bilivideo.cn', 'googlevideo.com', 'vimeocdn.com')
+
+# 已知使用签名URL的CDN：VOLATILE_PARAMS中的参数一律忽略
+SIGNED_CDN_DOMAINS = MIRROR_DOMAINS + (
+    'cloudfront.net', 'akamaized.net', 'akamaihd.net', 'aliyuncs.com', 'myqcloud.com', 'hdslb.com'
+)
+
+# 像签名或时间戳的参数值：10/13位时间戳、16位以上的十六进制串、
+# 20位以上字母数字混合的base64串，或JWT
+VOLATILE_VALUE_PATTERNS = (
+    re.compile(r'^\d{10}(\d{3})?$'),
+    re.compile(r'^[0-9a-fA-F]{16,}$'),
+    re.compile(r'^(?=.*\d)(?=.*[A-Za-z])[A-Za-z0-9+/_\-]{20,}={0,2}$'),
+    re.compile(r'^[A-Za-z0-9_\-]{10,}\.[A-Za-z0-9_\-]{10,}\.[A-Za-z0-9_\-]{10,}$')
+)
+
+# 这些CDN只有列出的参数标识媒体，其余参数全部忽略
+KEY_PARAMS = {
+    'googlevideo.com': ('id', 'itag'),
+    'bilivideo.com': (),
+    'bilivideo.cn': ()
+}
+
+
+def _host_in(host, domains):
+    """返回host所属的域名，不属于任何一个时返回None"""
+    return next((d for d in domains if host == d or host.endswith('.' + d)), None)
+
+
+def looks_volatile(value):
+    """参数值是否像签名、令牌或时间戳"""
+    return any(pattern.match(value) for pattern in VOLATILE_VALUE_PATTERNS)
+
+
+def _is_volatile(name, value, signed_cdn):
+    """参数是否不标识媒体本身（签名、时效、统计或字节范围）"""
+    if name.startswith(VOLATILE_PREFIXES):
+        return True
+    if name in RANGE_PARAMS:
+        return bool(RANGE_VALUE_PATTERN.match(value))
+    if name in VOLATILE_PARAMS:
+        return signed_cdn or looks_volatile(value)
+    return False
+
+
+def canonical_media_key(url):
+    """
+    媒体URL的规范化键
+    
+    忽略协议、片段、签名/时效参数和字节范围参数，CDN镜像主机统一为主域名，
+    剩余参数按名称排序。同一媒体的不同签名地址、不同镜像和不同分段得到
+    相同的键；在非签名CDN的主机上，f、t、mid这类通用参数只有值像签名或
+    时间戳时才忽略，避免把不同的媒体当作同一个。
+    
+    Args:
+        url: 媒体URL
+    
+    Returns:
+        str: 规范化键
+    """
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or '').lower()
+    domain = _host_in(host, MIRROR_DOMAINS)
+    signed_cdn = _host_in(host, SIGNED_CDN_DOMAINS) is not None
+    if domain:
+        host = domain
+    elif parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+    
+    keep = KEY_PARAMS.get(domain)
+    query = []
+    for key, value in parse_qsl(parts.query, keep_blank_values=True):
+        name = key.lower()
+        if keep is not None:
+            if name in keep:
+                query.append((name, value))
+        elif not _is_volatile(name, value, signed_cdn):
+            query.append((name, value))
+    
+    key = host + (parts.path or '/')
+    if query:
+        key += '?' + urlencode(sorted(query))
+    return key
+
+
+def dedupe_media_urls(urls):
+    """按规范化键去重，保留每个媒体第一次出现的URL"""
+    seen = set()
+    unique = []
+    for url in urls:
+        key = canonical_media_key(url)
+        if key not in seen:
+            seen.add(key)
+            unique.append(url)
+    return unique
+
+
+class DownloadIndex:
+    """
+    已下载媒体索引
+    
+    在SQLite中保存已下载媒体的规范化键，下载前过滤掉以前运行中已经
+    下载过的媒体，不必再建立连接。
+    """
+    
+    def __init__(self, path='data/download_index.db', logger=None):
+        """
+        初始化已下载媒体索引
+        
+        Args:
+            path: 索引数据库路径
+            logger: 日志记录器
+        """
+        self.path = path
+        self.logger = logger or logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS downloaded_media (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                path TEXT,
+                created_at REAL NOT NULL
+            )
+        ''')
+        self.conn.commit()
+    
+    def contains(self, url):
+        """媒体是否已下载过"""
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT 1 FROM downloaded_media WHERE key = ?', (canonical_media_key(url),)
+            ).fetchone()
+        return row is not None
+    
+    def add(self, url, path=None):
+        """记录已下载的媒体"""
+        with self._lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO downloaded_media VALUES (?, ?, ?, ?)',
+                (canonical_media_key(url), url, path, time.time())
+            )
+            self.conn.commit()
+    
+    def filter_new(self, urls):
+        """
+        过滤掉已下载过的媒体（同一批次内的重复也一并去除）
+        
+        Args:
+            urls: URL列表
+        
+        Returns:
+            tuple: (未下载过的URL列表, 跳过的URL列表)
+        """
+        keys = {}
+        for url in urls:
+            keys.setdefault(canonical_media_key(url), url)
+        
+        known = set()
+        key_list = list(keys)
+        with self._lock:
+            # 分批查询，避免超过SQLite的参数个数上限
+            for start in range(0, len(key_list), 500):
+                batch = key_list[start:start + 500]
+                placeholders = ','.join('?' * len(batch))
+                known.update(row[0] for row in self.conn.execute(
+                    f'SELECT key FROM downloaded_media WHERE key IN ({placeholders})', batch
+                ))
+        
+        new_urls = [url for key, url in keys.items() if key not in known]
+        kept = set(new_urls)
+        skipped = [url for url in urls if url not in kept]
+        return new_urls, skipped
+    
+    def add_many(self, urls, path=None):
+        """
+        批量记录已下载的媒体（只传入下载器确认下载成功的URL）
+        
+        Args:
+            urls: URL列表
+            path: 保存路径，下载器不报告时为None
+        
+        Returns:
+            int: 记录的数量
+        """
+        records = [(canonical_media_key(url), url, path, time.time()) for url in urls]
+        with self._lock:
+            self.conn.executemany('INSERT OR IGNORE INTO downloaded_media VALUES (?, ?, ?, ?)', records)
+            self.conn.commit()
+        return len(records)
+    
+    def close(self):
+        """关闭索引数据库"""
+        with self._lock:
+            self.conn.close()
+
+
+def load_download_index(config_file='config.ini', logger=None):
+    """
+    从配置文件的[download]节读取去重设置
+    
+    Returns:
+        DownloadIndex: 已下载媒体索引，dedup为false时返回None
+    """
+    config = configparser.ConfigParser()
+    config.read(config_file, encoding='utf-8')
+    download = config['download'] if config.has_section('download') else {}
+    
+    if str(download.get('dedup', 'true')).strip().lower() in ('false', 'no', 'off', '0'):
+        return None
+    return DownloadIndex(
+        path=download.get('dedup_file', 'data/download_index.db') or 'data/download_index.db',
+        logger=logger
+    )
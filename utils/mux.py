@@ -0,0 +1,295 @@
+"""音视频封装 - 调用FFmpeg将独立的视频轨和音频轨合并为一个文件"""
+
+import logging
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+import threading
+
+import requests
+
+from .http_session import create_session
+
+
+# 判断容器格式时读取的头部字节数
+SNIFF_SIZE = 256 * 1024
+
+
+def find_ffmpeg():
+    """查找FFmpeg可执行文件，未找到返回None"""
+    return shutil.which('ffmpeg')
+
+
+def mux_streams(video_path, audio_path, output_path, logger=None):
+    """
+    不重新编码，直接将视频轨和音频轨封装到输出文件
+    
+    Args:
+        video_path: 视频轨文件路径
+        audio_path: 音频轨文件路径
+        output_path: 输出文件路径
+        logger: 日志记录器
+    
+    Returns:
+        str: 输出文件路径，失败返回None
+    """
+    logger = logger or logging.getLogger(__name__)
+    ffmpeg = find_ffmpeg()
+    if not ffmpeg:
+        logger.error("未找到FFmpeg，无法合并音视频")
+        return None
+    
+    command = [
+        ffmpeg, '-y', '-loglevel', 'error',
+        '-i', video_path,
+        '-i', audio_path,
+        '-map', '0:v:0', '-map', '1:a:0',
+        '-c', 'copy',
+        output_path
+    ]
+    
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0 or not os.path.exists(output_path):
+        logger.error(f"FFmpeg合并失败: {result.stderr.decode('utf-8', errors='ignore').strip()}")
+        return None
+    
+    return output_path
+
+
+def remux(input_path, output_path, logger=None):
+    """
+    不重新编码，把文件转封装为输出文件扩展名对应的容器（例如 .ts -> .mp4）
+    
+    Args:
+        input_path: 输入文件路径
+        output_path: 输出文件路径
+        logger: 日志记录器
+    
+    Returns:
+        str: 输出文件路径，失败返回None
+    """
+    logger = logger or logging.getLogger(__name__)
+    ffmpeg = find_ffmpeg()
+    if not ffmpeg:
+        logger.error("未找到FFmpeg，无法转封装")
+        return None
+    
+    command = [ffmpeg, '-y', '-loglevel', 'error', '-i', input_path, '-map', '0', '-c', 'copy', output_path]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0 or not os.path.exists(output_path):
+        logger.error(f"FFmpeg转封装失败: {result.stderr.decode('utf-8', errors='ignore').strip()}")
+        return None
+    
+    return output_path
+
+
+def concat_files(paths, output_path, logger=None):
+    """
+    不重新编码，按顺序把同一个视频的分段文件拼接为一个文件
+    
+    Args:
+        paths: 分段文件路径列表（按播放顺序）
+        output_path: 输出文件路径
+        logger: 日志记录器
+    
+    Returns:
+        str: 输出文件路径，失败返回None
+    """
+    logger = logger or logging.getLogger(__name__)
+    ffmpeg = find_ffmpeg()
+    if not ffmpeg:
+        logger.error("未找到FFmpeg，无法拼接分段")
+        return None
+    
+    # concat分离器的文件列表，路径中的单引号需要转义
+    fd, list_path = tempfile.mkstemp(suffix='.txt', dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            for path in paths:
+                escaped = os.path.abspath(path).replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+        command = [
+            ffmpeg, '-y', '-loglevel', 'error',
+            '-f', 'concat', '-safe', '0', '-i', list_path,
+            '-c', 'copy',
+            output_path
+        ]
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    finally:
+        os.remove(list_path)
+    
+    if result.returncode != 0 or not os.path.exists(output_path):
+        logger.error(f"FFmpeg拼接失败: {result.stderr.decode('utf-8', errors='ignore').strip()}")
+        return None
+    
+    return output_path
+
+
+def needs_seeking(head):
+    """
+    判断媒体文件是否必须随机访问才能解封装
+    
+    非faststart的MP4把moov放在mdat之后，FFmpeg从管道读取时无法先拿到索引；
+    faststart的MP4、分片MP4（moof）、WebM/MKV和TS都可以顺序读取。
+    
+    Args:
+        head: 文件开头的字节
+    
+    Returns:
+        bool: 需要随机访问时返回True
+    """
+    if head[4:8] != b'ftyp':
+        return False
+    
+    offset = 0
+    while offset + 8 <= len(head):
+        size, box = struct.unpack('>I4s', head[offset:offset + 8])
+        if box in (b'moov', b'moof'):
+            return False
+        if box == b'mdat':
+            return True
+        if size == 1 and offset + 16 <= len(head):
+            size = struct.unpack('>Q', head[offset + 8:offset + 16])[0]
+        if size < 8:
+            break
+        offset += size
+    
+    # 头部中找不到moov，保守地认为需要随机访问
+    return True
+
+
+class StreamingMuxer:
+    """
+    边下载边合并
+    
+    视频流和音频流分别通过命名管道（FIFO）直接送入FFmpeg，不落盘中间文件，
+    最后一个字节到达后几秒内即可得到合并结果。需要随机访问的容器或不支持
+    命名管道的平台（Windows）返回None，由调用方回退到先下载后合并的流程。
+    """
+    
+    def __init__(self, session=None, proxy=None, logger=None, chunk_size=256 * 1024, meter=None):
+        """
+        初始化流式合并器
+        
+        Args:
+            session: 共享的requests会话，为None时从共享连接池创建
+            proxy: 代理服务器地址（未提供session时使用）
+            logger: 日志记录器
+            chunk_size: 转发数据的块大小（字节）
+            meter: 共享的传输计量器（TransferMeter），用于统计带宽
+        """
+        self.session = session or create_session(proxy=proxy)
+        self.logger = logger or logging.getLogger(__name__)
+        self.chunk_size = chunk_size
+        self.meter = meter
+    
+    def is_supported(self):
+        """当前平台是否支持流式合并"""
+        return hasattr(os, 'mkfifo') and find_ffmpeg() is not None
+    
+    def merge(self, video_url, audio_url, output_path):
+        """
+        边下载边合并视频流和音频流
+        
+        Args:
+            video_url: 视频流URL
+            audio_url: 音频流URL
+            output_path: 输出文件路径
+        
+        Returns:
+            str: 输出文件路径，不适用或失败时返回None
+        """
+        if not self.is_supported():
+            return None
+        
+        responses = []
+        try:
+            for url in (video_url, audio_url):
+                response = self.session.get(url, stream=True, timeout=30)
+                responses.append(response)
+                response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            self.logger.warning(f"流式合并无法打开输入流: {e}")
+            self._close(responses)
+            return None
+        
+        streams = []
+        for response in responses:
+            iterator = response.iter_content(chunk_size=self.chunk_size)
+            head = b''
+            for data in iterator:
+                head += data
+                if len(head) >= SNIFF_SIZE:
+                    break
+            if needs_seeking(head):
+                self.logger.info("输入容器需要随机访问，改用先下载后合并")
+                self._close(responses)
+                return None
+            streams.append((head, iterator))
+        
+        with tempfile.TemporaryDirectory(prefix='mux_') as fifo_dir:
+            kinds = ('video', 'audio')
+            fifos = [os.path.join(fifo_dir, kind) for kind in kinds]
+            for fifo in fifos:
+                os.mkfifo(fifo)
+            
+            command = [
+                find_ffmpeg(), '-y', '-loglevel', 'error',
+                '-i', fifos[0],
+                '-i', fifos[1],
+                '-map', '0:v:0', '-map', '1:a:0',
+                '-c', 'copy',
+                output_path
+            ]
+            process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            
+            errors = []
+            feeders = [
+                threading.Thread(target=self._feed, args=(kind, fifo, head, iterator, errors), daemon=True)
+                for kind, fifo, (head, iterator) in zip(kinds, fifos, streams)
+            ]
+            for feeder in feeders:
+                feeder.start()
+            
+            _, stderr = process.communicate()
+            
+            # FFmpeg提前退出时可能从未打开某个管道，打开读端以释放阻塞的写入线程
+            for fifo in fifos:
+                os.close(os.open(fifo, os.O_RDONLY | os.O_NONBLOCK))
+            for feeder in feeders:
+                feeder.join(timeout=5)
+        
+        self._close(responses)
+        
+        if errors or process.returncode != 0:
+            detail = errors[0] if errors else stderr.decode('utf-8', errors='ignore').strip()
+            self.logger.warning(f"流式合并失败: {detail}")
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            return None
+        
+        return output_path
+    
+    def _feed(self, kind, fifo, head, iterator, errors):
+        """把已读取的头部和剩余数据写入命名管道"""
+        try:
+            with open(fifo, 'wb') as pipe:
+                pipe.write(head)
+                if self.meter:
+                    self.meter.add(len(head), kind)
+                for data in iterator:
+                    pipe.write(data)
+                    if self.meter:
+                        self.meter.add(len(data), kind)
+        except BrokenPipeError:
+            # FFmpeg已退出，错误由返回码体现
+            pass
+        except (requests.exceptions.RequestException, OSError) as e:
+            errors.append(e)
+    
+    def _close(self, responses):
+        """关闭响应连接"""
+        for response in responses:
+            response.close()
@@ -0,0 +1,299 @@
+"""已处理文件索引 - 让加密视频后处理只检查新增或变化的文件"""
+
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+
+DEFAULT_DB_PATH = 'data/processed_index.db'
+# 旧版本放在下载目录中的索引文件，扫描时跳过
+INDEX_FILENAME = '.processed_index.db'
+
+# 下载过程中的临时文件，不参与后处理
+SKIP_SUFFIXES = ('.part', '.chunks', '.tmp')
+STAGING_PREFIX = '.incremental_'
+# 修改时间距今不足该秒数的目录不记录，避免同一时间刻度内的后续改动被漏掉
+RACY_DIRECTORY_SECONDS = 2
+
+
+class ProcessedFileIndex:
+    """
+    已处理文件索引
+    
+    在data目录下的SQLite数据库中按 (目录, 相对路径) 记录每个文件的大小和
+    修改时间，大小和修改时间都未变化的文件视为已检查过，无需再次处理。
+    同时记录每个子目录的修改时间：目录修改时间未变时（没有新增、删除或
+    改名），其中已记录的文件直接沿用索引中的大小和修改时间，不再逐个stat。
+    下载目录中不写入任何索引文件。
+    """
+    
+    def __init__(self, directory, db_path=DEFAULT_DB_PATH, logger=None):
+        """
+        初始化已处理文件索引
+        
+        Args:
+            directory: 被索引的目录
+            db_path: 索引数据库路径
+            logger: 日志记录器
+        """
+        self.directory = os.path.abspath(directory)
+        self.db_path = db_path
+        self.logger = logger or logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        
+        os.makedirs(self.directory, exist_ok=True)
+        db_directory = os.path.dirname(db_path)
+        if db_directory:
+            os.makedirs(db_directory, exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS processed_files (
+                directory TEXT NOT NULL,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                checked_at REAL NOT NULL,
+                PRIMARY KEY (directory, path)
+            )
+        ''')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS scanned_directories (
+                directory TEXT NOT NULL,
+                path TEXT NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                PRIMARY KEY (directory, path)
+            )
+        ''')
+        self.conn.commit()
+    
+    def scan(self):
+        """
+        遍历目录中的文件
+        
+        修改时间与上次扫描相同的子目录中，已记录的文件沿用索引中的签名，
+        只有未记录的文件才会stat。扫描结束后更新各子目录的修改时间。
+        
+        Returns:
+            dict: {相对路径: (大小, 修改时间纳秒)}
+        """
+        with self._lock:
+            known_files = self._known_files()
+            known_dirs = dict(self.conn.execute(
+                'SELECT path, mtime_ns FROM scanned_directories WHERE directory = ?', (self.directory,)
+            ))
+        
+        files = {}
+        seen_dirs = []
+        racy_before = time.time_ns() - RACY_DIRECTORY_SECONDS * 1_000_000_000
+        for root, dirs, names in os.walk(self.directory):
+            dirs[:] = [d for d in dirs if not d.startswith(STAGING_PREFIX)]
+            relative_root = os.path.relpath(root, self.directory)
+            try:
+                dir_mtime_ns = os.stat(root).st_mtime_ns
+            except OSError:
+                continue
+            unchanged = known_dirs.get(relative_root) == dir_mtime_ns
+            if dir_mtime_ns < racy_before:
+                seen_dirs.append((self.directory, relative_root, dir_mtime_ns))
+            
+            for name in names:
+                if name.startswith(INDEX_FILENAME) or name.endswith(SKIP_SUFFIXES):
+                    continue
+                path = os.path.join(root, name)
+                relative_path = os.path.relpath(path, self.directory)
+                if unchanged and relative_path in known_files:
+                    files[relative_path] = known_files[relative_path]
+                    continue
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files[relative_path] = (stat.st_size, stat.st_mtime_ns)
+        
+        with self._lock:
+            self.conn.execute('DELETE FROM scanned_directories WHERE directory = ?', (self.directory,))
+            self.conn.executemany('INSERT INTO scanned_directories VALUES (?, ?, ?)', seen_dirs)
+            self.conn.commit()
+        return files
+    
+    def _known_files(self):
+        """读取索引中已记录的文件签名（调用方需持有锁）"""
+        return {
+            path: (size, mtime_ns)
+            for path, size, mtime_ns in self.conn.execute(
+                'SELECT path, size, mtime_ns FROM processed_files WHERE directory = ?', (self.directory,)
+            )
+        }
+    
+    def pending_files(self, files=None):
+        """
+        获取新增或自上次处理后发生变化的文件
+        
+        Args:
+            files: 已有的scan()结果，为None时重新扫描
+        
+        Returns:
+            list: 相对路径列表
+        """
+        if files is None:
+            files = self.scan()
+        with self._lock:
+            known = self._known_files()
+        return sorted(path for path, signature in files.items() if known.get(path) != signature)
+    
+    def mark(self, paths, status='checked'):
+        """
+        按文件当前的大小和修改时间记录为已处理
+        
+        Args:
+            paths: 相对路径列表
+            status: 处理结果，例如 checked / decrypted
+        """
+        rows = []
+        now = time.time()
+        for path in paths:
+            try:
+                stat = os.stat(os.path.join(self.directory, path))
+            except OSError:
+                continue
+            rows.append((self.directory, path, stat.st_size, stat.st_mtime_ns, status, now))
+        
+        with self._lock:
+            self.conn.executemany('INSERT OR REPLACE INTO processed_files VALUES (?, ?, ?, ?, ?, ?)', rows)
+            self.conn.commit()
+    
+    def prune(self, existing=None):
+        """
+        删除已不存在的文件的记录
+        
+        Args:
+            existing: 已有的scan()结果，为None时重新扫描
+        
+        Returns:
+            int: 删除的记录数
+        """
+        if existing is None:
+            existing = self.scan()
+        with self._lock:
+            stale = [
+                (self.directory, path) for (path,) in self.conn.execute(
+                    'SELECT path FROM processed_files WHERE directory = ?', (self.directory,)
+                )
+                if path not in existing
+            ]
+            self.conn.executemany('DELETE FROM processed_files WHERE directory = ? AND path = ?', stale)
+            self.conn.commit()
+        return len(stale)
+    
+    def close(self):
+        """关闭索引数据库"""
+        with self._lock:
+            self.conn.close()
+
+
+def process_directory_incremental(handler, directory, logger=None, db_path=DEFAULT_DB_PATH):
+    """
+    只对新增或变化的文件执行 handler.batch_process_directory
+    
+    新文件以硬链接方式放入目录下的临时子目录，处理器只扫描这个子目录；
+    处理完成后把新生成或被替换的文件移回原位置。原目录中的文件只会被
+    处理结果覆盖，不会被删除。文件系统不支持硬链接时回退为处理整个目录。
+    
+    Args:
+        handler: 提供batch_process_directory(directory)的处理器（EncryptedVideoHandler）
+        directory: 下载目录
+        logger: 日志记录器
+        db_path: 索引数据库路径
+    
+    Returns:
+        list: 处理器返回的已处理文件路径（映射回原目录）
+    """
+    logger = logger or logging.getLogger(__name__)
+    index = ProcessedFileIndex(directory, db_path, logger=logger)
+    
+    try:
+        files = index.scan()
+        pruned = index.prune(files)
+        if pruned:
+            logger.debug(f"已清理 {pruned} 条不存在文件的索引记录")
+        
+        pending = index.pending_files(files)
+        if not pending:
+            logger.info("没有新增或变化的文件，跳过加密视频检查")
+            return []
+        
+        logger.info(f"检查 {len(pending)} 个新增或变化的文件")
+        staging = os.path.join(index.directory, f"{STAGING_PREFIX}{os.getpid()}")
+        
+        try:
+            inodes = _stage_files(index.directory, staging, pending)
+        except OSError as e:
+            logger.warning(f"无法创建硬链接（{e}），改为检查整个目录")
+            shutil.rmtree(staging, ignore_errors=True)
+            processed = handler.batch_process_directory(directory) or []
+            index.mark(index.scan().keys())
+            return processed
+        
+        try:
+            processed = handler.batch_process_directory(staging) or []
+            produced, removed = _unstage_files(index.directory, staging, inodes)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        
+        if removed:
+            logger.info(f"处理器移走了 {len(removed)} 个文件，原目录中的文件已保留")
+        
+        index.mark([path for path in pending if path not in produced])
+        index.mark(produced, status='decrypted')
+        return [
+            os.path.join(index.directory, os.path.relpath(os.path.abspath(path), staging))
+            for path in processed
+        ]
+    finally:
+        index.close()
+
+
+def _stage_files(directory, staging, paths):
+    """以硬链接方式把待处理文件放入临时目录，返回 {相对路径: inode}"""
+    inodes = {}
+    for path in paths:
+        target = os.path.join(staging, path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.link(os.path.join(directory, path), target)
+        inodes[path] = os.stat(target).st_ino
+    return inodes
+
+
+def _unstage_files(directory, staging, inodes):
+    """
+    把处理结果同步回原目录
+    
+    - 新生成的文件移动到原目录对应位置
+    - 被替换（inode变化）的文件覆盖原文件
+    原地修改的文件通过硬链接已经同步，无需处理。临时目录中不见了的文件
+    只做记录：处理器可能只是改了名，原文件不能因此删除。
+    
+    Returns:
+        tuple: (新生成或被替换的文件的相对路径列表, 从临时目录中消失的文件的相对路径列表)
+    """
+    produced = []
+    for root, _, names in os.walk(staging):
+        for name in names:
+            staged = os.path.join(root, name)
+            path = os.path.relpath(staged, staging)
+            if path in inodes and os.stat(staged).st_ino == inodes[path]:
+                continue
+            target = os.path.join(directory, path)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(staged, target)
+            produced.append(path)
+    
+    removed = [
+        path for path in inodes
+        if path not in produced and not os.path.exists(os.path.join(staging, path))
+    ]
+    return produced, removed
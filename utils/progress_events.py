@@ -0,0 +1,206 @@
+"""任务进度推送 - 合并进度更新并推送给订阅者（Server-Sent Events）"""
+
+import json
+import threading
+import time
+
+from .versioning import ChangeIndex
+
+
+FINAL_STATUSES = ('completed', 'failed', 'cancelled')
+
+
+class Subscription:
+    """
+    进度订阅
+    
+    每个订阅只保存每个任务最新的一份增量：推送间隔内同一任务的多次更新
+    合并成一次，读得慢的客户端也不会积压。推送间隔按任务分别计算，一个任务
+    结束时只立即推送该任务，不会连带推送其他任务尚在间隔内的增量。
+    """
+    
+    def __init__(self, task_ids=None, min_interval=0.5):
+        """
+        初始化进度订阅
+        
+        Args:
+            task_ids: 订阅的任务ID集合，None表示订阅全部任务
+            min_interval: 同一任务两次推送之间的最小间隔（秒）
+        """
+        self.task_ids = set(task_ids) if task_ids else None
+        self.min_interval = min_interval
+        self._pending = {}
+        # 待推送增量中带有结束状态的任务
+        self._final = set()
+        # 每个任务上次推送的时间，任务结束后删除
+        self._last_sent = {}
+        self._condition = threading.Condition()
+    
+    def wants(self, task_id):
+        """是否订阅了该任务"""
+        return self.task_ids is None or task_id in self.task_ids
+    
+    def offer(self, task_id, delta, final=False):
+        """合并一次进度增量"""
+        with self._condition:
+            pending = self._pending.setdefault(task_id, {'task_id': task_id})
+            pending.update(delta)
+            if final:
+                self._final.add(task_id)
+            self._condition.notify()
+    
+    def get(self, timeout=15.0):
+        """
+        取出合并后的增量
+        
+        只取出距该任务上次推送已满min_interval的增量（任务结束的状态立即推送），
+        都未到间隔时等待到最早的一个到期。
+        
+        Args:
+            timeout: 没有可推送的增量时最长等待时间（秒）
+        
+        Returns:
+            list: 增量列表，超时时为空列表
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                ready = [task_id for task_id in self._pending
+                         if task_id in self._final or now >= self._ready_at(task_id)]
+                if ready:
+                    break
+                if now >= deadline:
+                    return []
+                wake_at = deadline
+                if self._pending:
+                    wake_at = min(wake_at, min(self._ready_at(task_id) for task_id in self._pending))
+                self._condition.wait(wake_at - now)
+            
+            deltas = []
+            for task_id in ready:
+                deltas.append(self._pending.pop(task_id))
+                if task_id in self._final:
+                    self._final.discard(task_id)
+                    self._last_sent.pop(task_id, None)
+                else:
+                    self._last_sent[task_id] = now
+            return deltas
+    
+    def _ready_at(self, task_id):
+        """任务的下一次增量最早可以推送的时间（调用方需持有锁）"""
+        last_sent = self._last_sent.get(task_id)
+        return float('-inf') if last_sent is None else last_sent + self.min_interval
+
+
+class ProgressBroadcaster:
+    """
+    任务进度广播
+    
+    下载线程调用publish()报告进度，只更新各订阅的待推送增量；JSON序列化
+    在推送时按批进行，没有订阅者时几乎没有开销。每次发布都会在versions中
+    记录任务的新版本号，客户端可以用它增量拉取任务列表。
+    """
+    
+    def __init__(self, min_interval=0.5, versions=None):
+        """
+        初始化任务进度广播
+        
+        Args:
+            min_interval: 每个订阅中同一任务两次推送之间的最小间隔（秒）
+            versions: 任务变更版本索引（ChangeIndex）
+        """
+        self.min_interval = min_interval
+        self.versions = versions or ChangeIndex()
+        self._subscriptions = []
+        self._lock = threading.Lock()
+    
+    def subscribe(self, task_ids=None):
+        """
+        订阅任务进度
+        
+        Args:
+            task_ids: 任务ID列表，None表示全部任务
+        
+        Returns:
+            Subscription: 订阅
+        """
+        subscription = Subscription(task_ids, self.min_interval)
+        with self._lock:
+            self._subscriptions.append(subscription)
+        return subscription
+    
+    def unsubscribe(self, subscription):
+        """取消订阅"""
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+    
+    def publish(self, task_id, delta):
+        """
+        发布任务的进度增量
+        
+        Args:
+            task_id: 任务ID
+            delta: 变化的字段（status、progress、downloaded、total、error_message等）
+        """
+        delta = dict(delta, version=self.versions.touch(task_id))
+        with self._lock:
+            subscriptions = [s for s in self._subscriptions if s.wants(task_id)]
+        final = delta.get('status') in FINAL_STATUSES
+        for subscription in subscriptions:
+            subscription.offer(task_id, delta, final)
+    
+    def progress_reporter(self, task_id, callback=None):
+        """
+        包装下载器的进度回调，同时发布进度
+        
+        回调参数为 (progress) 或 (downloaded, total)，progress为百分比。
+        
+        Args:
+            task_id: 任务ID
+            callback: 原进度回调
+        
+        Returns:
+            callable: 新的进度回调
+        """
+        def report(*args, **kwargs):
+            if callback:
+                callback(*args, **kwargs)
+            if len(args) >= 2 and args[1]:
+                downloaded, total = args[0], args[1]
+                self.publish(task_id, {
+                    'progress': round(downloaded * 100 / total, 1),
+                    'downloaded': downloaded,
+                    'total': total
+                })
+            elif args:
+                self.publish(task_id, {'progress': args[0]})
+        return report
+    
+    def subscriber_count(self):
+        """当前订阅数"""
+        with self._lock:
+            return len(self._subscriptions)
+    
+    def stream(self, subscription, keepalive=15.0):
+        """
+        生成Server-Sent Events消息，连接断开时自动取消订阅
+        
+        Args:
+            subscription: 订阅
+            keepalive: 没有更新时发送注释行保持连接的间隔（秒）
+        
+        Yields:
+            str: SSE消息
+        """
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                deltas = subscription.get(timeout=keepalive)
+                if deltas:
+                    yield f"event: progress\ndata: {json.dumps(deltas, ensure_ascii=False)}\n\n"
+                else:
+                    yield ': keepalive\n\n'
+        finally:
+            self.unsubscribe(subscription)
@@ -0,0 +1,143 @@
+"""画质规则 - 按配置的画质偏好为视频码流排序"""
+
+import configparser
+import re
+from urllib.parse import urlparse
+
+
+# 主机名关键字到[platforms]配置前缀的映射
+PLATFORM_HOSTS = {
+    'youtube': ('youtube.com', 'youtu.be', 'googlevideo.com'),
+    'bilibili': ('bilibili.com', 'bilivideo.com', 'bilivideo.cn', 'hdslb.com')
+}
+
+RESOLUTION_PATTERN = re.compile(r'(\d{2,5})\s*[xX×]\s*(\d{2,5})')
+HEIGHT_PATTERN = re.compile(r'(\d{3,4})[pP]')
+
+
+def parse_quality(value):
+    """
+    解析画质偏好
+    
+    Args:
+        value: 'best'、'worst'，或目标高度如 '1080p'、'720'
+    
+    Returns:
+        str|int: 'best'、'worst' 或目标高度
+    """
+    value = str(value or 'best').strip().lower()
+    if value in ('best', 'worst'):
+        return value
+    match = re.match(r'(\d{3,4})p?$', value)
+    if match:
+        return int(match.group(1))
+    raise ValueError(f"无效的画质设置: {value}（可选 best、worst 或如 1080p 的高度）")
+
+
+def parse_resolution(value):
+    """解析 '1920x1080' 形式的分辨率，返回 (宽, 高)，无法解析返回 (0, 0)"""
+    match = RESOLUTION_PATTERN.search(value or '')
+    if match:
+        return int(match.group(1)), int(match.group(2))
+    return 0, 0
+
+
+def height_from_url(url):
+    """从URL中的 '720p' 等标记推测高度，无法判断返回0"""
+    match = HEIGHT_PATTERN.search(urlparse(url).path)
+    return int(match.group(1)) if match else 0
+
+
+def quality_key(variant, quality='best'):
+    """
+    码流排序键，值越小越符合画质偏好
+    
+    Args:
+        variant: 包含 'height'、'bandwidth'、'size'（均可缺省）的字典
+        quality: parse_quality() 的返回值
+    
+    Returns:
+        tuple: 排序键
+    """
+    height = variant.get('height') or 0
+    bandwidth = variant.get('bandwidth') or 0
+    size = variant.get('size') or 0
+    
+    if quality == 'worst':
+        # 未知高度或码率的排在已知的之后
+        return (height == 0, height, bandwidth == 0, bandwidth, size)
+    if quality == 'best':
+        return (-height, -bandwidth, -size)
+    
+    # 目标高度：不超过目标的最高画质优先，其次是超过目标的最低画质
+    if 0 < height <= quality:
+        return (0, -height, -bandwidth, -size)
+    if height > quality:
+        return (1, height, -bandwidth, -size)
+    return (2, 0, -bandwidth, -size)
+
+
+def rank_variants(variants, quality='best'):
+    """按画质偏好排序，返回新列表（最符合的在前）"""
+    return sorted(variants, key=lambda variant: quality_key(variant, quality))
+
+
+def pick_variant(variants, quality='best'):
+    """
+    选择最符合画质偏好的码流
+    
+    Args:
+        variants: 码流列表，每项包含 'bandwidth'，以及 'height' 或 'resolution'
+        quality: parse_quality() 的返回值
+    
+    Returns:
+        dict: 选中的码流，列表为空返回None
+    """
+    if not variants:
+        return None
+    
+    def key(variant):
+        if not variant.get('height') and variant.get('resolution'):
+            variant = dict(variant, height=parse_resolution(variant['resolution'])[1])
+        return quality_key(variant, quality)
+    
+    return min(variants, key=key)
+
+
+def platform_of(url):
+    """根据主机名判断平台，未知平台返回None"""
+    host = (urlparse(url).hostname or '').lower()
+    for platform, domains in PLATFORM_HOSTS.items():
+        if any(host == domain or host.endswith('.' + domain) for domain in domains):
+            return platform
+    return None
+
+
+def load_quality_preference(url=None, config_file='config.ini'):
+    """
+    读取画质偏好
+    
+    优先使用[platforms]中对应平台的 <平台>_quality（例如 youtube_quality），
+    其次是[download]中的 quality，默认 best。
+    
+    Args:
+        url: 页面URL，用于判断平台
+        config_file: 配置文件路径
+    
+    Returns:
+        str|int: parse_quality() 的返回值
+    """
+    config = configparser.ConfigParser()
+    config.read(config_file, encoding='utf-8')
+    
+    value = None
+    platform = platform_of(url) if url else None
+    if platform and config.has_section('platforms'):
+        value = config['platforms'].get(f'{platform}_quality')
+    if not value and config.has_section('download'):
+        value = config['download'].get('quality')
+    
+    try:
+        return parse_quality(value)
+    except ValueError:
+        return 'best'
@@ -0,0 +1,193 @@
+"""请求分类 - 一次遍历完成抓包请求的媒体类型、置信度、关键词和音视频角色标注"""
+
+import re
+
+
+VIDEO_EXTENSIONS = ('.mp4', '.webm', '.flv', '.mkv', '.mov', '.m4v', '.avi')
+AUDIO_EXTENSIONS = ('.m4a', '.aac', '.mp3', '.opus', '.ogg', '.flac')
+HLS_EXTENSIONS = ('.m3u8',)
+DASH_EXTENSIONS = ('.mpd',)
+SEGMENT_EXTENSIONS = ('.ts', '.m4s')
+HLS_MIME_TYPES = ('application/vnd.apple.mpegurl', 'application/x-mpegurl', 'audio/mpegurl')
+DASH_MIME_TYPES = ('application/dash+xml',)
+
+# 扩展名到流媒体类型的映射
+EXTENSION_KINDS = {
+    **{ext: 'hls' for ext in HLS_EXTENSIONS},
+    **{ext: 'dash' for ext in DASH_EXTENSIONS},
+    **{ext: 'segments' for ext in SEGMENT_EXTENSIONS},
+    **{ext: 'direct' for ext in VIDEO_EXTENSIONS}
+}
+MIME_KINDS = {
+    **{mime: 'hls' for mime in HLS_MIME_TYPES},
+    **{mime: 'dash' for mime in DASH_MIME_TYPES},
+    'video/mp2t': 'segments'
+}
+
+# 大于该大小的视频响应视为高置信度候选
+LARGE_MEDIA_SIZE = 1024 * 1024
+
+# 分离的音频轨：音频MIME、URL中的audio标记，或B站音频轨编号（302xx）
+AUDIO_URL_PATTERN = re.compile(r'audio|mime=audio|[-_/]302\d\d\.m4s', re.IGNORECASE)
+SEPARATE_TRACK_EXTENSIONS = ('.m4s', '.mp4', '.webm') + AUDIO_EXTENSIONS
+
+
+def url_extension(url):
+    """URL路径的小写扩展名"""
+    path = url.split('?', 1)[0].split('#', 1)[0].lower()
+    dot = path.rfind('.')
+    return path[dot:] if dot > path.rfind('/') else ''
+
+
+def contains_keyword(url, keywords):
+    """URL是否包含任一关键词（不区分大小写）"""
+    lowered = url.lower()
+    return any(keyword.lower() in lowered for keyword in keywords)
+
+
+def classify_request(req, extension=None):
+    """
+    判断请求的媒体类型
+    
+    Args:
+        req: 请求字典
+        extension: 已计算的URL扩展名
+    
+    Returns:
+        str: 'hls'、'dash'、'segments'、'direct'，非媒体请求返回None
+    """
+    extension = url_extension(req['url']) if extension is None else extension
+    mime_type = (req.get('mime_type') or '').lower()
+    
+    kind = EXTENSION_KINDS.get(extension)
+    if kind in ('hls', 'dash', 'segments'):
+        return kind
+    mime_kind = MIME_KINDS.get(mime_type)
+    if mime_kind:
+        return mime_kind
+    if kind or mime_type.startswith('video/') or req.get('type') == 'Media':
+        return 'direct'
+    return None
+
+
+def is_high_confidence(req, kind=None, extension=None):
+    """请求是否为高置信度的视频候选：流媒体清单、视频文件或较大的视频响应"""
+    extension = url_extension(req['url']) if extension is None else extension
+    kind = kind or classify_request(req, extension)
+    if kind in ('hls', 'dash'):
+        return True
+    return kind == 'direct' and (req.get('size', 0) >= LARGE_MEDIA_SIZE or extension in VIDEO_EXTENSIONS)
+
+
+class Classification:
+    """
+    分类结果
+    
+    Attributes:
+        tags: 与请求列表一一对应的标注 {'kind', 'confidence', 'keywords', 'role'}
+        media: 媒体请求（提供关键词时只包含命中关键词的请求）
+        candidates: {'high_confidence', 'medium_confidence', 'keyword_matches'}
+        streams: {'hls', 'dash', 'direct', 'segments'}，来自media
+        separate: {'has_separate', 'video_urls', 'audio_urls'}，来自命中关键词的请求
+    """
+    
+    def __init__(self):
+        self.tags = []
+        self.media = []
+        self.candidates = {'high_confidence': [], 'medium_confidence': [], 'keyword_matches': []}
+        self.streams = {'hls': [], 'dash': [], 'direct': [], 'segments': []}
+        self.separate = {'has_separate': False, 'video_urls': [], 'audio_urls': []}
+
+
+class RequestClassifier:
+    """
+    请求分类器
+    
+    关键词在构造时编译为一个正则表达式（多模式匹配），每个请求只匹配一次；
+    一次遍历同时得到媒体过滤、置信度候选、流媒体分组和分离音视频检测的结果，
+    代替分别调用 get_all_video_candidates / filter_video_requests /
+    extract_stream_urls / detect_separate_streams 的四次遍历。
+    """
+    
+    def __init__(self, keywords=None):
+        """
+        初始化请求分类器
+        
+        Args:
+            keywords: 关键词列表
+        """
+        self.keywords = [keyword for keyword in (keywords or []) if keyword]
+        self.pattern = None
+        if self.keywords:
+            # 长关键词优先，避免被其前缀截断
+            alternatives = sorted({re.escape(keyword.lower()) for keyword in self.keywords}, key=len, reverse=True)
+            self.pattern = re.compile('|'.join(alternatives), re.IGNORECASE)
+    
+    def tag(self, req):
+        """
+        标注单个请求
+        
+        Returns:
+            dict: {'kind', 'confidence', 'keywords', 'role'}
+                  confidence为 'high' / 'medium' / None，role为 'video' / 'audio' / None
+        """
+        url = req['url']
+        extension = url_extension(url)
+        kind = classify_request(req, extension)
+        mime_type = (req.get('mime_type') or '').lower()
+        
+        confidence = None
+        if kind in ('direct', 'hls', 'dash'):
+            confidence = 'high' if is_high_confidence(req, kind, extension) else 'medium'
+        
+        role = None
+        if mime_type.startswith('audio/') and kind not in ('hls', 'dash'):
+            role = 'audio'
+        elif kind in ('direct', 'segments') or extension in AUDIO_EXTENSIONS:
+            if extension in SEPARATE_TRACK_EXTENSIONS or mime_type.startswith('video/'):
+                role = 'audio' if extension in AUDIO_EXTENSIONS or AUDIO_URL_PATTERN.search(url) else 'video'
+        
+        hits = sorted({hit.lower() for hit in self.pattern.findall(url)}) if self.pattern else []
+        return {'kind': kind, 'confidence': confidence, 'keywords': hits, 'role': role}
+    
+    def classify(self, requests_list):
+        """
+        一次遍历分类全部请求
+        
+        Args:
+            requests_list: 抓包得到的请求列表
+        
+        Returns:
+            Classification: 分类结果
+        """
+        result = Classification()
+        seen = {key: set() for key in ('high_confidence', 'medium_confidence', 'keyword_matches',
+                                       'hls', 'dash', 'direct', 'segments', 'video', 'audio')}
+        
+        def add(target, key, url):
+            if url not in seen[key]:
+                seen[key].add(url)
+                target.append(url)
+        
+        for req in requests_list:
+            tag = self.tag(req)
+            result.tags.append(tag)
+            url = req['url']
+            kind = tag['kind']
+            
+            if tag['confidence']:
+                key = f"{tag['confidence']}_confidence"
+                add(result.candidates[key], key, url)
+            if kind and tag['keywords']:
+                add(result.candidates['keyword_matches'], 'keyword_matches', url)
+            
+            if self.pattern and not tag['keywords']:
+                continue
+            if kind:
+                result.media.append(req)
+                add(result.streams[kind], kind, url)
+            if tag['role']:
+                add(result.separate[f"{tag['role']}_urls"], tag['role'], url)
+        
+        result.separate['has_separate'] = bool(result.separate['video_urls'] and result.separate['audio_urls'])
+        return result
@@ -0,0 +1,347 @@
+"""分段下载器 - 多连接按字节范围并行下载单个大文件"""
+
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse, unquote
+
+import requests
+
+from .http_session import create_session
+
+
+def filename_from_url(url, default_ext='.mp4'):
+    """
+    根据URL路径生成文件名
+    
+    Args:
+        url: 文件URL
+        default_ext: URL中没有扩展名时使用的扩展名
+    
+    Returns:
+        str: 文件名
+    """
+    name = unquote(os.path.basename(urlparse(url).path)) or 'video'
+    if not os.path.splitext(name)[1]:
+        name += default_ext
+    return name
+
+
+def unique_filenames(urls, default_ext='.mp4'):
+    """
+    为一批URL分配互不相同的文件名
+    
+    路径末段相同的不同URL（例如 .../1080/index.mp4 和 .../720/index.mp4）
+    依次加上 _2、_3 等后缀；同一个URL重复出现时使用同一个文件名。
+    
+    Args:
+        urls: URL列表
+        default_ext: URL中没有扩展名时使用的扩展名
+    
+    Returns:
+        dict: {URL: 文件名}
+    """
+    names = {}
+    used = set()
+    for url in urls:
+        if url not in names:
+            names[url] = reserve_filename(url, used, default_ext)
+    return names
+
+
+def reserve_filename(url, used, default_ext='.mp4'):
+    """
+    为URL分配一个不在used中的文件名（不区分大小写），并登记到used
+    
+    Args:
+        url: 文件URL
+        used: 已占用文件名的小写集合，会被修改
+        default_ext: URL中没有扩展名时使用的扩展名
+    
+    Returns:
+        str: 文件名
+    """
+    name = filename_from_url(url, default_ext)
+    stem, ext = os.path.splitext(name)
+    number = 1
+    while name.lower() in used:
+        number += 1
+        name = f"{stem}_{number}{ext}"
+    used.add(name.lower())
+    return name
+
+
+class SegmentedDownloader:
+    """
+    分段下载器
+    
+    将大文件按字节范围切分为固定大小的分块，使用多个连接并行下载，
+    每个分块直接写入预分配好的目标文件的对应位置。下载过程中维护一份
+    分块记录（<文件名>.chunks），启用断点续传时只重新下载未完成的分块。
+    """
+    
+    CHUNK_MAP_SUFFIX = '.chunks'
+    
+    def __init__(self, output_dir='downloads', connections=4, chunk_size=8 * 1024 * 1024,
+                 min_size=32 * 1024 * 1024, retries=3, proxy=None, resume=False,
+                 logger=None, cookies=None, referer=None, session=None, decryptor_factory=None,
+                 index=None):
+        """
+        初始化分段下载器
+        
+        Args:
+            output_dir: 保存目录
+            connections: 单个文件的并行连接数
+            chunk_size: 分块大小（字节）
+            min_size: 启用分段下载的最小文件大小（字节）
+            retries: 单个分块的重试次数
+            proxy: 代理服务器地址
+            resume: 是否启用断点续传
+            logger: 日志记录器
+            cookies: Cookie字典
+            referer: Referer地址
+            session: 共享的requests会话，为None时从共享连接池创建
+            decryptor_factory: 返回流式解密器的可调用对象，提供时分块写盘前先解密
+            index: 已下载媒体索引（DownloadIndex），下载过的媒体不再建立连接
+        """
+        self.output_dir = output_dir
+        self.connections = max(1, connections)
+        self.chunk_size = max(1024 * 1024, chunk_size)
+        self.min_size = min_size
+        self.retries = retries
+        self.resume = resume
+        self.logger = logger or logging.getLogger(__name__)
+        
+        self.session = session or create_session(proxy=proxy, cookies=cookies, referer=referer)
+        self.decryptor_factory = decryptor_factory
+        self.index = index
+        
+        os.makedirs(output_dir, exist_ok=True)
+    
+    def probe(self, url):
+        """
+        探测文件大小以及服务器是否支持Range请求
+        
+        Args:
+            url: 文件URL
+        
+        Returns:
+            int: 文件大小（字节），不支持分段下载时返回None
+        """
+        try:
+            response = self.session.head(url, timeout=15, allow_redirects=True)
+            size = int(response.headers.get('Content-Length') or 0)
+            if response.ok and size > 0 and response.headers.get('Accept-Ranges', '').lower() == 'bytes':
+                return size
+            
+            # 部分服务器不响应HEAD或不声明Accept-Ranges，用1字节的Range请求确认
+            response = self.session.get(url, headers={'Range': 'bytes=0-0'}, timeout=15, stream=True)
+            content_range = response.headers.get('Content-Range', '')
+            response.close()
+            if response.status_code == 206 and '/' in content_range:
+                total = content_range.rsplit('/', 1)[1]
+                if total.isdigit():
+                    return int(total)
+        except requests.exceptions.RequestException as e:
+            self.logger.debug(f"探测文件大小失败: {url} - {e}")
+        
+        return None
+    
+    def partition(self, urls, workers=4):
+        """
+        将URL分为适合分段下载的大文件和其余文件
+        
+        Args:
+            urls: URL列表
+            workers: 并发探测线程数
+        
+        Returns:
+            tuple: (大文件URL列表, 其余URL列表, {URL: 探测到的大小})，URL保持原有顺序；
+                   大小字典可传给download_videos()，避免重复探测
+        """
+        if self.decryptor_factory and not self.decryptor_factory().random_access:
+            self.logger.info("当前解密方式只能顺序解密，不使用分段下载")
+            return [], list(urls), {}
+        
+        sizes = {}
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = {executor.submit(self.probe, url): url for url in urls}
+            for future in as_completed(futures):
+                sizes[futures[future]] = future.result()
+        
+        large = [url for url in urls if sizes.get(url) and sizes[url] >= self.min_size]
+        others = [url for url in urls if url not in large]
+        return large, others, sizes
+    
+    def get_filename(self, url):
+        """根据URL生成文件名"""
+        return filename_from_url(url)
+    
+    def download(self, url, filename=None, size=None):
+        """
+        分段下载单个文件
+        
+        Args:
+            url: 文件URL
+            filename: 保存文件名，默认根据URL生成
+            size: 已知的文件大小，为None时自动探测
+        
+        Returns:
+            str: 保存路径，失败返回None
+        """
+        filename = filename or self.get_filename(url)
+        output_path = os.path.join(self.output_dir, filename)
+        map_path = output_path + self.CHUNK_MAP_SUFFIX
+        
+        if size is None:
+            size = self.probe(url)
+        if not size:
+            self.logger.warning(f"服务器不支持分段下载: {url}")
+            return None
+        
+        chunk_count = (size + self.chunk_size - 1) // self.chunk_size
+        done = self._load_chunk_map(map_path, url, size)
+        
+        if done is None:
+            if os.path.exists(output_path) and os.path.getsize(output_path) == size and not os.path.exists(map_path):
+                self.logger.info(f"文件已存在，跳过: {filename}")
+                return output_path
+            
+            # 预分配目标文件
+            with open(output_path, 'wb') as f:
+                f.truncate(size)
+            done = set()
+        else:
+            self.logger.info(f"断点续传: {filename} 已完成 {len(done)}/{chunk_count} 个分块")
+        
+        pending = [i for i in range(chunk_count) if i not in done]
+        self._save_chunk_map(map_path, url, size, done)
+        
+        self.logger.info(f"开始分段下载: {filename} ({size / 1024 / 1024:.1f} MB, {len(pending)} 个分块, {self.connections} 个连接)")
+        
+        # 可随机位置解密的解密器无状态，所有分块共享一个实例
+        decryptor = self.decryptor_factory() if self.decryptor_factory else None
+        
+        failed = False
+        with ThreadPoolExecutor(max_workers=self.connections) as executor:
+            futures = {
+                executor.submit(self._download_chunk, url, output_path, index, size, decryptor): index
+                for index in pending
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                if future.result():
+                    done.add(index)
+                    self._save_chunk_map(map_path, url, size, done)
+                else:
+                    failed = True
+        
+        if failed or len(done) < chunk_count:
+            self.logger.error(f"分段下载未完成: {filename} ({len(done)}/{chunk_count})，可使用断点续传继续")
+            return None
+        
+        os.remove(map_path)
+        self.logger.info(f"分段下载完成: {filename}")
+        return output_path
+    
+    def download_videos(self, urls, sizes=None):
+        """
+        依次分段下载多个文件
+        
+        Args:
+            urls: URL列表
+            sizes: partition()探测到的文件大小，没有记录的URL重新探测
+        
+        Returns:
+            dict: {'success': 成功数, 'failed': 失败数, 'skipped': 跳过数}
+        """
+        results = {'success': 0, 'failed': 0, 'skipped': 0}
+        sizes = sizes or {}
+        
+        for url in urls:
+            filename = self.get_filename(url)
+            output_path = os.path.join(self.output_dir, filename)
+            if self.index and self.index.contains(url):
+                self.logger.info(f"以前已下载过，跳过: {filename}")
+                results['skipped'] += 1
+                continue
+            size = sizes.get(url) or self.probe(url)
+            
+            if (size and os.path.exists(output_path) and os.path.getsize(output_path) == size
+                    and not os.path.exists(output_path + self.CHUNK_MAP_SUFFIX)):
+                self.logger.info(f"文件已存在，跳过: {filename}")
+                results['skipped'] += 1
+            elif self.download(url, filename, size):
+                results['success'] += 1
+                if self.index:
+                    self.index.add(url, output_path)
+            else:
+                results['failed'] += 1
+        
+        return results
+    
+    def _download_chunk(self, url, output_path, index, size, decryptor=None):
+        """下载单个分块，需要时解密，然后写入目标文件对应位置"""
+        start = index * self.chunk_size
+        end = min(start + self.chunk_size, size) - 1
+        
+        for attempt in range(1, self.retries + 1):
+            try:
+                response = self.session.get(
+                    url,
+                    headers={'Range': f'bytes={start}-{end}'},
+                    timeout=30,
+                    stream=True
+                )
+                if response.status_code != 206:
+                    raise requests.exceptions.RequestException(f"服务器未返回分段内容 (HTTP {response.status_code})")
+                
+                written = 0
+                with open(output_path, 'r+b') as f:
+                    f.seek(start)
+                    for data in response.iter_content(chunk_size=64 * 1024):
+                        if decryptor:
+                            data = decryptor.decrypt_at(start + written, data)
+                        f.write(data)
+                        written += len(data)
+                
+                if written != end - start + 1:
+                    raise requests.exceptions.RequestException(f"分块大小不匹配: {written}/{end - start + 1}")
+                return True
+            
+            except (requests.exceptions.RequestException, OSError) as e:
+                self.logger.warning(f"分块 {index} 下载失败 (第{attempt}次): {e}")
+        
+        return False
+    
+    def _load_chunk_map(self, map_path, url, size):
+        """读取分块记录，记录无效或未启用续传时返回None"""
+        if not self.resume or not os.path.exists(map_path):
+            return None
+        
+        try:
+            with open(map_path, 'r', encoding='utf-8') as f:
+                chunk_map = json.load(f)
+        except (OSError, ValueError):
+            return None
+        
+        output_path = map_path[:-len(self.CHUNK_MAP_SUFFIX)]
+        if (chunk_map.get('url') != url or chunk_map.get('size') != size
+                or chunk_map.get('chunk_size') != self.chunk_size
+                or not os.path.exists(output_path) or os.path.getsize(output_path) != size):
+            return None
+        
+        return set(chunk_map.get('done', []))
+    
+    def _save_chunk_map(self, map_path, url, size, done):
+        """原子地写入分块记录"""
+        temp_path = map_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'url': url,
+                'size': size,
+                'chunk_size': self.chunk_size,
+                'done': sorted(done)
+            }, f)
+        os.replace(temp_path, map_path)
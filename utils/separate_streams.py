@@ -0,0 +1,174 @@
+"""分离音视频下载器 - 并行下载视频轨和音频轨并合并"""
+
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from .bandwidth import TransferMeter
+from .http_session import create_session
+from .mux import StreamingMuxer, concat_files, mux_streams
+
+
+# 分段视频同时下载的分段数
+SEGMENT_WORKERS = 4
+
+
+class SeparateStreamDownloader:
+    """
+    分离音视频下载器
+    
+    每一对（视频, 音频）的两条轨道同时下载，所有轨道共享一个传输计量器；
+    页面包含多个条目时，多对音视频可以并行处理。优先边下载边合并，
+    不适用时两条轨道并行下载到临时文件后再合并。同一个视频的多个分段
+    并行下载到临时文件后按顺序拼接。
+    """
+    
+    def __init__(self, output_dir='downloads', max_pairs=2, streaming=True, retries=3,
+                 session=None, proxy=None, logger=None, chunk_size=256 * 1024):
+        """
+        初始化分离音视频下载器
+        
+        Args:
+            output_dir: 保存目录
+            max_pairs: 同时处理的音视频对数
+            streaming: 是否优先边下载边合并
+            retries: 单条轨道的重试次数
+            session: 共享的requests会话，为None时从共享连接池创建
+            proxy: 代理服务器地址（未提供session时使用）
+            logger: 日志记录器
+            chunk_size: 写盘块大小（字节）
+        """
+        self.output_dir = output_dir
+        self.max_pairs = max(1, max_pairs)
+        self.streaming = streaming
+        self.retries = max(1, retries)
+        self.session = session or create_session(proxy=proxy)
+        self.logger = logger or logging.getLogger(__name__)
+        self.chunk_size = chunk_size
+        self.meter = TransferMeter()
+        
+        os.makedirs(output_dir, exist_ok=True)
+    
+    def download_pairs(self, pairs, output_name='merged_video.mp4'):
+        """
+        并行下载并合并多对音视频
+        
+        Args:
+            pairs: [(video_url, audio_url), ...]
+            output_name: 输出文件名，第2对起自动追加序号
+        
+        Returns:
+            list: 与pairs对应的输出文件路径，失败的项为None
+        """
+        base, ext = os.path.splitext(output_name)
+        names = [output_name if i == 0 else f"{base}_{i + 1}{ext}" for i in range(len(pairs))]
+        
+        with ThreadPoolExecutor(max_workers=self.max_pairs) as executor:
+            futures = [
+                executor.submit(self.download_pair, video_url, audio_url, name)
+                for (video_url, audio_url), name in zip(pairs, names)
+            ]
+            results = [future.result() for future in futures]
+        
+        stats = self.meter.snapshot()
+        self.logger.info(f"音视频下载统计: {stats['total_bytes'] / 1024 / 1024:.1f} MB, "
+                         f"平均 {stats['speed'] / 1024 / 1024:.2f} MB/s")
+        return results
+    
+    def download_pair(self, video_url, audio_url, output_name='merged_video.mp4'):
+        """
+        并行下载一对音视频并合并
+        
+        Args:
+            video_url: 视频流URL
+            audio_url: 音频流URL
+            output_name: 输出文件名
+        
+        Returns:
+            str: 输出文件路径，失败返回None
+        """
+        output_path = os.path.join(self.output_dir, output_name)
+        
+        if self.streaming:
+            muxer = StreamingMuxer(session=self.session, logger=self.logger, meter=self.meter)
+            if muxer.merge(video_url, audio_url, output_path):
+                return output_path
+        
+        base = os.path.splitext(output_path)[0]
+        tracks = {
+            'video': (video_url, f"{base}.video.part"),
+            'audio': (audio_url, f"{base}.audio.part")
+        }
+        
+        errors = {}
+        threads = [
+            threading.Thread(target=self._download_track, args=(kind, url, path, errors), daemon=True)
+            for kind, (url, path) in tracks.items()
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        try:
+            if errors:
+                for kind, error in errors.items():
+                    self.logger.error(f"{kind} 轨道下载失败: {error}")
+                return None
+            return mux_streams(tracks['video'][1], tracks['audio'][1], output_path, self.logger)
+        finally:
+            for _, path in tracks.values():
+                if os.path.exists(path):
+                    os.remove(path)
+    
+    def download_segments(self, urls, output_name='segmented_video.mp4'):
+        """
+        并行下载同一个视频的多个分段并按顺序拼接
+        
+        Args:
+            urls: 分段URL列表（按播放顺序）
+            output_name: 输出文件名
+        
+        Returns:
+            str: 输出文件路径，失败返回None
+        """
+        output_path = os.path.join(self.output_dir, output_name)
+        base = os.path.splitext(output_path)[0]
+        parts = [f"{base}.part{i + 1}" for i in range(len(urls))]
+        
+        errors = {}
+        with ThreadPoolExecutor(max_workers=max(1, min(len(urls), SEGMENT_WORKERS))) as executor:
+            for i, (url, path) in enumerate(zip(urls, parts)):
+                executor.submit(self._download_track, f"segment{i + 1}", url, path, errors)
+        
+        try:
+            if errors:
+                for kind, error in errors.items():
+                    self.logger.error(f"{kind} 分段下载失败: {error}")
+                return None
+            return concat_files(parts, output_path, self.logger)
+        finally:
+            for path in parts:
+                if os.path.exists(path):
+                    os.remove(path)
+    
+    def _download_track(self, kind, url, path, errors):
+        """下载单条轨道到临时文件（带重试）"""
+        last_error = None
+        for attempt in range(1, self.retries + 1):
+            try:
+                with self.session.get(url, stream=True, timeout=30) as response:
+                    response.raise_for_status()
+                    with open(path, 'wb') as f:
+                        for data in response.iter_content(chunk_size=self.chunk_size):
+                            f.write(data)
+                            self.meter.add(len(data), kind)
+                return
+            except (requests.exceptions.RequestException, OSError) as e:
+                self.logger.warning(f"{kind} 轨道下载失败 (第{attempt}次): {e}")
+                last_error = e
+        
+        errors[kind] = last_error
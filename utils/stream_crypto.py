@@ -0,0 +1,180 @@
+"""流式解密 - 在下载过程中逐块解密，文件落盘即为明文"""
+
+try:
+    from Crypto.Cipher import AES
+except ImportError:
+    AES = None
+
+
+DECRYPT_METHODS = ('webmask', 'aes-128-cbc', 'aes-ctr')
+
+
+class StreamDecryptor:
+    """
+    流式解密器基类
+    
+    按数据到达顺序调用update()，全部数据到达后调用finalize()取得剩余明文。
+    random_access为True的解密器还支持decrypt_at()，可以按任意偏移解密，
+    因此能用于多连接分段下载。
+    """
+    
+    random_access = False
+    
+    def update(self, data):
+        """解密一块按顺序到达的数据，返回可以写出的明文"""
+        raise NotImplementedError
+    
+    def finalize(self):
+        """结束解密，返回剩余的明文"""
+        return b''
+    
+    def decrypt_at(self, offset, data):
+        """解密位于文件offset处的一块数据（仅random_access解密器支持）"""
+        raise NotImplementedError(f"{type(self).__name__} 不支持随机位置解密")
+
+
+class RandomAccessDecryptor(StreamDecryptor):
+    """可按偏移解密的解密器，顺序解密通过记录当前位置实现"""
+    
+    random_access = True
+    
+    def __init__(self):
+        self.position = 0
+    
+    def update(self, data):
+        plain = self.decrypt_at(self.position, data)
+        self.position += len(data)
+        return plain
+
+
+class WebMaskDecryptor(RandomAccessDecryptor):
+    """
+    webmask解密器
+    
+    文件开头length字节（为None时为整个文件）与掩码按位置循环异或。
+    """
+    
+    def __init__(self, mask, length=None):
+        """
+        初始化webmask解密器
+        
+        Args:
+            mask: 掩码字节
+            length: 被掩码覆盖的字节数，None表示整个文件
+        """
+        super().__init__()
+        if not mask:
+            raise ValueError("webmask掩码不能为空")
+        self.mask = bytes(mask)
+        self.length = length
+    
+    def decrypt_at(self, offset, data):
+        end = len(data) if self.length is None else max(0, min(len(data), self.length - offset))
+        if end <= 0:
+            return data
+        
+        start = offset % len(self.mask)
+        repeat = (start + end) // len(self.mask) + 1
+        stream = (self.mask * repeat)[start:start + end]
+        head = (int.from_bytes(data[:end], 'big') ^ int.from_bytes(stream, 'big')).to_bytes(end, 'big')
+        return head + data[end:]
+
+
+class AESCTRDecryptor(RandomAccessDecryptor):
+    """AES-CTR解密器，计数器初始值为iv，可按任意偏移解密"""
+    
+    def __init__(self, key, iv):
+        """
+        初始化AES-CTR解密器
+        
+        Args:
+            key: AES密钥
+            iv: 16字节的计数器初始值
+        """
+        super().__init__()
+        self.key = key
+        self.counter = int.from_bytes(iv, 'big')
+    
+    def decrypt_at(self, offset, data):
+        block, skip = divmod(offset, 16)
+        cipher = AES.new(self.key, AES.MODE_CTR, nonce=b'',
+                         initial_value=(self.counter + block) % (1 << 128))
+        if skip:
+            cipher.decrypt(b'\0' * skip)
+        return cipher.decrypt(data)
+
+
+class AESCBCDecryptor(StreamDecryptor):
+    """
+    AES-CBC解密器
+    
+    CBC必须顺序解密；数据按16字节块对齐后解密，最后一块保留到finalize()
+    以便去除PKCS7填充。
+    """
+    
+    def __init__(self, key, iv, unpad=True):
+        """
+        初始化AES-CBC解密器
+        
+        Args:
+            key: AES密钥
+            iv: 16字节初始向量
+            unpad: 是否去除PKCS7填充
+        """
+        self.cipher = AES.new(key, AES.MODE_CBC, iv)
+        self.unpad = unpad
+        self.buffer = b''
+    
+    def update(self, data):
+        self.buffer += data
+        usable = len(self.buffer) - (16 if self.unpad else 0)
+        usable -= usable % 16
+        if usable <= 0:
+            return b''
+        
+        chunk, self.buffer = self.buffer[:usable], self.buffer[usable:]
+        return self.cipher.decrypt(chunk)
+    
+    def finalize(self):
+        if len(self.buffer) % 16:
+            raise ValueError("AES-CBC密文长度不是16字节的整数倍")
+        
+        plain = self.cipher.decrypt(self.buffer) if self.buffer else b''
+        self.buffer = b''
+        if self.unpad and plain:
+            padding = plain[-1]
+            if 0 < padding <= 16 and plain.endswith(bytes([padding]) * padding):
+                plain = plain[:-padding]
+        return plain
+
+
+def create_decryptor(method, key, iv=None, length=None):
+    """
+    创建流式解密器
+    
+    Args:
+        method: 解密方式，webmask / aes-128-cbc / aes-ctr
+        key: 密钥（webmask为掩码）字节
+        iv: AES初始向量字节，默认全0
+        length: webmask覆盖的字节数，None表示整个文件
+    
+    Returns:
+        StreamDecryptor: 新的解密器实例（每个文件使用一个）
+    """
+    if method == 'webmask':
+        return WebMaskDecryptor(key, length)
+    
+    if method not in DECRYPT_METHODS:
+        raise ValueError(f"不支持的解密方式: {method}")
+    if AES is None:
+        raise ImportError("AES解密需要pycryptodome，请运行: pip install pycryptodome")
+    valid_lengths = (16,) if method == 'aes-128-cbc' else (16, 24, 32)
+    if len(key) not in valid_lengths:
+        raise ValueError(f"无效的{method}密钥长度: {len(key)}")
+    
+    iv = iv or b'\0' * 16
+    if len(iv) != 16:
+        raise ValueError(f"无效的AES初始向量长度: {len(iv)}，应为16字节")
+    if method == 'aes-ctr':
+        return AESCTRDecryptor(key, iv)
+    return AESCBCDecryptor(key, iv)
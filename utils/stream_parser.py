@@ -0,0 +1,226 @@
+"""流式HTML解析 - 边下载边解析网页，找到足够的视频链接后立即停止"""
+
+import logging
+import re
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+from .http_session import create_session
+from .request_classifier import VIDEO_EXTENSIONS, url_extension
+
+
+# 这些标签的地址属性即使没有视频扩展名也视为视频链接
+MEDIA_TAGS = {'video': ('src', 'data-src'), 'source': ('src', 'data-src')}
+# 这些标签的地址属性只在带视频扩展名时才视为视频链接
+LINK_TAGS = {'a': ('href',), 'embed': ('src',), 'object': ('data',)}
+# <meta property="og:video" content="..."> 等
+VIDEO_META = ('og:video', 'og:video:url', 'og:video:secure_url', 'twitter:player:stream')
+
+# 脚本和JSON中出现的视频文件地址
+VIDEO_URL_BODY = r'''(?:https?:)?//[^\s'"<>\\]+?(?:%s)(?:\?[^\s'"<>\\]*)?''' % (
+    '|'.join(re.escape(ext) for ext in VIDEO_EXTENSIONS)
+)
+# 数据块中的地址必须以分隔符结束：块末尾的地址可能还没有读完
+VIDEO_URL_PATTERN = re.compile(VIDEO_URL_BODY + r'''(?=[\s'"<>\\])''', re.IGNORECASE)
+# 正文结束后，末尾的地址才算完整
+VIDEO_URL_AT_END_PATTERN = re.compile(VIDEO_URL_BODY + r'''(?=[\s'"<>\\]|$)''', re.IGNORECASE)
+# 相邻数据块之间保留的字符数，避免地址被切断在块边界上
+CHUNK_OVERLAP = 2048
+
+
+class _StartTagCollector(HTMLParser):
+    """lxml不可用时使用的标准库增量解析器，只收集开始标签"""
+    
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.tags = []
+    
+    def handle_starttag(self, tag, attrs):
+        self.tags.append((tag, dict(attrs)))
+    
+    def handle_startendtag(self, tag, attrs):
+        self.tags.append((tag, dict(attrs)))
+    
+    def read_tags(self):
+        tags, self.tags = self.tags, []
+        return tags
+
+
+class _LxmlTagReader:
+    """基于lxml.etree.HTMLPullParser的增量解析，已结束的元素立即释放"""
+    
+    def __init__(self):
+        self.parser = etree.HTMLPullParser(events=('start', 'end'))
+    
+    def feed(self, data):
+        self.parser.feed(data)
+    
+    def close(self):
+        try:
+            self.parser.close()
+        except etree.XMLSyntaxError:
+            pass
+    
+    def read_tags(self):
+        tags = []
+        for event, element in self.parser.read_events():
+            if not isinstance(element.tag, str):
+                continue
+            if event == 'start':
+                tags.append((element.tag.lower(), dict(element.attrib)))
+            else:
+                # 只保留当前路径上的元素，整棵树不会随页面大小增长
+                element.clear()
+                parent = element.getparent()
+                while parent is not None and element.getprevious() is not None:
+                    del parent[0]
+        return tags
+
+
+class StreamingVideoParser:
+    """
+    流式视频链接解析器
+    
+    逐块读取响应正文并增量解析（优先使用lxml，未安装时使用标准库
+    html.parser），同时用正则扫描脚本和JSON中的视频地址。每发现一个
+    链接就立即产出，达到数量上限后停止读取并关闭连接，不需要把整个
+    页面读入内存或构建完整的文档树。
+    """
+    
+    def __init__(self, chunk_size=64 * 1024, logger=None):
+        """
+        初始化流式解析器
+        
+        Args:
+            chunk_size: 每次读取的正文大小
+            logger: 日志记录器
+        """
+        self.chunk_size = chunk_size
+        self.logger = logger or logging.getLogger(__name__)
+    
+    def iter_links(self, chunks, base_url, limit=None):
+        """
+        从文本块序列中逐个产出视频链接
+        
+        Args:
+            chunks: 可迭代的HTML文本块
+            base_url: 解析相对地址的基准URL
+            limit: 最多产出的链接数，None表示不限制
+        
+        Yields:
+            str: 视频链接（去重，按出现顺序）
+        """
+        if limit is not None and limit <= 0:
+            return
+        
+        reader = _LxmlTagReader() if etree is not None else _StartTagCollector()
+        seen = set()
+        tail = ''
+        
+        for chunk in chunks:
+            if not chunk:
+                continue
+            reader.feed(chunk)
+            
+            found = [self._link_from_tag(tag, attrs) for tag, attrs in reader.read_tags()]
+            text = tail + chunk
+            found.extend(match.group(0) for match in VIDEO_URL_PATTERN.finditer(text))
+            tail = text[-CHUNK_OVERLAP:]
+            
+            for link in found:
+                link = self._resolve(link, base_url)
+                if link and link not in seen:
+                    seen.add(link)
+                    yield link
+                    if limit is not None and len(seen) >= limit:
+                        return
+        
+        reader.close()
+        found = [self._link_from_tag(tag, attrs) for tag, attrs in reader.read_tags()]
+        found.extend(match.group(0) for match in VIDEO_URL_AT_END_PATTERN.finditer(tail))
+        for link in found:
+            link = self._resolve(link, base_url)
+            if link and link not in seen:
+                seen.add(link)
+                yield link
+                if limit is not None and len(seen) >= limit:
+                    return
+    
+    def parse(self, url, session=None, limit=None, cache=None, proxy=None):
+        """
+        获取并解析网页
+        
+        页面已在cache中时直接分块解析缓存内容；否则流式下载，达到上限后
+        提前关闭连接。完整读完的页面写入cache，供后续回退的解析器复用。
+        
+        Args:
+            url: 网页URL
+            session: requests会话，为None时从共享连接池创建
+            limit: 最多返回的链接数
+            cache: 已获取内容缓存（PageCache）
+            proxy: 代理服务器地址
+        
+        Returns:
+            list: 视频链接列表
+        """
+        cached = cache.get(url) if cache is not None else None
+        if cached is not None:
+            chunks = (cached[i:i + self.chunk_size] for i in range(0, len(cached), self.chunk_size))
+            return list(self.iter_links(chunks, url, limit))
+        
+        session = session or create_session(proxy=proxy)
+        self.logger.info(f"流式解析网页: {url}")
+        with session.get(url, timeout=30, stream=True) as response:
+            response.raise_for_status()
+            if response.encoding is None:
+                response.encoding = 'utf-8'
+            
+            received = []
+            complete = []
+            
+            def chunks():
+                for chunk in response.iter_content(chunk_size=self.chunk_size, decode_unicode=True):
+                    received.append(chunk)
+                    yield chunk
+                complete.append(True)
+            
+            links = list(self.iter_links(chunks(), response.url or url, limit))
+        
+        if complete and cache is not None:
+            cache.put(url, ''.join(received))
+        self.logger.info(f"流式解析完成，读取 {sum(len(c) for c in received)} 字符，找到 {len(links)} 个视频链接"
+                         + ('' if complete else '（已提前停止）'))
+        return links
+    
+    @staticmethod
+    def _link_from_tag(tag, attrs):
+        """从开始标签中取出视频地址"""
+        if tag in MEDIA_TAGS:
+            for name in MEDIA_TAGS[tag]:
+                if attrs.get(name):
+                    return attrs[name]
+        elif tag in LINK_TAGS:
+            for name in LINK_TAGS[tag]:
+                value = attrs.get(name)
+                if value and url_extension(value) in VIDEO_EXTENSIONS:
+                    return value
+        elif tag == 'meta':
+            name = (attrs.get('property') or attrs.get('name') or '').lower()
+            if name in VIDEO_META and attrs.get('content'):
+                return attrs['content']
+        return None
+    
+    @staticmethod
+    def _resolve(link, base_url):
+        """转换为绝对地址，忽略blob:/data:等无法下载的地址"""
+        if not link:
+            return None
+        link = link.strip().replace('\\/', '/')
+        if link.startswith(('blob:', 'data:', 'javascript:', '#')):
+            return None
+        return urljoin(base_url, link)
@@ -0,0 +1,372 @@
+"""URL探测 - 用HEAD/Range请求判断URL类型，并缓存已获取的网页内容"""
+
+import logging
+import threading
+from collections import OrderedDict
+
+import requests
+
+from .http_session import create_session
+from .request_classifier import (
+    AUDIO_EXTENSIONS, DASH_EXTENSIONS, DASH_MIME_TYPES, HLS_EXTENSIONS, HLS_MIME_TYPES,
+    VIDEO_EXTENSIONS, url_extension
+)
+
+
+# 只读取响应开头的字节用于识别文件类型
+SNIFF_BYTES = 4096
+# 探测时最多读取的网页大小，超过时不缓存，由后续的解析器自行获取
+MAX_PAGE_BYTES = 16 * 1024 * 1024
+
+# 忽略Range时读取完整正文的响应类型（可能是网页），其余只读开头几KB
+TEXT_CONTENT_TYPES = ('text/', 'application/xhtml+xml', 'application/xml')
+
+# 不同URL类型直接对应的下载策略，网页仍由SmartDetector结合HTML内容推荐
+PROBE_STRATEGIES = {
+    'hls': {'method': 'hls_download', 'use_capture': False, 'use_hls': True, 'use_merge': False},
+    'dash': {'method': 'dash_download', 'use_capture': False, 'use_hls': False, 'use_merge': True},
+    'video': {'method': 'direct_download', 'use_capture': False, 'use_hls': False, 'use_merge': False},
+    'audio': {'method': 'direct_download', 'use_capture': False, 'use_hls': False, 'use_merge': False}
+}
+
+
+def sniff_type(data):
+    """
+    根据文件头（魔数）判断内容类型
+    
+    Args:
+        data: 响应开头的字节
+    
+    Returns:
+        str: 'hls'、'dash'、'video'、'audio'、'webpage'，无法识别返回None
+    """
+    head = data.lstrip(b'\xef\xbb\xbf \t\r\n')
+    lowered = head[:512].lower()
+    
+    if head.startswith(b'#EXTM3U'):
+        return 'hls'
+    if b'<mpd' in lowered:
+        return 'dash'
+    if lowered.startswith((b'<!doctype html', b'<html')) or b'<head' in lowered or b'<body' in lowered:
+        return 'webpage'
+    
+    if data[4:8] == b'ftyp':
+        # ISO BMFF：M4A为纯音频，其余按视频处理
+        return 'audio' if data[8:12] in (b'M4A ', b'M4B ') else 'video'
+    if data.startswith((b'\x1aE\xdf\xa3', b'FLV', b'\x00\x00\x01\xba')) or data[4:8] in (b'moof', b'styp'):
+        return 'video'
+    if data[:4] == b'RIFF' and data[8:12] == b'AVI ':
+        return 'video'
+    if len(data) > 188 and data[0] == 0x47 and data[188] == 0x47:
+        # MPEG-TS 每188字节一个同步字节
+        return 'video'
+    if data.startswith((b'ID3', b'OggS', b'fLaC')) or data[:2] in (b'\xff\xf1', b'\xff\xf9', b'\xff\xfb'):
+        return 'audio'
+    return None
+
+
+def type_from_content_type(content_type):
+    """根据Content-Type判断URL类型，无法判断返回None"""
+    content_type = (content_type or '').split(';', 1)[0].strip().lower()
+    if content_type in HLS_MIME_TYPES:
+        return 'hls'
+    if content_type in DASH_MIME_TYPES:
+        return 'dash'
+    if content_type.startswith('video/'):
+        return 'video'
+    if content_type.startswith('audio/'):
+        return 'audio'
+    if content_type in ('text/html', 'application/xhtml+xml'):
+        return 'webpage'
+    return None
+
+
+def type_from_extension(url):
+    """根据URL扩展名推测类型，无法判断返回None"""
+    extension = url_extension(url)
+    if extension in HLS_EXTENSIONS:
+        return 'hls'
+    if extension in DASH_EXTENSIONS:
+        return 'dash'
+    if extension in VIDEO_EXTENSIONS:
+        return 'video'
+    if extension in AUDIO_EXTENSIONS:
+        return 'audio'
+    return None
+
+
+def decode_page(body, response):
+    """
+    解码网页正文
+    
+    只有Content-Type声明了charset时才使用响应的编码；没有声明时按UTF-8解码，
+    而不是requests为text/*默认的ISO-8859-1。无法解码的字节替换为占位符。
+    
+    Args:
+        body: 网页正文字节
+        response: 对应的响应
+    
+    Returns:
+        str: 网页内容
+    """
+    content_type = response.headers.get('Content-Type', '')
+    encoding = response.encoding if 'charset=' in content_type.lower() else None
+    try:
+        return body.decode(encoding or 'utf-8', 'replace')
+    except LookupError:
+        # 声明了Python不认识的charset
+        return body.decode('utf-8', 'replace')
+
+
+class PageCache:
+    """
+    已获取内容缓存
+    
+    在一次运行中保存已下载的网页正文，URL类型检测、策略推荐和HTML解析
+    共用同一份内容，每个页面最多请求一次。只保存在内存中，按最近使用
+    淘汰。
+    """
+    
+    def __init__(self, max_entries=16):
+        """
+        初始化已获取内容缓存
+        
+        Args:
+            max_entries: 最多保存的页面数
+        """
+        self.max_entries = max(1, max_entries)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _key(url):
+        return url.split('#', 1)[0]
+    
+    def get(self, url):
+        """读取缓存的网页内容，未命中返回None"""
+        key = self._key(url)
+        with self._lock:
+            text = self._entries.get(key)
+            if text is not None:
+                self._entries.move_to_end(key)
+            return text
+    
+    def put(self, url, text):
+        """保存网页内容"""
+        key = self._key(url)
+        with self._lock:
+            self._entries[key] = text
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def fetch(self, url, session=None, proxy=None, logger=None):
+        """
+        获取网页内容，已缓存时不再发送请求
+        
+        Args:
+            url: 网页URL
+            session: requests会话，为None时从共享连接池创建
+            proxy: 代理服务器地址
+            logger: 日志记录器
+        
+        Returns:
+            str: 网页内容
+        
+        Raises:
+            requests.exceptions.RequestException: 请求失败
+        """
+        text = self.get(url)
+        if text is not None:
+            if logger:
+                logger.debug(f"使用已获取的网页内容: {url}")
+            return text
+        
+        session = session or create_session(proxy=proxy)
+        if logger:
+            logger.info(f"正在获取网页内容: {url}")
+        response = session.get(url, timeout=30)
+        response.raise_for_status()
+        
+        text = decode_page(response.content, response)
+        self.put(url, text)
+        if logger:
+            logger.info(f"成功获取网页内容，大小: {len(response.content)} 字节")
+        return text
+
+
+class URLProbe:
+    """
+    URL探测器
+    
+    不下载完整内容即可判断URL类型：扩展名像媒体文件的URL先发HEAD请求，
+    Content-Type不明确时再用Range请求读取开头几KB按文件头识别；其余URL
+    直接发带Range的GET请求，服务器返回完整网页时正文写入PageCache，
+    供后续的策略推荐和HTML解析复用。
+    """
+    
+    def __init__(self, session=None, cache=None, proxy=None, timeout=15, logger=None):
+        """
+        初始化URL探测器
+        
+        Args:
+            session: requests会话，为None时从共享连接池创建
+            cache: 已获取内容缓存，为None时新建
+            proxy: 代理服务器地址
+            timeout: 请求超时时间（秒）
+            logger: 日志记录器
+        """
+        self.session = session or create_session(proxy=proxy)
+        self.cache = cache if cache is not None else PageCache()
+        self.timeout = timeout
+        self.logger = logger or logging.getLogger(__name__)
+        self._results = {}
+    
+    def probe(self, url):
+        """
+        探测URL
+        
+        Returns:
+            dict: {'type', 'content_type', 'size', 'accept_ranges', 'final_url'}
+                  type为 'hls'、'dash'、'video'、'audio'、'webpage' 或 'unknown'
+        """
+        if url in self._results:
+            return self._results[url]
+        
+        result = {'type': 'unknown', 'content_type': '', 'size': None, 'accept_ranges': False, 'final_url': url}
+        try:
+            if type_from_extension(url):
+                self._probe_head(url, result)
+            if result['type'] == 'unknown':
+                self._probe_range(url, result)
+        except requests.exceptions.RequestException as e:
+            self.logger.debug(f"URL探测失败: {url} - {e}")
+        
+        self.logger.debug(f"URL探测结果: {url} -> {result['type']} ({result['content_type'] or '未知类型'})")
+        self._results[url] = result
+        return result
+    
+    def detect_url_type(self, url):
+        """探测URL类型，失败时按扩展名推测"""
+        url_type = self.probe(url)['type']
+        if url_type == 'unknown':
+            url_type = type_from_extension(url) or 'unknown'
+        return url_type
+    
+    def recommend_strategy(self, url):
+        """
+        媒体文件和流媒体清单直接对应的下载策略
+        
+        Returns:
+            dict: 策略字典，网页或无法判断时返回None
+        """
+        strategy = PROBE_STRATEGIES.get(self.detect_url_type(url))
+        return dict(strategy) if strategy else None
+    
+    def _probe_head(self, url, result):
+        """HEAD请求：只看响应头"""
+        response = self.session.head(url, timeout=self.timeout, allow_redirects=True)
+        if not response.ok:
+            return
+        self._read_headers(response, result)
+        result['type'] = type_from_content_type(result['content_type']) or 'unknown'
+    
+    def _probe_range(self, url, result):
+        """带Range的GET请求：读取开头几KB识别文件头，完整返回的网页写入缓存"""
+        with self.session.get(url, headers={'Range': f'bytes=0-{SNIFF_BYTES - 1}'},
+                              timeout=self.timeout, stream=True) as response:
+            if response.status_code not in (200, 206):
+                return
+            self._read_headers(response, result)
+            header_type = type_from_content_type(result['content_type'])
+            textual = not result['content_type'] or result['content_type'].lower().startswith(TEXT_CONTENT_TYPES)
+            
+            if response.status_code == 200 and textual and not self._is_large(response):
+                # 服务器忽略了Range，返回的就是完整网页，读完后保存避免再次请求；
+                # 没有声明长度时最多读取MAX_PAGE_BYTES
+                body, complete = self._read_capped(response, MAX_PAGE_BYTES)
+                result['type'] = sniff_type(body[:SNIFF_BYTES]) or header_type or 'unknown'
+                if result['type'] == 'webpage' and complete:
+                    self._cache_page(url, result, body, response)
+                return
+            
+            head = b''
+            for data in response.iter_content(chunk_size=SNIFF_BYTES):
+                head += data
+                if len(head) >= SNIFF_BYTES:
+                    break
+            result['type'] = sniff_type(head) or header_type or 'unknown'
+            if result['type'] != 'webpage':
+                return
+            if result['size'] is not None and len(head) >= result['size']:
+                # 整个网页都在Range范围内
+                self._cache_page(url, result, head, response)
+                return
+        
+        if response.status_code == 206 and (result['size'] or 0) <= MAX_PAGE_BYTES:
+            # 分段返回的网页：接着读取剩余部分，后续解析不必再请求一次
+            body = self._fetch_rest(url, head)
+            if body is not None:
+                self._cache_page(url, result, body, response)
+    
+    def _fetch_rest(self, url, head):
+        """
+        读取网页在head之后的部分
+        
+        Returns:
+            bytes: 完整的网页，超过MAX_PAGE_BYTES或请求失败时返回None
+        """
+        try:
+            with self.session.get(url, headers={'Range': f'bytes={len(head)}-'},
+                                  timeout=self.timeout, stream=True) as response:
+                if response.status_code == 206:
+                    rest, complete = self._read_capped(response, MAX_PAGE_BYTES - len(head))
+                    return head + rest if complete else None
+                if response.status_code == 200:
+                    body, complete = self._read_capped(response, MAX_PAGE_BYTES)
+                    return body if complete else None
+        except requests.exceptions.RequestException as e:
+            self.logger.debug(f"读取网页剩余部分失败: {url} - {e}")
+        return None
+    
+    @staticmethod
+    def _read_capped(response, limit):
+        """
+        读取响应正文，最多limit字节
+        
+        Returns:
+            tuple: (已读取的内容, 是否已读完)
+        """
+        body = bytearray()
+        for data in response.iter_content(chunk_size=64 * 1024):
+            body += data
+            if len(body) > limit:
+                return bytes(body), False
+        return bytes(body), True
+    
+    def _cache_page(self, url, result, body, response):
+        """解码网页并写入缓存（请求的URL和重定向后的URL都写入）"""
+        text = decode_page(body, response)
+        self.cache.put(url, text)
+        if result['final_url'] != url:
+            self.cache.put(result['final_url'], text)
+    
+    @staticmethod
+    def _is_large(response):
+        """响应声明的长度超过普通网页（可能是未声明类型的媒体文件）"""
+        length = response.headers.get('Content-Length', '')
+        return length.isdigit() and int(length) > MAX_PAGE_BYTES
+    
+    @staticmethod
+    def _read_headers(response, result):
+        headers = response.headers
+        result['content_type'] = headers.get('Content-Type', '')
+        result['final_url'] = response.url or result['final_url']
+        result['accept_ranges'] = response.status_code == 206 or headers.get('Accept-Ranges', '').lower() == 'bytes'
+        
+        content_range = headers.get('Content-Range', '')
+        total = content_range.rsplit('/', 1)[1] if '/' in content_range else ''
+        if total.isdigit():
+            result['size'] = int(total)
+        elif response.status_code != 206 and headers.get('Content-Length', '').isdigit():
+            result['size'] = int(headers['Content-Length'])
@@ -0,0 +1,203 @@
+"""码流探测 - 并发探测候选视频的码率、分辨率和大小，选出最符合画质偏好的一个"""
+
+import logging
+import struct
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from .dash import parse_mpd
+from .hls import parse_playlist
+from .http_session import create_session
+from .quality import height_from_url, parse_resolution, pick_variant, rank_variants
+from .request_classifier import url_extension
+
+
+# 读取文件开头的字节数，faststart的MP4/M4S的moov通常在这个范围内
+HEADER_BYTES = 64 * 1024
+
+# 需要展开查找子box的容器
+CONTAINER_BOXES = (b'moov', b'trak')
+
+
+def _iter_boxes(data, start, end):
+    """遍历ISO BMFF box，产出 (类型, 内容起点, 内容终点)，截断的box按已有数据处理"""
+    pos = start
+    while pos + 8 <= end:
+        size, box_type = struct.unpack('>I4s', data[pos:pos + 8])
+        header = 8
+        if size == 1 and pos + 16 <= end:
+            size = struct.unpack('>Q', data[pos + 8:pos + 16])[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            return
+        yield box_type, pos + header, min(pos + size, end)
+        pos += size
+
+
+def parse_mp4_header(data):
+    """
+    从MP4/M4S开头的字节中读取视频尺寸和时长
+    
+    Args:
+        data: 文件开头的字节
+    
+    Returns:
+        dict: {'width', 'height', 'duration'}，无法解析的字段为0
+    """
+    info = {'width': 0, 'height': 0, 'duration': 0.0}
+    
+    def walk(start, end):
+        for box_type, body, box_end in _iter_boxes(data, start, end):
+            version = data[body] if body < box_end else 0
+            if box_type in CONTAINER_BOXES:
+                walk(body, box_end)
+            elif box_type == b'mvhd' and box_end - body >= 32:
+                if version == 1:
+                    timescale, duration = struct.unpack('>IQ', data[body + 20:body + 32])
+                else:
+                    timescale, duration = struct.unpack('>II', data[body + 12:body + 20])
+                if timescale:
+                    info['duration'] = duration / timescale
+            elif box_type == b'tkhd':
+                # 宽高是tkhd末尾的两个16.16定点数，音频轨为0
+                offset = body + (88 if version == 1 else 76)
+                if offset + 8 <= box_end:
+                    width, height = struct.unpack('>II', data[offset:offset + 8])
+                    if height >> 16 > info['height']:
+                        info['width'], info['height'] = width >> 16, height >> 16
+    
+    walk(0, len(data))
+    return info
+
+
+class VariantProber:
+    """
+    码流探测器
+    
+    并发探测所有候选：HLS主播放列表读取各码流的BANDWIDTH/RESOLUTION，
+    MPD读取Representation的码率和尺寸，普通文件用Range请求读取开头64KB，
+    从Content-Range（或HEAD请求的Content-Length）得到大小，解析MP4的
+    分辨率和时长得到平均码率。
+    """
+    
+    def __init__(self, session=None, workers=8, timeout=10, proxy=None, logger=None):
+        """
+        初始化码流探测器
+        
+        Args:
+            session: requests会话，为None时从共享连接池创建
+            workers: 并发探测数
+            timeout: 单个请求的超时时间（秒）
+            proxy: 代理服务器地址（未提供session时使用）
+            logger: 日志记录器
+        """
+        self.session = session or create_session(proxy=proxy)
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.logger = logger or logging.getLogger(__name__)
+    
+    def probe(self, url, quality='best'):
+        """
+        探测单个候选
+        
+        Args:
+            url: 候选URL
+            quality: 主播放列表/MPD内部按此选择码流
+        
+        Returns:
+            dict: {'url', 'width', 'height', 'bandwidth', 'size'}，探测失败的字段为0
+        """
+        info = {'url': url, 'width': 0, 'height': height_from_url(url), 'bandwidth': 0, 'size': 0}
+        extension = url_extension(url)
+        try:
+            if extension == '.m3u8':
+                self._probe_hls(url, info, quality)
+            elif extension == '.mpd':
+                self._probe_dash(url, info, quality)
+            else:
+                self._probe_file(url, info)
+        except (requests.exceptions.RequestException, ET.ParseError, ValueError, KeyError, struct.error) as e:
+            self.logger.debug(f"码流探测失败: {url} - {e}")
+        return info
+    
+    def probe_all(self, urls, quality='best'):
+        """并发探测所有候选，结果顺序与urls一致"""
+        if len(urls) <= 1:
+            return [self.probe(url, quality) for url in urls]
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(urls))) as executor:
+            return list(executor.map(lambda url: self.probe(url, quality), urls))
+    
+    def rank(self, urls, quality='best'):
+        """
+        按画质偏好排序候选
+        
+        Args:
+            urls: 候选URL列表
+            quality: parse_quality() 的返回值
+        
+        Returns:
+            list: 排序后的URL列表（最符合的在前），相同画质保持原有顺序
+        """
+        urls = list(dict.fromkeys(urls))
+        if len(urls) <= 1:
+            return urls
+        
+        ranked = rank_variants(self.probe_all(urls, quality), quality)
+        best = ranked[0]
+        self.logger.info(
+            f"从 {len(urls)} 个候选中选择: {best['width']}x{best['height']} "
+            f"{best['bandwidth'] // 1000} kbps {best['size'] // 1024} KB - {best['url']}"
+        )
+        return [info['url'] for info in ranked]
+    
+    def _probe_hls(self, url, info, quality):
+        response = self.session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        playlist = parse_playlist(response.text, response.url)
+        variant = pick_variant(playlist.get('variants'), quality)
+        if variant:
+            info['width'], info['height'] = parse_resolution(variant['resolution'])
+            info['bandwidth'] = variant['bandwidth']
+    
+    def _probe_dash(self, url, info, quality):
+        response = self.session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        representation = pick_variant(parse_mpd(response.text, response.url)['video'], quality)
+        if representation:
+            info['width'] = representation['width']
+            info['height'] = representation['height']
+            info['bandwidth'] = representation['bandwidth']
+    
+    def _probe_file(self, url, info):
+        with self.session.get(url, headers={'Range': f'bytes=0-{HEADER_BYTES - 1}'},
+                              timeout=self.timeout, stream=True) as response:
+            if response.status_code not in (200, 206):
+                return
+            content_range = response.headers.get('Content-Range', '')
+            total = content_range.rsplit('/', 1)[1] if '/' in content_range else ''
+            if total.isdigit():
+                info['size'] = int(total)
+            elif response.status_code == 200:
+                info['size'] = int(response.headers.get('Content-Length') or 0)
+            
+            data = b''
+            for chunk in response.iter_content(chunk_size=16 * 1024):
+                data += chunk
+                if len(data) >= HEADER_BYTES:
+                    break
+        
+        if not info['size']:
+            # Range响应没有给出总大小时用HEAD请求的Content-Length
+            response = self.session.head(url, timeout=self.timeout, allow_redirects=True)
+            if response.ok:
+                info['size'] = int(response.headers.get('Content-Length') or 0)
+        
+        header = parse_mp4_header(data[:HEADER_BYTES])
+        if header['height']:
+            info['width'], info['height'] = header['width'], header['height']
+        if header['duration'] and info['size']:
+            info['bandwidth'] = int(info['size'] * 8 / header['duration'])
@@ -0,0 +1,255 @@
+"""变更版本索引 - 为任务列表和下载历史提供单调递增的版本号，支持增量查询和游标分页"""
+
+import bisect
+import configparser
+import logging
+import sqlite3
+import threading
+
+
+class ChangeIndex:
+    """
+    内存中的变更版本索引
+    
+    每次touch()为键分配新的版本号。changed_since()用二分查找定位起点，
+    只遍历版本号更大的记录，耗时与返回数量相关而与键的总数无关。
+    """
+    
+    def __init__(self):
+        self.version = 0
+        self._versions = {}
+        self._log_versions = []
+        self._log_keys = []
+        self._lock = threading.Lock()
+    
+    def touch(self, key):
+        """
+        记录键发生了变化
+        
+        Returns:
+            int: 新的版本号
+        """
+        with self._lock:
+            self.version += 1
+            self._versions[key] = self.version
+            self._log_versions.append(self.version)
+            self._log_keys.append(key)
+            # 同一个键反复更新会在日志中留下过期记录，过多时压缩
+            if len(self._log_versions) > 2 * len(self._versions) + 1024:
+                items = sorted((v, k) for k, v in self._versions.items())
+                self._log_versions = [v for v, _ in items]
+                self._log_keys = [k for _, k in items]
+            return self.version
+    
+    def version_of(self, key):
+        """键当前的版本号，没有记录时返回0"""
+        with self._lock:
+            return self._versions.get(key, 0)
+    
+    def changed_since(self, since=0, limit=None):
+        """
+        版本号大于since的键，按版本号升序
+        
+        Args:
+            since: 起始版本号（不含）
+            limit: 最多返回的数量
+        
+        Returns:
+            list: [(版本号, 键), ...]
+        """
+        changes = []
+        with self._lock:
+            start = bisect.bisect_right(self._log_versions, since)
+            for i in range(start, len(self._log_versions)):
+                version, key = self._log_versions[i], self._log_keys[i]
+                if self._versions.get(key) != version:
+                    continue
+                changes.append((version, key))
+                if limit is not None and len(changes) >= limit:
+                    break
+        return changes
+
+
+class HistoryVersions:
+    """
+    下载历史的变更版本索引
+    
+    在数据库中维护 history_versions 表（download_history 的rowid -> 版本号），
+    由触发器在插入和更新时写入，版本号列带唯一索引。删除记录时保留一条
+    带deleted标记的新版本（墓碑），增量查询能够报告删除。增量查询和游标
+    分页都按索引定位，每页的耗时不随历史记录的增长而变化。使用独立的
+    数据库连接，不影响DatabaseManager的写入。
+    """
+    
+    def __init__(self, path='data/downloads.db', logger=None):
+        """
+        初始化下载历史的变更版本索引
+        
+        Args:
+            path: 数据库路径（与DatabaseManager相同）
+            logger: 日志记录器
+        
+        Raises:
+            sqlite3.OperationalError: 数据库中没有download_history表
+        """
+        self.path = path
+        self.logger = logger or logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._create_schema()
+    
+    def _create_schema(self):
+        """创建版本表和触发器，已有记录按插入顺序补齐版本号"""
+        with self.conn:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS history_versions (
+                    record_id INTEGER PRIMARY KEY,
+                    version INTEGER NOT NULL UNIQUE,
+                    deleted INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            columns = [row[1] for row in self.conn.execute('PRAGMA table_info(history_versions)')]
+            if 'deleted' not in columns:
+                # 旧版本的表没有墓碑标记，删除触发器也需要重建
+                self.conn.execute('ALTER TABLE history_versions ADD COLUMN deleted INTEGER NOT NULL DEFAULT 0')
+                self.conn.execute('DROP TRIGGER IF EXISTS history_version_delete')
+            for event in ('INSERT', 'UPDATE'):
+                self.conn.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS history_version_{event.lower()}
+                    AFTER {event} ON download_history
+                    BEGIN
+                        INSERT OR REPLACE INTO history_versions (record_id, version)
+                        VALUES (NEW.rowid, (SELECT COALESCE(MAX(version), 0) + 1 FROM history_versions));
+                    END
+                ''')
+            self.conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS history_version_delete
+                AFTER DELETE ON download_history
+                BEGIN
+                    UPDATE history_versions
+                    SET deleted = 1, version = (SELECT MAX(version) + 1 FROM history_versions)
+                    WHERE record_id = OLD.rowid;
+                END
+            ''')
+            backfilled = self.conn.execute('''
+                INSERT OR IGNORE INTO history_versions (record_id, version)
+                SELECT h.rowid, (SELECT COALESCE(MAX(version), 0) FROM history_versions) + h.rowid
+                FROM download_history h
+                WHERE h.rowid NOT IN (SELECT record_id FROM history_versions)
+            ''').rowcount
+        if backfilled > 0:
+            self.logger.info(f"下载历史版本索引已补齐 {backfilled} 条记录")
+    
+    @staticmethod
+    def _filters(status=None, resource_type=None):
+        """过滤条件，返回 (以AND连接的条件, 参数)，没有条件时为 ('1 = 1', [])"""
+        clauses, params = [], []
+        if status:
+            clauses.append('h.status = ?')
+            params.append(status)
+        if resource_type:
+            clauses.append('h.resource_type = ?')
+            params.append(resource_type)
+        return ' AND '.join(clauses) or '1 = 1', params
+    
+    def current_version(self):
+        """当前最大版本号"""
+        with self._lock:
+            row = self.conn.execute('SELECT COALESCE(MAX(version), 0) FROM history_versions').fetchone()
+        return row[0]
+    
+    def changed_since(self, since=0, limit=100, status=None, resource_type=None):
+        """
+        版本号大于since的历史记录变化，按版本号升序
+        
+        已删除的记录，以及变化后不再符合过滤条件的记录，以墓碑的形式返回：
+        {'record_id', 'version', 'removed': True}，客户端据此从本地列表中移除。
+        
+        Args:
+            since: 起始版本号（不含）
+            limit: 最多返回的数量
+            status: 按状态过滤
+            resource_type: 按资源类型过滤
+        
+        Returns:
+            list: 记录字典列表，每条带有record_id、version和removed字段
+        """
+        match, params = self._filters(status, resource_type)
+        with self._lock:
+            rows = self.conn.execute(f'''
+                SELECT h.*, v.record_id AS record_id, v.version AS version,
+                       (v.deleted OR h.rowid IS NULL OR NOT ({match})) AS removed
+                FROM history_versions v LEFT JOIN download_history h ON h.rowid = v.record_id
+                WHERE v.version > ?
+                ORDER BY v.version
+                LIMIT ?
+            ''', params + [since, limit]).fetchall()
+        
+        records = []
+        for row in rows:
+            if row['removed']:
+                records.append({'record_id': row['record_id'], 'version': row['version'], 'removed': True})
+            else:
+                records.append(dict(row, removed=False))
+        return records
+    
+    def page(self, cursor=None, limit=100, status=None, resource_type=None):
+        """
+        按插入顺序从新到旧的游标分页
+        
+        Args:
+            cursor: 上一页返回的游标，None表示第一页
+            limit: 每页数量
+            status: 按状态过滤
+            resource_type: 按资源类型过滤
+        
+        Returns:
+            tuple: (记录字典列表, 下一页游标，没有更多时为None)
+        """
+        where, params = self._filters(status, resource_type)
+        if cursor is not None:
+            where = 'h.rowid < ? AND ' + where
+            params = [cursor] + params
+        with self._lock:
+            rows = self.conn.execute(f'''
+                SELECT h.rowid AS _cursor, h.*
+                FROM download_history h
+                WHERE {where}
+                ORDER BY h.rowid DESC
+                LIMIT ?
+            ''', params + [limit + 1]).fetchall()
+        
+        records = [dict(row) for row in rows[:limit]]
+        next_cursor = records[-1]['_cursor'] if len(rows) > limit else None
+        for record in records:
+            del record['_cursor']
+        return records, next_cursor
+    
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self.conn.close()
+
+
+def load_database_path(config_file='config.ini'):
+    """从配置文件的[database]节读取数据库路径"""
+    config = configparser.ConfigParser()
+    config.read(config_file, encoding='utf-8')
+    database = config['database'] if config.has_section('database') else {}
+    return database.get('path', 'data/downloads.db') or 'data/downloads.db'
+
+
+def load_history_versions(config_file='config.ini', logger=None):
+    """
+    打开下载历史的变更版本索引
+    
+    Returns:
+        HistoryVersions: 版本索引，数据库中还没有download_history表时返回None
+    """
+    try:
+        return HistoryVersions(load_database_path(config_file), logger=logger)
+    except sqlite3.OperationalError as e:
+        (logger or logging.getLogger(__name__)).warning(f"下载历史版本索引不可用: {e}")
+        return None